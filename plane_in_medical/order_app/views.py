@@ -2,6 +2,7 @@ from django.shortcuts import render,redirect
 from django.contrib.auth.decorators import login_required
 from pay_app.models import Order
 from route_app.models import Hospital
+from route_app.reservations import release_reservations
 from django.http import JsonResponse
 import json
 from utils.get_position import XiAnGeocoder
@@ -65,6 +66,8 @@ def delete_order(request, order_id):  # order_id 现在是字符串类型
         try:
             # 使用 order_id 字段查找订单（假设 Order 模型使用 order_id 作为主键字段）
             order = Order.objects.get(order_id=order_id)  # 修改为 order_id 字段
+            # 归还该订单预留的库存
+            release_reservations(order.order_id)
             order.delete()
             return JsonResponse({'status': 'success'})
         except Order.DoesNotExist:
@@ -80,6 +83,7 @@ def delete_all_orders(request):
             #nickname就是用户名
             nickname  = request.user.username
             orders = Order.objects.filter(nickname=nickname)
+            release_reservations(orders.values_list('order_id', flat=True))
             orders.delete()
             return JsonResponse({'status': 'success'})
         except Exception as e:
@@ -0,0 +1,218 @@
+"""
+历史订单坐标回填
+按块流式读取缺少坐标(纬度或经度为 0)的订单, 每块内按规范化地址去重:
+    - 先查地址坐标缓存(Redis / GeocodedAddress), 命中的地址不请求接口
+    - 其余地址在线程池中并发请求百度地图 API, 所有线程共享一个限速器
+    - 结果写回地址坐标缓存, 订单用 bulk_update 按块写回
+每块完成后把进度写入检查点文件(先写临时文件再原子替换), 中断后重新运行会从检查点继续。
+同样的流程也可以回填 data_pool.jsonl 这类订单 JSONL 文件。
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db.models import Q
+
+from .geocoding import cached_coordinates, normalize_address, request_coordinates, store_coordinates
+from .models import Order
+
+
+class RateLimiter:
+    """
+    线程安全的限速器: 相邻两次 acquire 之间至少间隔 1 / rate 秒
+
+    参数:
+        rate: 每秒最多请求数, None 或 0 表示不限速
+    """
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def missing_coordinates(record):
+    """
+    订单(模型实例或字典)是否缺少坐标
+    """
+    if isinstance(record, dict):
+        return not record.get('latitude') or not record.get('longitude')
+    return not record.latitude or not record.longitude
+
+
+def record_address(record):
+    """
+    订单的规范化地址
+    """
+    if isinstance(record, dict):
+        parts = (record.get('province'), record.get('city'), record.get('district'), record.get('address'))
+    else:
+        parts = (record.province, record.city, record.district, record.address)
+    return normalize_address(*parts)
+
+
+class CoordinateBackfill:
+    """
+    坐标回填
+
+    参数:
+        workers: 并发请求接口的线程数
+        rate: 每秒最多请求接口的次数
+    """
+    def __init__(self, workers=4, rate=10.0):
+        self.workers = max(1, int(workers))
+        self.limiter = RateLimiter(rate)
+        self.stats = {'records': 0, 'updated': 0, 'failed': 0, 'addresses': 0, 'requests': 0}
+
+    def resolve(self, addresses):
+        """
+        规范化地址集合 -> {地址: (纬度, 经度) 或 None}
+        缓存命中的地址直接返回, 其余地址在线程池中限速请求接口后写回缓存
+        """
+        resolved = {}
+        pending = []
+        for address in addresses:
+            coordinates = cached_coordinates(address)
+            if coordinates is None:
+                pending.append(address)
+            else:
+                resolved[address] = coordinates
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='backfill') as pool:
+                results = list(pool.map(self._request, pending))
+            for address, coordinates in zip(pending, results):
+                resolved[address] = coordinates
+                if coordinates is not None:
+                    store_coordinates(address, *coordinates)
+        self.stats['addresses'] += len(resolved)
+        self.stats['requests'] += len(pending)
+        return resolved
+
+    def _request(self, address):
+        self.limiter.acquire()
+        try:
+            return request_coordinates(address)
+        except Exception as e:
+            print(f"地址 '{address}' 地理编码失败: {e}")
+            return None
+
+    def fill(self, records):
+        """
+        为一块订单填充坐标(修改传入的模型实例或字典)
+        返回: 填充成功的订单
+        """
+        records = [record for record in records if missing_coordinates(record)]
+        addresses = {id(record): record_address(record) for record in records}
+        resolved = self.resolve(set(addresses.values()))
+        filled = []
+        for record in records:
+            coordinates = resolved.get(addresses[id(record)])
+            if coordinates is None:
+                continue
+            if isinstance(record, dict):
+                record['latitude'], record['longitude'] = coordinates
+            else:
+                record.latitude, record.longitude = coordinates
+            filled.append(record)
+        self.stats['records'] += len(records)
+        self.stats['updated'] += len(filled)
+        self.stats['failed'] += len(records) - len(filled)
+        return filled
+
+    def backfill_orders(self, checkpoint, chunk_size=500, on_chunk=None):
+        """
+        回填 order 表, 按主键顺序分块, 每块完成后更新检查点
+        """
+        state = checkpoint.load()
+        last_pk = state.get('last_pk', 0)
+        self.stats.update(state.get('stats', {}))
+        missing = Q(latitude=0) | Q(longitude=0)
+        while True:
+            chunk = list(
+                Order.objects.filter(missing, pk__gt=last_pk).order_by('pk')
+                .only('pk', 'province', 'city', 'district', 'address', 'latitude', 'longitude')[:chunk_size]
+            )
+            if not chunk:
+                return self.stats
+            filled = self.fill(chunk)
+            if filled:
+                Order.objects.bulk_update(filled, ['latitude', 'longitude'], batch_size=chunk_size)
+            last_pk = chunk[-1].pk
+            checkpoint.save({'last_pk': last_pk, 'stats': self.stats})
+            if on_chunk is not None:
+                on_chunk(dict(self.stats, last_pk=last_pk))
+
+    def backfill_jsonl(self, path, checkpoint, chunk_size=500, on_chunk=None):
+        """
+        回填订单 JSONL 文件: 结果先写入 <path>.backfill 临时文件, 全部完成后原子替换原文件
+        检查点记录已处理的行数和临时文件的写入位置, 中断后截断到该位置继续
+        """
+        output_path = f'{path}.backfill'
+        state = checkpoint.load()
+        lines_done = state.get('lines', 0)
+        offset = state.get('offset', 0)
+        self.stats.update(state.get('stats', {}))
+        if not os.path.exists(output_path):
+            lines_done, offset = 0, 0
+        with open(path, 'r', encoding='utf-8') as source, open(output_path, 'a+', encoding='utf-8') as output:
+            output.truncate(offset)
+            output.seek(offset)
+            for _ in range(lines_done):
+                source.readline()
+            while True:
+                lines = [source.readline() for _ in range(chunk_size)]
+                lines = [line for line in lines if line]
+                if not lines:
+                    break
+                records = [json.loads(line) if line.strip() else None for line in lines]
+                filled = {id(record) for record in self.fill([record for record in records if record is not None])}
+                # 没有变化的行原样写回
+                for line, record in zip(lines, records):
+                    output.write(json.dumps(record, ensure_ascii=False) + '\n' if id(record) in filled else line)
+                output.flush()
+                os.fsync(output.fileno())
+                lines_done += len(lines)
+                checkpoint.save({'lines': lines_done, 'offset': output.tell(), 'stats': self.stats})
+                if on_chunk is not None:
+                    on_chunk(dict(self.stats, lines=lines_done))
+        os.replace(output_path, path)
+        return self.stats
+
+
+class Checkpoint:
+    """
+    JSON 检查点文件, 写入时先写临时文件再原子替换, 进程中途被杀也不会留下半个文件
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def save(self, state):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,178 @@
+"""
+订单地址地理编码
+在 XiAnGeocoder 之上增加:
+    - 地址规范化: 全角转半角、去掉空白、去掉详细地址中重复填写的省市区, 同一地址的不同写法命中同一条缓存
+    - 两级持久缓存: Django 缓存(Redis) -> 数据库 GeocodedAddress -> 百度地图 API, 只有缓存都未命中时才请求接口
+    - 非阻塞模式(GEOCODE_ASYNC): 订单先以 (0, 0) 坐标入库, 后台线程补全坐标后再规划配送路径
+"""
+
+import hashlib
+import re
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+
+from route_app.assignments import assign_route
+from utils.get_position import XiAnGeocoder
+from .models import GeocodedAddress, Order
+
+_WHITESPACE = re.compile(r'\s+')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _clean(part):
+    return _WHITESPACE.sub('', unicodedata.normalize('NFKC', str(part or '')))
+
+
+def normalize_address(province, city, district, address):
+    """
+    规范化完整地址
+
+    用户常在详细地址里重复填写省市区(如 "西安市雁塔区小寨东路"), 去掉这些前缀后再拼接
+    """
+    province, city, district, address = (_clean(p) for p in (province, city, district, address))
+    for prefix in (province, city, district):
+        if prefix and address.startswith(prefix):
+            address = address[len(prefix):]
+    return f"{province}{city}{district}{address}"
+
+
+def _cache_key(normalized):
+    return 'geocode:' + hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+def coordinates_pending(order):
+    """
+    订单坐标是否还在等待后台补全
+    """
+    return order.latitude == 0 and order.longitude == 0
+
+
+def _geocoder():
+    return XiAnGeocoder(
+        api_key=getattr(settings, 'GEOCODER_API_KEY', None),
+        base_url=getattr(settings, 'GEOCODER_BASE_URL', None),
+        timeout=getattr(settings, 'GEOCODER_TIMEOUT', 5),
+    )
+
+
+def cached_coordinates(normalized):
+    """
+    只查缓存(Redis, 再查数据库), 不请求接口
+    返回: (纬度, 经度) 或 None
+    """
+    key = _cache_key(normalized)
+    try:
+        coordinates = cache.get(key)
+    except Exception as e:
+        print(f"读取地址坐标缓存失败: {e}")
+        coordinates = None
+    if coordinates is not None:
+        return tuple(coordinates)
+    row = GeocodedAddress.objects.filter(address=normalized).values_list('latitude', 'longitude').first()
+    if row is None:
+        return None
+    _remember(key, row)
+    return row
+
+
+def _remember(key, coordinates):
+    try:
+        cache.set(key, tuple(coordinates), getattr(settings, 'GEOCODE_CACHE_TIMEOUT', None))
+    except Exception as e:
+        print(f"写入地址坐标缓存失败: {e}")
+
+
+def store_coordinates(normalized, latitude, longitude):
+    """
+    把地址坐标写入数据库和 Redis
+    """
+    try:
+        with transaction.atomic():
+            GeocodedAddress.objects.get_or_create(
+                address=normalized, defaults={'latitude': latitude, 'longitude': longitude}
+            )
+    except IntegrityError:
+        # 其他进程刚写入了同一地址
+        pass
+    _remember(_cache_key(normalized), (latitude, longitude))
+
+
+def request_coordinates(normalized):
+    """
+    直接请求地理编码接口(不查缓存、不写缓存, 不访问数据库, 可在线程池中调用)
+    返回: (纬度, 经度) 保留 6 位小数, 或 None
+    """
+    # XiAnGeocoder 返回 (经度, 纬度)
+    result = _geocoder().get_coordinates(normalized)
+    if result is None:
+        return None
+    longitude, latitude = result
+    return round(latitude, 6), round(longitude, 6)
+
+
+def geocode(province, city, district, address):
+    """
+    地址 -> (纬度, 经度), 坐标保留 6 位小数; 接口查不到时返回 None
+    """
+    normalized = normalize_address(province, city, district, address)
+    coordinates = cached_coordinates(normalized)
+    if coordinates is not None:
+        return coordinates
+    coordinates = request_coordinates(normalized)
+    if coordinates is not None:
+        store_coordinates(normalized, *coordinates)
+    return coordinates
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'GEOCODE_WORKERS', 4), thread_name_prefix='geocode',
+                )
+    return _executor
+
+
+def fill_order_coordinates(order_pk):
+    """
+    为坐标待补全的订单地理编码并写回, 随后规划配送路径(开启 ROUTE_ASSIGN_ON_SUBMIT 时)
+    返回: 是否得到了坐标
+    """
+    order = Order.objects.filter(pk=order_pk).first()
+    if order is None:
+        return False
+    coordinates = geocode(order.province, order.city, order.district, order.address)
+    if coordinates is None:
+        print(f"订单 {order.order_id} 地址解析失败, 坐标保持待补全")
+        return False
+    order.latitude, order.longitude = coordinates
+    Order.objects.filter(pk=order_pk).update(latitude=order.latitude, longitude=order.longitude)
+    if getattr(settings, 'ROUTE_ASSIGN_ON_SUBMIT', False):
+        assign_route(order)
+    return True
+
+
+def _fill_in_background(order_pk):
+    try:
+        fill_order_coordinates(order_pk)
+    except Exception as e:
+        print(f"后台补全订单坐标失败: {e}")
+    finally:
+        # 后台线程的数据库连接不会随请求结束自动关闭
+        connection.close()
+
+
+def fill_order_coordinates_async(order_pk):
+    """
+    事务提交后在后台线程中补全订单坐标, 立即返回
+    """
+    transaction.on_commit(lambda: _get_executor().submit(_fill_in_background, order_pk))
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.3 on 2026-10-18 06:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pay_app", "0003_alter_order_order_time"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GeocodedAddress",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("address", models.CharField(max_length=255, unique=True)),
+                ("latitude", models.FloatField()),
+                ("longitude", models.FloatField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name": "地址坐标",
+                "verbose_name_plural": "地址坐标",
+                "db_table": "geocoded_address",
+            },
+        ),
+    ]
@@ -26,4 +26,20 @@ class Order(models.Model):
     class Meta:
         verbose_name = "订单"
         verbose_name_plural = "订单"
-        db_table = "order"
\ No newline at end of file
+        db_table = "order"
+
+#地址 -> 经纬度的持久缓存, 相同地址不再重复请求百度地图 API
+class GeocodedAddress(models.Model):
+    #规范化后的完整地址(省市区 + 详细地址)
+    address = models.CharField(max_length=255, unique=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        return self.address
+
+    class Meta:
+        verbose_name = "地址坐标"
+        verbose_name_plural = "地址坐标"
+        db_table = "geocoded_address"
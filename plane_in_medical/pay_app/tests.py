@@ -1,3 +1,152 @@
-from django.test import TestCase
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from django.test import TestCase, override_settings
 
 # Create your tests here.
+
+
+class StubGeocoderHandler(BaseHTTPRequestHandler):
+    """
+    本地桩服务, 按百度地图地理编码接口的格式返回固定坐标, 并记录收到的地址
+    """
+    def do_GET(self):
+        address = parse_qs(urlparse(self.path).query).get('address', [''])[0]
+        self.server.addresses.append(address)
+        if '查无此地' in address:
+            body = {'status': 1}
+        else:
+            body = {'status': 0, 'result': {'location': {'lng': 108.9401234567, 'lat': 34.2409876543}}}
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class GeocodingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubGeocoderHandler)
+        cls.server.addresses = []
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.stub_settings = override_settings(
+            GEOCODER_BASE_URL=f'http://127.0.0.1:{cls.server.server_port}/geocoding/v3/',
+            ROUTE_ASSIGN_ON_SUBMIT=False,
+        )
+        cls.stub_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub_settings.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.server.addresses.clear()
+
+    def test_geocode_is_cached_by_normalized_address(self):
+        from django.core.cache import cache
+        from .geocoding import geocode, normalize_address
+        from .models import GeocodedAddress
+
+        self.assertEqual(
+            normalize_address('陕西省', '西安市', '雁塔区', ' 西安市雁塔区 小寨东路１号'),
+            '陕西省西安市雁塔区小寨东路1号',
+        )
+        self.assertEqual(geocode('陕西省', '西安市', '雁塔区', '小寨东路1号'), (34.240988, 108.940123))
+        # 同一地址的不同写法、以及 Redis 被清空后都不再请求接口
+        self.assertEqual(geocode('陕西省', '西安市', '雁塔区', '西安市雁塔区 小寨东路１号'), (34.240988, 108.940123))
+        cache.clear()
+        self.assertEqual(geocode('陕西省', '西安市', '雁塔区', '小寨东路1号'), (34.240988, 108.940123))
+        self.assertEqual(self.server.addresses, ['陕西省西安市雁塔区小寨东路1号'])
+        self.assertEqual(GeocodedAddress.objects.count(), 1)
+
+        self.assertIsNone(geocode('陕西省', '西安市', '雁塔区', '查无此地'))
+        self.assertEqual(GeocodedAddress.objects.count(), 1)
+
+    def test_submit_order_stores_order_before_geocoding(self):
+        from django.contrib.auth import get_user_model
+        from .geocoding import fill_order_coordinates
+        from .models import Order
+
+        user = get_user_model().objects.create_user(username='geo', email='geo@example.com', password='pw')
+        self.client.force_login(user)
+        order_data = {
+            'name': '测试', 'phone': '1', 'province': '陕西省', 'city': '西安市', 'district': '碑林区',
+            'address': '友谊西路1号', 'notes': '', 'paymentMethod': 'alipay', 'items': [],
+        }
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = self.client.post('/submit_order/', {'order_data': json.dumps(order_data)})
+        self.assertEqual(response.json()['status'], 'success')
+        order = Order.objects.get(order_id=response.json()['order_id'])
+        # 请求内没有访问地理编码接口, 坐标由后台任务补全
+        self.assertEqual((order.latitude, order.longitude), (0.0, 0.0))
+        self.assertEqual(self.server.addresses, [])
+        self.assertEqual(len(callbacks), 1)
+
+        self.assertTrue(fill_order_coordinates(order.pk))
+        order.refresh_from_db()
+        self.assertEqual((order.latitude, order.longitude), (34.240988, 108.940123))
+
+    def test_backfill_dedupes_addresses_and_resumes_from_checkpoint(self):
+        import os
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+        from django.utils import timezone
+        from .backfill import Checkpoint
+        from .models import Order
+
+        addresses = ['小寨东路1号', ' 小寨东路１号', '西安市雁塔区小寨东路1号', '查无此地', '长安路2号', '长安路2号']
+        orders = [
+            Order.objects.create(
+                order_id=f'backfill-{i}', name='测试', phone='1', address=address, province='陕西省', city='西安市',
+                district='雁塔区', paymentMethod='', items=[], order_time=timezone.now(),
+            )
+            for i, address in enumerate(addresses)
+        ]
+        tmp_dir = tempfile.mkdtemp()
+        checkpoint_path = os.path.join(tmp_dir, 'checkpoint.json')
+        # 模拟上次运行处理完前两单后中断
+        Checkpoint(checkpoint_path).save({'last_pk': orders[1].pk, 'stats': {}})
+        call_command('backfill_coordinates', f'--checkpoint={checkpoint_path}', '--chunk-size=2', '--rate=0',
+                     stdout=StringIO())
+        coordinates = dict(Order.objects.values_list('order_id', 'latitude'))
+        self.assertEqual([coordinates[f'backfill-{i}'] for i in range(6)], [0.0, 0.0, 34.240988, 0.0, 34.240988, 34.240988])
+        # 每个不同地址只请求一次接口, 完成后删除检查点
+        self.assertEqual(sorted(self.server.addresses), ['陕西省西安市雁塔区小寨东路1号', '陕西省西安市雁塔区查无此地', '陕西省西安市雁塔区长安路2号'])
+        self.assertFalse(os.path.exists(checkpoint_path))
+
+        # 再次运行从头扫描, 前两单的地址已在缓存中, 不再请求接口
+        call_command('backfill_coordinates', f'--checkpoint={checkpoint_path}', '--rate=0', stdout=StringIO())
+        self.assertEqual(Order.objects.filter(latitude=0).count(), 1)
+        self.assertEqual(len(self.server.addresses), 4)
+
+    def test_backfill_jsonl_keeps_complete_lines(self):
+        import os
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+
+        path = os.path.join(tempfile.mkdtemp(), 'orders.jsonl')
+        complete = '{"order_id": "1", "province": "陕西省", "city": "西安市", "district": "未央区", "address": "未央路88号", "latitude": 34.307667, "longitude": 108.952785}\n'
+        missing = {'order_id': '2', 'province': '陕西省', 'city': '西安市', 'district': '未央区', 'address': '凤城十二路69号', 'latitude': 0.0, 'longitude': 0.0}
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(complete + json.dumps(missing, ensure_ascii=False) + '\n')
+        call_command('backfill_coordinates', f'--jsonl={path}', '--rate=0', stdout=StringIO())
+        with open(path, encoding='utf-8') as f:
+            lines = f.readlines()
+        self.assertEqual(lines[0], complete)
+        self.assertEqual(json.loads(lines[1]), dict(missing, latitude=34.240988, longitude=108.940123))
+        self.assertEqual(sorted(os.listdir(os.path.dirname(path))), ['orders.jsonl'])
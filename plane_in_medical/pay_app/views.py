@@ -9,7 +9,10 @@ import time
 from .models import Order
 from utils.shopping_cart import ShoppingCartService
 
-from utils.get_position import XiAnGeocoder
+from .geocoding import cached_coordinates, fill_order_coordinates_async, geocode, normalize_address
+from route_app.reservations import consume_reservations
+from route_app.assignments import assign_route
+from django.conf import settings
 @login_required
 def submit_order(request):
     if request.method == 'POST':
@@ -24,14 +27,15 @@ def submit_order(request):
             # 确保时间字段是正确的字符串格式或者使用 datetime 对象
             from datetime import datetime
             current_time = datetime.now()
-            # 构建完整地址
-            full_address = f"{order_data['province']}{order_data['city']}{order_data['district']}{order_data['address']}"
-            #根据full_address获取经纬度
-            geocoder = XiAnGeocoder()
-            latitude, longitude = geocoder.get_coordinates(full_address)
-            #经纬度分别保留6位小数
-            latitude = round(latitude, 6)
-            longitude = round(longitude, 6)
+            address_parts = (order_data['province'], order_data['city'], order_data['district'], order_data['address'])
+            #根据地址获取经纬度(已保留6位小数): 先查地址坐标缓存, 非阻塞模式下未命中时先以 (0, 0) 入库, 后台补全
+            if getattr(settings, 'GEOCODE_ASYNC', True):
+                coordinates = cached_coordinates(normalize_address(*address_parts))
+            else:
+                coordinates = geocode(*address_parts)
+                if coordinates is None:
+                    return JsonResponse({'status': 'error', 'message': '无法解析收货地址'})
+            latitude, longitude = coordinates or (0.0, 0.0)
             #创建订单
             order = Order.objects.create(
                 order_id=order_id, 
@@ -40,8 +44,8 @@ def submit_order(request):
                 address=order_data['address'], 
                 city=order_data['city'],
                 district=order_data['district'], 
-                longitude=latitude,
-                latitude=longitude,
+                longitude=longitude,
+                latitude=latitude,
                 province=order_data['province'],
                 notes=order_data['notes'], 
                 paymentMethod=order_data['paymentMethod'],
@@ -49,6 +53,15 @@ def submit_order(request):
                 nickname=nickname,
                 order_time=current_time  
             )
+            if coordinates is None:
+                #坐标由后台补全, 补全后再规划配送路径
+                fill_order_coordinates_async(order.pk)
+            #配送路径默认由后台派单(dispatch_orders)按批决策; 开启 ROUTE_ASSIGN_ON_SUBMIT 时下单时决策一次并保存, 失败时同样由后台派单补做
+            elif getattr(settings, 'ROUTE_ASSIGN_ON_SUBMIT', False):
+                try:
+                    assign_route(order)
+                except Exception as e:
+                    print("配送路径规划失败：", str(e))
             return JsonResponse({'status': 'success', 'order_id': order.order_id})
         except Exception as e:
             print("错误信息：", str(e))
@@ -75,6 +88,9 @@ def execute_success(request):
                 #修改status为已完成
                 order.status = '已完成'
                 order.save()
+                #配送完成, 预留的库存正式出库; 预留已超时释放(订单等待重新派单)时没有可以出库的记录
+                if not consume_reservations(order.order_id) and getattr(settings, 'ROUTE_RESERVATIONS_ENABLED', True):
+                    print(f"订单 {order.order_id} 没有可出库的库存预留")
                 return JsonResponse({'status': 'ok'})
         except Order.DoesNotExist:
             #订单不存在,返回错误信息
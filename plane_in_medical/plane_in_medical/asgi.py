@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "plane_in_medical.settings")
 
 application = get_asgi_application()
+
+# 只在 web 服务进程(gunicorn / uwsgi / runserver 等加载 application 的进程)中预热路径决策服务
+from route_app.routing_service import preload_routing_service  # noqa: E402
+
+preload_routing_service()
@@ -168,4 +168,56 @@ LANGUAGES = [
     ('zh-hans', '简体中文'),
 ]
 #配置翻译文件目录
-LOCALE_PATHS = [os.path.join(BASE_DIR, 'locale')]
\ No newline at end of file
+LOCALE_PATHS = [os.path.join(BASE_DIR, 'locale')]
+
+#路径决策服务: web 服务进程(wsgi/asgi)启动时是否预热加载强化学习模型, 其他进程总是懒加载
+ROUTE_SERVICE_EAGER_LOAD = True
+#DQN 推理微批处理: 并发请求在时间窗口内合并为一次批量前向计算
+ROUTE_BATCHING_ENABLED = True
+#单批最大请求数
+ROUTE_BATCH_MAX_SIZE = 32
+#攒批时间窗口(毫秒)
+ROUTE_BATCH_WINDOW_MS = 2.0
+#用户位置 -> 医院距离缓存最多保存的位置数, 0 表示关闭
+ROUTE_DISTANCE_CACHE_SIZE = 4096
+#距离缓存的网格边长(度), None 表示按精确坐标缓存(与训练时的距离特征逐位一致)
+ROUTE_DISTANCE_CACHE_CELL_DEGREES = None
+#路径决策服务使用数据库 HospitalInventory 中的实时库存(hospitals.json 只作为冷启动快照)
+ROUTE_LIVE_INVENTORY = True
+#订单派单后在选中医院预留库存
+ROUTE_RESERVATIONS_ENABLED = True
+#库存预留超时时间(秒), 超时未出库的预留由 release_expired_reservations 命令释放
+ROUTE_RESERVATION_TTL_SECONDS = 1800
+#选中的医院预留库存失败(库存刚被其他订单取走)时按更新后的库存重新决策的次数, 仍然失败时订单留在派单队列中
+ROUTE_RESERVATION_RETRIES = 2
+#路径决策缓存的有效期(秒), 库存变化时自动失效, 0 表示不缓存
+ROUTE_DECISION_CACHE_TIMEOUT = 300
+#路径决策模型检查点, None 表示 data/prepared/dqn_full_checkpoint.pth
+ROUTE_MODEL_PATH = None
+#推理使用的模型格式: numpy(纯 NumPy 前向计算, web 进程不导入 torch) / eager(原始模块) /
+#script(TorchScript) / int8(动态量化的 TorchScript), 用 rl_components/export.py 导出, 没有导出文件时启动时在内存中转换
+ROUTE_MODEL_FORMAT = 'numpy'
+#torch 格式(eager / script / int8)推理时每个 web 进程的 torch 线程数, None 表示沿用 torch 默认(按 CPU 核数); numpy 格式不导入 torch
+ROUTE_TORCH_NUM_THREADS = 1
+#检查模型检查点是否更新的间隔(秒), 更新后在后台加载校验并替换, 0 表示只在管理员手动触发时重载
+ROUTE_MODEL_WATCH_INTERVAL = 10
+#影子评估的候选模型检查点, 候选模型在后台对线上状态计算动作并记录与主模型的分歧, None 表示关闭
+ROUTE_SHADOW_MODEL_PATH = None
+#影子评估队列容量, 满时丢弃新的状态(不会阻塞请求)
+ROUTE_SHADOW_QUEUE_SIZE = 1024
+#影子评估分歧日志(JSONL), None 表示只在 route_stats 中显示最近的分歧
+ROUTE_SHADOW_LOG_PATH = os.path.join(BASE_DIR, 'logs', 'shadow_divergence.jsonl')
+#配送路径默认由后台派单进程(python manage.py dispatch_orders)按批决策并预留库存, 下单请求中不做决策;
+#开启后下单时同步决策并保存(没有运行派单进程的部署使用), 跟踪页面在两种情况下都只读取已保存的路径
+ROUTE_ASSIGN_ON_SUBMIT = False
+#百度地图地理编码接口的密钥和地址, None 表示使用 XiAnGeocoder 中的默认值(测试时可指向本地桩服务)
+GEOCODER_API_KEY = None
+GEOCODER_BASE_URL = None
+#地理编码请求超时时间(秒)
+GEOCODER_TIMEOUT = 5
+#非阻塞地理编码: 地址坐标缓存未命中时订单先入库, 由后台线程补全坐标
+GEOCODE_ASYNC = True
+#后台地理编码线程数
+GEOCODE_WORKERS = 4
+#地址坐标在 Redis 中的缓存时间(秒), None 表示永久(数据库中始终保留一份)
+GEOCODE_CACHE_TIMEOUT = None
@@ -1,3 +1,8 @@
 from django.contrib import admin
-
+from .models import Hospital, HospitalInventory, RouteAssignment, StockReservation
 # Register your models here.
+
+admin.site.register(Hospital)
+admin.site.register(HospitalInventory)
+admin.site.register(StockReservation)
+admin.site.register(RouteAssignment)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class RouteAppConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "route_app"
+
+    def ready(self):
+        #注册医院数据变更的信号处理, 后台增删改医院时同步决策服务的空间索引
+        from . import signals  # noqa: F401
+        #路径决策服务的预热只在 web 服务进程中进行(见 wsgi.py / asgi.py 中的 preload_routing_service),
+        #migrate、shell、管理命令和测试等进程在第一次决策时才懒加载模型
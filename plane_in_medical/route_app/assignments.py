@@ -0,0 +1,142 @@
+"""
+订单配送路径
+路径决策只在下单时(或由后台任务)执行一次, 结果保存到 RouteAssignment 并同时预留库存;
+跟踪页面只读取保存的结果, 不会因为库存变化而每次刷新得到不同的答案。
+预留和保存在同一个事务内: 选中的医院预留不到库存时不会保存指向它的路径。
+调度员可以通过 replan_route 显式重新规划: 先归还原来的预留, 再决策并预留。
+"""
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import RouteAssignment
+from .reservations import release_reservations, reserve_stock
+from .routing_service import Decision, routing_service
+
+
+def decision_from_assignment(assignment):
+    """
+    把保存的配送路径还原为 Decision, 供页面渲染使用
+    """
+    hospital = None
+    if assignment.hospital_name:
+        hospital = {
+            'name': assignment.hospital_name,
+            'latitude': assignment.hospital_latitude,
+            'longitude': assignment.hospital_longitude,
+        }
+    return Decision(
+        action_index=assignment.action_index,
+        action=assignment.action,
+        hospital=hospital,
+        reasons=list(assignment.reasons or []),
+        message=assignment.message,
+        distance=assignment.distance,
+        inventory_match=assignment.inventory_match,
+    )
+
+
+def _assignment_fields(decision):
+    hospital = decision.hospital or {}
+    return {
+        'action_index': int(decision.action_index),
+        'action': decision.action,
+        'hospital_name': hospital.get('name') or '',
+        'hospital_latitude': hospital.get('latitude'),
+        'hospital_longitude': hospital.get('longitude'),
+        'distance': float(decision.distance or 0),
+        'inventory_match': float(decision.inventory_match or 0),
+        'reasons': list(decision.reasons or []),
+        'message': decision.message or '',
+    }
+
+
+def build_assignment(order, decision):
+    """
+    由决策构造(未保存的) RouteAssignment
+    """
+    return RouteAssignment(order=order, **_assignment_fields(decision))
+
+
+def reservation_hospital(assignment):
+    """
+    需要预留库存的医院名称, 不需要预留(等待补货、拆单、未开启预留)时返回 None
+    """
+    if not getattr(settings, 'ROUTE_RESERVATIONS_ENABLED', True) or not assignment.hospital_name:
+        return None
+    if assignment.action not in ('select_hospital', 'redirect_alternative'):
+        return None
+    return assignment.hospital_name
+
+
+def _decide_and_reserve(order, save):
+    """
+    决策、在选中的医院预留库存并保存配送路径, 预留和保存在同一个事务内(保存失败时预留随之回滚)
+
+    预留失败(其他订单刚刚取走了这家医院最后的库存)时不保存, 按更新后的库存重新决策
+    (对方的扣减在事务提交后已经同步给路径决策服务), 最多重试 ROUTE_RESERVATION_RETRIES 次
+
+    参数:
+        save: 在事务内按 Decision 保存配送路径, 返回 RouteAssignment
+    返回:
+        RouteAssignment, 重试用完仍预留失败时为 None
+    """
+    for _ in range(getattr(settings, 'ROUTE_RESERVATION_RETRIES', 2) + 1):
+        decision = routing_service.decide(order)
+        hospital_name = reservation_hospital(build_assignment(order, decision))
+        with transaction.atomic():
+            if hospital_name and not reserve_stock(order.order_id, hospital_name, order.items):
+                print(f"订单 {order.order_id} 在 {hospital_name} 库存预留失败, 按更新后的库存重新决策")
+                continue
+            return save(decision)
+    return None
+
+
+def assign_route(order):
+    """
+    返回订单已保存的配送路径, 还没有时决策一次并保存
+
+    参数:
+        order: Order 实例, 建议用 select_related('route_assignment') 查询, 已有路径时不再访问数据库
+    返回:
+        RouteAssignment, 反复预留失败时为 None(不保存路径, 订单留在派单队列中由后台派单重新决策)
+    """
+    try:
+        return order.route_assignment
+    except RouteAssignment.DoesNotExist:
+        pass
+    try:
+        return _decide_and_reserve(order, lambda decision: RouteAssignment.objects.create(
+            order=order, **_assignment_fields(decision)
+        ))
+    except IntegrityError:
+        # 并发请求已经为该订单保存了路径, 以先保存的为准(本次的预留随事务回滚)
+        return RouteAssignment.objects.get(order=order)
+
+
+def replan_route(order):
+    """
+    重新规划订单的配送路径(调度员操作)
+    先归还该订单原来的库存预留, 再按当前库存决策, 覆盖保存并重新预留
+
+    返回:
+        RouteAssignment, 反复预留失败时为 None(删除原来的路径, 订单回到派单队列)
+    """
+    release_reservations(order.order_id)
+
+    def save(decision):
+        fields = _assignment_fields(decision)
+        saved, _ = RouteAssignment.objects.update_or_create(
+            order=order,
+            defaults=dict(fields, replans=F('replans') + 1),
+            create_defaults=fields,
+        )
+        saved.refresh_from_db()
+        return saved
+
+    assignment = _decide_and_reserve(order, save)
+    if assignment is None:
+        # 原来的预留已经归还, 不能继续指向原来的医院
+        RouteAssignment.objects.filter(order=order).delete()
+    return assignment
@@ -0,0 +1,159 @@
+"""
+路径决策缓存
+同一位置、同一购物篮在库存不变时决策结果相同, 把决策结果放进 Django 缓存(Redis),
+刷新配送跟踪页面时只需要一次 get_many, 不需要重新构建状态和做前向计算。
+
+缓存键 = 订单坐标 + 规范化的购物篮哈希。一次决策只依赖:
+    - 购物篮中药品在所有医院的库存(匹配度、前 5 家医院的选择、重定向目标): 每种药品一个版本号,
+      库存变化只递增涉及的药品的版本号; 版本号的键由购物篮直接得出, 与缓存项在同一次 get_many 中读出
+    - 状态向量中前 5 家医院的库存总量: 缓存项记录写入时的数值, 读取时与本进程已同步的库存比较
+    - 医院坐标和模型: 全局版本号
+版本号保存在同一个缓存中, 多个进程共享; 不相关的库存变化不会使缓存项失效。
+缓存值只保存动作和医院名称, 读取后用当前的医院数据重建完整的决策。
+"""
+
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+# 全局版本号: 医院增删改、整体重新加载库存、替换模型时递增, 使所有缓存项失效
+VERSION_KEY = 'route_decision:inventory_version'
+# 单种药品的库存版本号(后接药品名称的哈希)
+MEDICINE_VERSION_KEY = 'route_decision:medicine:{}'
+
+
+def _timeout():
+    return getattr(settings, 'ROUTE_DECISION_CACHE_TIMEOUT', 300)
+
+
+def is_enabled():
+    return bool(_timeout())
+
+
+def basket_digest(items):
+    """
+    购物篮的规范化哈希: 与药品顺序无关, 重复条目保留(状态特征中的药品种数包含重复条目)
+    """
+    canonical = sorted(
+        [str(item.get('name', '')), str(item.get('id', '')), str(item.get('quantity', ''))]
+        for item in items or []
+    )
+    return hashlib.sha1(json.dumps(canonical, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def decision_key(user_request):
+    """
+    缓存键: 订单下单时坐标已保留 6 位小数, 直接使用精确坐标, 保证命中的决策与重新计算的完全一致
+    """
+    return 'route_decision:{!r},{!r}:{}'.format(
+        float(user_request.get('latitude', 0) or 0),
+        float(user_request.get('longitude', 0) or 0),
+        basket_digest(user_request.get('items')),
+    )
+
+
+def name_digest(name):
+    """
+    医院或药品名称的哈希, 名称中的空格和中文不适合直接作为缓存键(memcached 会拒绝)
+    """
+    return hashlib.sha1(str(name).encode('utf-8')).hexdigest()
+
+
+def medicine_version_key(name):
+    return MEDICINE_VERSION_KEY.format(name_digest(name))
+
+
+def dependency_keys(user_request):
+    """
+    决策依赖的版本号的缓存键: 全局版本号 + 购物篮中各药品的版本号
+    """
+    names = {item.get('name') for item in user_request.get('items') or [] if item.get('name')}
+    return [VERSION_KEY] + [medicine_version_key(name) for name in sorted(names)]
+
+
+def get_decision(user_request, *extra_keys):
+    """
+    读取缓存的决策: 缓存项、依赖的版本号和 extra_keys 在同一次 get_many 中读出
+
+    返回:
+        (缓存项, extra_keys 的值), 未命中或依赖的版本号已变化时缓存项为 None;
+        缓存项中 decision 为决策字典, totals 为 {医院名称: 写入时的库存总量}, 由调用方与当前库存比较
+    """
+    key = decision_key(user_request)
+    keys = dependency_keys(user_request)
+    try:
+        values = cache.get_many([key, *keys, *extra_keys])
+    except Exception as e:
+        print(f"读取路径决策缓存失败: {e}")
+        return None, {}
+    extras = {k: values[k] for k in extra_keys if k in values}
+    entry = values.get(key)
+    # 被缓存淘汰的版本号读出为 None, 只有写入时同样不存在才算一致
+    if entry is None or entry['versions'] != {k: values.get(k) for k in keys}:
+        return None, extras
+    return entry, extras
+
+
+def set_decision(user_request, decision, totals, expected):
+    """
+    写入决策, 记录它所依赖的版本号
+
+    参数:
+        decision: 决策字典(只包含重建决策需要的字段)
+        totals: {医院名称: 库存总量}, 状态向量中前 5 家医院在计算时的库存总量
+        expected: {缓存键: 值}, 计算决策时使用的库存对应的库存水位号;
+            与当前值不一致说明计算期间或计算之前有库存变化没有同步到本进程, 这时不写入,
+            避免用旧库存算出的决策配上新的版本号
+    返回: 是否写入
+    """
+    if any(value is None for value in expected.values()):
+        return False
+    keys = dependency_keys(user_request)
+    try:
+        values = cache.get_many(keys + list(expected))
+        if any(values.get(k) != v for k, v in expected.items()):
+            return False
+        entry = {'versions': {k: values.get(k) for k in keys}, 'totals': dict(totals), 'decision': decision}
+        cache.set(decision_key(user_request), entry, _timeout())
+    except Exception as e:
+        print(f"写入路径决策缓存失败: {e}")
+        return False
+    return True
+
+
+def _initial_version():
+    # 版本号被缓存淘汰后从当前毫秒时间戳重新开始, 不会与淘汰前缓存项中的版本号重合
+    return int(time.time() * 1000)
+
+
+def _bump(key):
+    cache.add(key, _initial_version(), None)
+    cache.incr(key)
+
+
+def bump_version():
+    """
+    医院或模型发生变化: 递增全局版本号, 使所有已缓存的决策失效
+    """
+    try:
+        _bump(VERSION_KEY)
+    except Exception as e:
+        print(f"更新路径决策缓存版本号失败: {e}")
+
+
+def bump_stock_versions(pairs):
+    """
+    库存发生变化: 递增涉及的药品的版本号, 只使购物篮中有这些药品的决策失效
+    (其他决策只在这些医院是它的前 5 家医院且库存总量变化时失效, 读取时按数值比较)
+
+    参数:
+        pairs: [(医院名称, 药品名称), ...]
+    """
+    try:
+        for key in sorted({medicine_version_key(m) for _, m in pairs}):
+            _bump(key)
+    except Exception as e:
+        print(f"更新路径决策缓存版本号失败: {e}")
@@ -0,0 +1,139 @@
+"""
+后台派单
+从还没有配送路径的订单中按批取出, 一次批量前向计算完成整批决策,
+再用一次批量 INSERT 保存 RouteAssignment、一次批量预留库存。
+整批决策基于同一份库存, 几个订单可能选中同一家医院的最后几件库存: 预留失败的订单按预留后的库存重新决策,
+重试 ROUTE_RESERVATION_RETRIES 次仍然失败时删除它们的路径, 放回队列等待下一批。
+每批的统计(队列深度、批大小、各阶段耗时)写入 Django 缓存, 由 route_stats 展示。
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from pay_app.models import Order
+from .assignments import build_assignment, reservation_hospital
+from .models import RouteAssignment
+from .reservations import reserve_stock_bulk
+from .routing_service import routing_service
+
+# 派单统计的缓存键
+STATS_KEY = 'route_dispatch:stats'
+
+
+def pending_orders():
+    """
+    还没有配送路径的订单, 按下单先后排序(坐标还在等待后台补全的订单除外)
+    """
+    return Order.objects.filter(route_assignment__isnull=True).exclude(latitude=0, longitude=0).order_by('id')
+
+
+def dispatch_stats():
+    """
+    最近一次发布的派单统计, 派单进程没有运行过时返回 None
+    """
+    try:
+        return cache.get(STATS_KEY)
+    except Exception as e:
+        print(f"读取派单统计失败: {e}")
+        return None
+
+
+class OrderDispatcher:
+    """
+    批量派单
+
+    参数:
+        batch_size: 每批最多处理的订单数
+    """
+    def __init__(self, batch_size=64):
+        if batch_size < 1:
+            raise ValueError('batch_size 必须大于 0')
+        self.batch_size = int(batch_size)
+        self.totals = {'batches': 0, 'orders': 0, 'reserved': 0, 'requeued': 0}
+
+    def dispatch_batch(self):
+        """
+        处理一批订单
+        返回: 本批统计, 没有待派单的订单时 batch_size 为 0
+        """
+        started = time.perf_counter()
+        orders = list(pending_orders()[:self.batch_size])
+        fetched = time.perf_counter()
+        elapsed = {'decide': 0.0, 'save': 0.0, 'reserve': 0.0}
+        reserved_orders = set()
+        redecided = 0
+        remaining = orders
+        for attempt in range(getattr(settings, 'ROUTE_RESERVATION_RETRIES', 2) + 1):
+            began = time.perf_counter()
+            decisions = routing_service.decide_many(remaining)
+            decided = time.perf_counter()
+            if attempt:
+                # 上一轮预留失败的路径换成按新库存做出的决策
+                redecided += len(remaining)
+                RouteAssignment.objects.filter(order_id__in=[order.pk for order in remaining]).delete()
+            # 页面或下单流程可能已经为其中的订单保存了路径, 以先保存的为准
+            RouteAssignment.objects.bulk_create(
+                [build_assignment(order, decision) for order, decision in zip(remaining, decisions)],
+                ignore_conflicts=True,
+            )
+            saved = time.perf_counter()
+            reserved, remaining = self._reserve(remaining)
+            reserved_orders |= reserved
+            finished = time.perf_counter()
+            elapsed['decide'] += decided - began
+            elapsed['save'] += saved - decided
+            elapsed['reserve'] += finished - saved
+            if not remaining:
+                break
+        else:
+            # 重试用完仍然预留失败: 不保留指向库存不足医院的路径, 放回队列
+            RouteAssignment.objects.filter(order_id__in=[order.pk for order in remaining]).delete()
+        finished = time.perf_counter()
+
+        self.totals['batches'] += bool(orders)
+        self.totals['orders'] += len(orders) - len(remaining)
+        self.totals['reserved'] += len(reserved_orders)
+        self.totals['requeued'] += len(remaining)
+        stats = {
+            'batch_size': len(orders),
+            'reserved': len(reserved_orders),
+            'redecided': redecided,
+            'requeued': len(remaining),
+            'queue_depth': pending_orders().count(),
+            'fetch_ms': (fetched - started) * 1000.0,
+            'decide_ms': elapsed['decide'] * 1000.0,
+            'save_ms': elapsed['save'] * 1000.0,
+            'reserve_ms': elapsed['reserve'] * 1000.0,
+            'batch_latency_ms': (finished - started) * 1000.0,
+            'totals': dict(self.totals),
+            'updated_at': timezone.now().isoformat(),
+        }
+        self._publish(stats)
+        return stats
+
+    def _reserve(self, orders):
+        """
+        按数据库中保存的路径为整批订单预留库存
+        返回: (预留成功的订单号集合, 需要预留但预留失败的订单列表)
+        """
+        if not orders:
+            return set(), []
+        by_pk = {order.pk: order for order in orders}
+        requests = []
+        for assignment in RouteAssignment.objects.filter(order_id__in=by_pk):
+            hospital_name = reservation_hospital(assignment)
+            if hospital_name:
+                order = by_pk[assignment.order_id]
+                requests.append((order.order_id, hospital_name, order.items))
+        reserved = reserve_stock_bulk(requests)
+        failed = {order_id for order_id, _, _ in requests} - reserved
+        return reserved, [order for order in orders if order.order_id in failed]
+
+    def _publish(self, stats):
+        try:
+            cache.set(STATS_KEY, stats, None)
+        except Exception as e:
+            print(f"发布派单统计失败: {e}")
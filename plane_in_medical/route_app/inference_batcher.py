@@ -0,0 +1,113 @@
+"""
+DQN 推理微批处理
+把并发请求的状态向量在很短的时间窗口内攒成一批, 只做一次批量前向计算,
+再把每一行的 argmax 动作分发回各自等待的调用方。
+"""
+
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    """
+    微批处理队列
+
+    参数:
+        predict_fn: 批量推理函数, 输入 (B, state_size) 的 float32 数组, 返回 (B, action_size) 的 Q 值
+        max_batch_size: 单批最大行数, 攒满立即执行
+        flush_window_ms: 从第一条请求入队开始最多等待的毫秒数
+    """
+    def __init__(self, predict_fn, max_batch_size=32, flush_window_ms=2.0):
+        if max_batch_size < 1:
+            raise ValueError('max_batch_size 必须大于 0')
+        self.predict_fn = predict_fn
+        self.max_batch_size = int(max_batch_size)
+        self.flush_window = max(0.0, float(flush_window_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name='route-micro-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(self, state):
+        """
+        提交一个状态向量, 阻塞直到所在批次完成, 返回 (动作索引, 该行 Q 值)
+        """
+        return self.submit_async(state).result()
+
+    def submit_async(self, state):
+        """
+        提交一个状态向量, 返回 Future, 结果为 (动作索引, 该行 Q 值)
+        """
+        if self._closed:
+            raise RuntimeError('MicroBatcher 已关闭')
+        future = Future()
+        self._queue.put((np.asarray(state, dtype=np.float32), future))
+        return future
+
+    def stats(self):
+        """
+        返回已完成批次的统计信息(批大小分布、平均批大小等)
+        """
+        with self._stats_lock:
+            sizes = dict(sorted(self._batch_sizes.items()))
+        batches = sum(sizes.values())
+        requests = sum(size * count for size, count in sizes.items())
+        return {
+            'max_batch_size': self.max_batch_size,
+            'flush_window_ms': self.flush_window * 1000.0,
+            'batches': batches,
+            'requests': requests,
+            'mean_batch_size': (requests / batches) if batches else 0.0,
+            'batch_size_histogram': sizes,
+        }
+
+    def close(self):
+        """
+        停止后台线程, 已入队的请求会先处理完
+        """
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.flush_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # 关闭信号放回队列, 当前批次处理完后再退出
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            futures = [future for _, future in batch]
+            try:
+                states = np.stack([state for state, _ in batch])
+                q_values = np.asarray(self.predict_fn(states))
+                actions = np.argmax(q_values, axis=1)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            with self._stats_lock:
+                self._batch_sizes[len(batch)] += 1
+            for i, future in enumerate(futures):
+                future.set_result((int(actions[i]), q_values[i]))
@@ -0,0 +1,102 @@
+"""
+多进程之间的库存同步
+每个进程的路径决策服务在内存中保存一份库存, 而库存的写入(后台编辑、库存预留、释放超时预留)
+可能发生在任意一个 web 进程或管理命令中:
+    - 写入方在事务提交后调用 publish_changes: 递增共享缓存中的库存水位号,
+      并把这次变化涉及的 (医院名称, 药品名称) 记在新的水位号下
+    - 各进程决策前读一次水位号, 落后时取出中间的变化记录, 只从数据库重新读取这些库存行,
+      用数据库中的数量覆盖内存中的数量(重复应用也不会出错)
+    - 变化记录已被缓存淘汰、或落后的记录太多时, 改为整体重新加载库存
+"""
+
+import time
+
+from django.core.cache import cache
+
+from . import decision_cache
+
+# 库存水位号(每次发布变化递增)
+WATERMARK_KEY = 'route_inventory:watermark'
+# 水位号 -> 这次变化涉及的 [(医院名称, 药品名称), ...]
+CHANGE_KEY = 'route_inventory:change:{}'
+# 变化记录的保留时间(秒), 比这更久没有决策的进程整体重新加载
+CHANGE_TIMEOUT = 3600
+# 落后超过这么多条变化记录时整体重新加载
+MAX_REPLAY = 500
+
+
+def _initial_watermark():
+    # 水位号被缓存淘汰后从当前毫秒时间戳重新开始, 各进程会发现差距过大而整体重新加载
+    return int(time.time() * 1000)
+
+
+def current_watermark():
+    """
+    当前的库存水位号, 缓存不可用时返回 None
+    """
+    try:
+        cache.add(WATERMARK_KEY, _initial_watermark(), None)
+        return cache.get(WATERMARK_KEY)
+    except Exception as e:
+        print(f"读取库存水位号失败: {e}")
+        return None
+
+
+def publish_changes(pairs):
+    """
+    发布库存变化(数据库事务提交之后调用), 并使依赖这些库存的决策缓存失效
+
+    参数:
+        pairs: [(医院名称, 药品名称), ...]
+    返回:
+        新的水位号, 没有变化或缓存不可用时为 None
+    """
+    pairs = sorted({(h, m) for h, m in pairs if h and m})
+    if not pairs:
+        return None
+    try:
+        cache.add(WATERMARK_KEY, _initial_watermark(), None)
+        watermark = cache.incr(WATERMARK_KEY)
+        cache.set(CHANGE_KEY.format(watermark), pairs, CHANGE_TIMEOUT)
+    except Exception as e:
+        print(f"发布库存变化失败: {e}")
+        return None
+    decision_cache.bump_stock_versions(pairs)
+    return watermark
+
+
+def changed_pairs(since, until):
+    """
+    水位号 (since, until] 之间发生变化的 (医院名称, 药品名称)
+    返回: set, 记录不完整(已被淘汰或落后太多)时为 None, 调用方应整体重新加载
+    """
+    if since is None or until is None or until < since or until - since > MAX_REPLAY:
+        return None
+    keys = [CHANGE_KEY.format(watermark) for watermark in range(since + 1, until + 1)]
+    try:
+        records = cache.get_many(keys)
+    except Exception as e:
+        print(f"读取库存变化记录失败: {e}")
+        return None
+    if len(records) != len(keys):
+        return None
+    return {tuple(pair) for key in keys for pair in records[key]}
+
+
+def load_stock(pairs):
+    """
+    用一次查询从数据库读取指定库存行的当前数量
+    返回: {(医院名称, 药品名称): 数量}, 已删除的记录为 None
+    """
+    from .models import HospitalInventory
+
+    pairs = set(pairs)
+    stock = dict.fromkeys(pairs)
+    if not pairs:
+        return stock
+    for hospital_name, medicine_name, quantity in HospitalInventory.objects.filter(
+        hospital__name__in={h for h, _ in pairs}, medicine__name__in={m for _, m in pairs}
+    ).values_list('hospital__name', 'medicine__name', 'quantity'):
+        if (hospital_name, medicine_name) in pairs:
+            stock[(hospital_name, medicine_name)] = quantity
+    return stock
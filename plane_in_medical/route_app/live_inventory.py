@@ -0,0 +1,51 @@
+"""
+数据库中的实时库存
+路径决策服务启动时先用 data/hospitals.json 冷启动, 之后用 HospitalInventory 表中的库存替换,
+库存表的增删改再通过 signals 增量同步到服务中。
+"""
+
+from .models import Hospital, HospitalInventory
+
+
+def load_live_hospitals(snapshot_hospitals):
+    """
+    从数据库组装决策服务使用的医院列表
+
+    库存只用一次批量查询读出; 快照中已有的医院保持原来的行号和 id(模型动作空间依赖行号),
+    数据库中新增的医院追加在末尾。库存表为空时返回 None, 调用方继续使用快照。
+
+    参数:
+        snapshot_hospitals: 冷启动快照中的医院字典列表
+    返回:
+        list | None
+    """
+    stock = {}
+    for hospital_name, medicine_name, quantity in HospitalInventory.objects.values_list(
+        'hospital__name', 'medicine__name', 'quantity'
+    ):
+        stock.setdefault(hospital_name, {})[medicine_name] = quantity
+    if not stock:
+        return None
+
+    coordinates = {
+        name: (latitude, longitude)
+        for name, latitude, longitude in Hospital.objects.values_list('name', 'latitude', 'longitude')
+    }
+    hospitals = []
+    for hospital in snapshot_hospitals:
+        name = hospital.get('name')
+        latitude, longitude = coordinates.pop(name, (hospital.get('latitude'), hospital.get('longitude')))
+        hospitals.append(dict(
+            hospital, latitude=latitude, longitude=longitude, inventory=dict(stock.get(name, {}))
+        ))
+    next_id = max((h.get('id') or 0 for h in hospitals), default=0) + 1
+    for name, (latitude, longitude) in coordinates.items():
+        hospitals.append({
+            'id': next_id,
+            'name': name,
+            'latitude': latitude,
+            'longitude': longitude,
+            'inventory': dict(stock.get(name, {})),
+        })
+        next_id += 1
+    return hospitals
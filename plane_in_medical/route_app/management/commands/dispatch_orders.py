@@ -0,0 +1,45 @@
+"""
+后台派单进程
+持续为新订单批量规划配送路径并预留库存: python manage.py dispatch_orders
+只处理当前积压的订单后退出: python manage.py dispatch_orders --once
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from route_app.dispatcher import OrderDispatcher
+
+
+class Command(BaseCommand):
+    help = "后台派单: 批量为还没有配送路径的订单做决策、保存路径并预留库存"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=64, help='每批最多处理的订单数')
+        parser.add_argument('--interval', type=float, default=2.0, help='没有新订单时的轮询间隔(秒)')
+        parser.add_argument('--once', action='store_true', help='处理完当前积压的订单后退出')
+
+    def handle(self, *args, **options):
+        dispatcher = OrderDispatcher(batch_size=options['batch_size'])
+        try:
+            while True:
+                stats = dispatcher.dispatch_batch()
+                if stats['batch_size']:
+                    self.stdout.write(
+                        f"派单 {stats['batch_size']} 单, 预留库存 {stats['reserved']} 单, "
+                        f"预留失败放回队列 {stats['requeued']} 单, "
+                        f"耗时 {stats['batch_latency_ms']:.1f} ms (决策 {stats['decide_ms']:.1f} ms), "
+                        f"队列剩余 {stats['queue_depth']} 单"
+                    )
+                # 放回队列的订单仍在队首, 这一批没有全部派出时同样等待, 不空转
+                if stats['batch_size'] - stats['requeued'] < dispatcher.batch_size:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        totals = dispatcher.totals
+        self.stdout.write(
+            f"派单结束: 共 {totals['batches']} 批 {totals['orders']} 单, 预留库存 {totals['reserved']} 单, "
+            f"放回队列 {totals['requeued']} 次"
+        )
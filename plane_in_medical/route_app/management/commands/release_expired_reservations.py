@@ -0,0 +1,19 @@
+"""
+释放超时未出库的库存预留
+建议用 cron 定期执行: python manage.py release_expired_reservations
+"""
+
+from django.core.management.base import BaseCommand
+
+from route_app.reservations import release_expired_reservations
+
+
+class Command(BaseCommand):
+    help = "释放超时未出库的库存预留, 归还医院库存"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='每个事务释放的最大记录数')
+
+    def handle(self, *args, **options):
+        released = release_expired_reservations(batch_size=options['batch_size'])
+        self.stdout.write(f"已释放 {released} 条超时的库存预留")
@@ -0,0 +1,63 @@
+"""
+候选模型影子评估的分歧报告
+python manage.py shadow_report
+python manage.py shadow_report --log logs/shadow_divergence.jsonl --candidate 1a2b3c4d5e6f
+"""
+
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from route_app.model_reloader import content_hash
+from route_app.shadow_mode import divergence_report, shared_counts
+
+
+class Command(BaseCommand):
+    help = "汇总所有 web 进程的影子评估计数和分歧日志, 输出候选模型与主模型的分歧报告"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', type=str, default=None, help='分歧日志, 默认 ROUTE_SHADOW_LOG_PATH')
+        parser.add_argument('--candidate', type=str, default=None,
+                            help='候选检查点内容哈希前缀, 默认 ROUTE_SHADOW_MODEL_PATH 的哈希')
+        parser.add_argument('--top', type=int, default=10, help='列出最常见的分歧动作对数')
+        parser.add_argument('--json', action='store_true', help='以 JSON 输出')
+
+    def handle(self, *args, **options):
+        candidate = options['candidate']
+        shadow_path = getattr(settings, 'ROUTE_SHADOW_MODEL_PATH', None)
+        if candidate is None and shadow_path and os.path.exists(shadow_path):
+            candidate = content_hash(shadow_path)
+        report = {'candidate': candidate[:12] if candidate else None}
+        if candidate:
+            counts = shared_counts(candidate)
+            report.update(counts)
+            report['divergence_rate'] = counts['diverged'] / counts['compared'] if counts['compared'] else 0.0
+
+        log_path = options['log'] or getattr(settings, 'ROUTE_SHADOW_LOG_PATH', None)
+        if log_path and os.path.exists(log_path):
+            report['log'] = divergence_report(log_path, candidate, top=options['top'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+        if 'compared' in report:
+            self.stdout.write(
+                f"候选模型 {report['candidate']}: 评估 {report['compared']} 个状态, 分歧 {report['diverged']} 个 "
+                f"({report['divergence_rate']:.2%}), 队列满丢弃 {report['dropped']} 个"
+            )
+        log = report.get('log')
+        if log is None:
+            self.stdout.write("没有分歧日志")
+            return
+        self.stdout.write(f"日志中的分歧: {log['divergences']} 条")
+        for pair, count in log['kind_pairs'].items():
+            self.stdout.write(f"  {pair}: {count}")
+        self.stdout.write("最常见的分歧动作对(主模型 -> 候选模型):")
+        for row in log['top_action_pairs']:
+            self.stdout.write(f"  {row['primary_action']} -> {row['candidate_action']}: {row['count']}")
+        self.stdout.write(
+            f"主模型眼中候选动作的平均损失 {log['mean_primary_q_gap']:.4f}, "
+            f"候选模型眼中自身动作的平均收益 {log['mean_candidate_q_gap']:.4f}"
+        )
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.3 on 2026-10-18 06:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("route_app", "0001_initial"),
+        ("shop_app", "0005_remove_comment_avatar"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StockReservation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("order_id", models.CharField(max_length=50)),
+                ("quantity", models.IntegerField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("reserved", "已预留"), ("consumed", "已出库")],
+                        default="reserved",
+                        max_length=20,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("expires_at", models.DateTimeField()),
+                (
+                    "hospital",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="route_app.hospital",
+                    ),
+                ),
+                (
+                    "medicine",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="shop_app.medicine",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "库存预留",
+                "verbose_name_plural": "库存预留",
+                "db_table": "stock_reservation",
+                "indexes": [
+                    models.Index(
+                        fields=["status", "expires_at"],
+                        name="stock_reser_status_0db2a8_idx",
+                    )
+                ],
+                "unique_together": {("order_id", "medicine")},
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.3 on 2026-10-18 06:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pay_app", "0003_alter_order_order_time"),
+        ("route_app", "0002_stockreservation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RouteAssignment",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("action_index", models.IntegerField()),
+                ("action", models.CharField(max_length=50)),
+                ("hospital_name", models.CharField(blank=True, max_length=50)),
+                ("hospital_latitude", models.FloatField(blank=True, null=True)),
+                ("hospital_longitude", models.FloatField(blank=True, null=True)),
+                ("distance", models.FloatField(default=0.0)),
+                ("inventory_match", models.FloatField(default=0.0)),
+                ("reasons", models.JSONField(blank=True, default=list)),
+                ("message", models.TextField(blank=True)),
+                ("replans", models.IntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "order",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="route_assignment",
+                        to="pay_app.order",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "配送路径",
+                "verbose_name_plural": "配送路径",
+                "db_table": "route_assignment",
+            },
+        ),
+    ]
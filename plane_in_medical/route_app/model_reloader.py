@@ -0,0 +1,224 @@
+"""
+路径决策模型热更新
+    - 后台线程定期检查检查点文件的修改时间和大小, 有变化时再计算内容哈希, 内容确实变化才重新加载
+    - 管理员也可以手动触发(reload_route_model), 同时在 Django 缓存中递增重载令牌,
+      其他 web 进程的检查线程看到令牌变化后各自重新加载
+    - 新权重在后台线程(或管理员请求)中加载, 先在一批冒烟测试状态上做前向计算,
+      输出形状正确且全部为有限值才替换; 替换只是一次属性赋值, 正在进行的推理继续使用旧网络
+    - 加载或校验失败时保留旧模型, 记录错误, 等文件再次变化后重试
+"""
+
+import json
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .rl_components.numpy_policy import content_hash, predict_q
+from .rl_model_loader import DATA_DIR, DEFAULT_MODEL_PATH, load_q_network
+
+# 跨进程重载令牌的缓存键
+RELOAD_TOKEN_KEY = 'route_model:reload_token'
+# 冒烟测试使用的订单数
+SMOKE_TEST_ORDERS = 64
+
+
+def checkpoint_path():
+    return str(getattr(settings, 'ROUTE_MODEL_PATH', None) or DEFAULT_MODEL_PATH)
+
+
+def file_signature(path):
+    """
+    (修改时间, 大小), 文件不存在时为 None
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def reload_token():
+    try:
+        return cache.get(RELOAD_TOKEN_KEY)
+    except Exception as e:
+        print(f"读取模型重载令牌失败: {e}")
+        return None
+
+
+def request_reload():
+    """
+    通知所有 web 进程重新加载模型(由各进程的检查线程执行)
+    """
+    try:
+        cache.add(RELOAD_TOKEN_KEY, 0, None)
+        cache.incr(RELOAD_TOKEN_KEY)
+    except Exception as e:
+        print(f"发布模型重载令牌失败: {e}")
+
+
+def smoke_test_states(env):
+    """
+    冒烟测试状态: 订单池中前若干个订单的状态; 订单池不存在时使用每家医院所在位置的空订单
+    """
+    orders = []
+    pool_file = DATA_DIR / 'data_pool.jsonl'
+    if pool_file.exists():
+        with open(pool_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    orders.append(json.loads(line))
+                if len(orders) >= SMOKE_TEST_ORDERS:
+                    break
+    if not orders:
+        orders = [
+            {'latitude': h.get('latitude', 0), 'longitude': h.get('longitude', 0), 'items': []}
+            for h in env.hospitals_template[:SMOKE_TEST_ORDERS]
+        ]
+    return env.state_space.build_state_batch(orders, env.hospital_arrays)
+
+
+def validate_network(network, states, action_size):
+    """
+    在冒烟测试状态上做一次前向计算, 输出不合格时抛出 ValueError
+    """
+    q_values = predict_q(network, states)
+    if q_values.shape != (len(states), action_size):
+        raise ValueError(f'Q 值形状错误: {q_values.shape}')
+    if not np.isfinite(q_values).all():
+        raise ValueError('Q 值中存在 NaN 或无穷大')
+    return q_values
+
+
+class ModelReloader:
+    """
+    决策服务的模型热更新
+
+    参数:
+        service: RoutingService, 提供当前的智能体和环境, 并负责替换 Q 网络
+        path: 检查点路径
+        model_format: 推理使用的模型格式, 新权重加载后同样转换为该格式
+    """
+    def __init__(self, service, path, model_format='eager'):
+        self.service = service
+        self.path = path
+        self.model_format = model_format
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._smoke_states = None
+        self.signature = file_signature(path)
+        self.content_hash = content_hash(path) if self.signature is not None else None
+        self.token = reload_token()
+        self.version = 1
+        self.loaded_at = timezone.now()
+        self.reloads = 0
+        self.failures = 0
+        self.last_error = None
+
+    def check(self):
+        """
+        检查一次: 文件变化或收到重载令牌时重新加载
+        返回: 是否替换了模型
+        """
+        with self._lock:
+            token = reload_token()
+            if token is not None and token != self.token:
+                self.token = token
+                force = True
+            elif file_signature(self.path) != self.signature:
+                force = False
+            else:
+                return False
+        return self.reload(force=force)
+
+    def broadcast(self):
+        """
+        本进程重载之后通知其他进程: 同时记下新令牌, 本进程的检查线程不会再重复加载一次
+        """
+        with self._lock:
+            request_reload()
+            self.token = reload_token()
+
+    def reload(self, force=False):
+        """
+        加载并校验新权重, 通过后原子替换
+        force 为 False 时内容哈希没有变化就只更新文件签名
+        返回: 是否替换了模型
+        """
+        with self._lock:
+            signature = file_signature(self.path)
+            if signature is None:
+                self._failed(signature, f'检查点不存在: {self.path}')
+                return False
+            try:
+                digest = content_hash(self.path)
+                if not force and digest == self.content_hash:
+                    # 文件内容与正在使用的模型相同, 之前的失败已经无关
+                    self.signature = signature
+                    self.last_error = None
+                    return False
+                env = self.service._env
+                action_size = env.action_space.action_size
+                network = load_q_network(self.path, env.state_space.state_dimensions, action_size, self.model_format)
+                if self._smoke_states is None:
+                    self._smoke_states = smoke_test_states(env)
+                validate_network(network, self._smoke_states, action_size)
+            except Exception as e:
+                self._failed(signature, str(e))
+                return False
+            self.service.swap_q_network(network)
+            self.signature = signature
+            self.content_hash = digest
+            self.version += 1
+            self.reloads += 1
+            self.loaded_at = timezone.now()
+            self.last_error = None
+            print(f"路径决策模型已热更新为版本 {self.version} ({digest[:12]})")
+            return True
+
+    def _failed(self, signature, message):
+        # 记下失败时的文件签名, 文件再次变化后才重试
+        self.signature = signature
+        self.failures += 1
+        self.last_error = message
+        print(f"路径决策模型热更新失败, 继续使用旧模型: {message}")
+
+    def start(self, interval):
+        """
+        启动后台检查线程
+        """
+        if self._thread is not None:
+            return
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.check()
+                except Exception as e:
+                    print(f"检查路径决策模型更新失败: {e}")
+
+        self._thread = threading.Thread(target=run, name='route-model-reloader', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'format': self.model_format,
+            'version': self.version,
+            'content_hash': self.content_hash,
+            'loaded_at': self.loaded_at.isoformat(),
+            'reloads': self.reloads,
+            'failures': self.failures,
+            'last_error': self.last_error,
+            'watching': self._thread is not None,
+        }
@@ -28,4 +28,67 @@ class HospitalInventory(models.Model):
         unique_together = ('hospital', 'medicine')
         verbose_name = "医院库存"
         verbose_name_plural = "医院库存"
-        db_table = 'hospital_inventory'
\ No newline at end of file
+        db_table = 'hospital_inventory'
+
+#库存预留模型: 订单派给某医院时预先扣减的库存
+class StockReservation(models.Model):
+    STATUS_RESERVED = 'reserved'
+    STATUS_CONSUMED = 'consumed'
+    STATUS_CHOICES = [
+        (STATUS_RESERVED, '已预留'),
+        (STATUS_CONSUMED, '已出库'),
+    ]
+    #订单号
+    order_id = models.CharField(max_length=50)
+    hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE)
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE)
+    #预留数量
+    quantity = models.IntegerField()
+    #预留状态: 已预留(可释放) / 已出库(配送完成, 库存正式扣减)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_RESERVED)
+    created_at = models.DateTimeField(auto_now_add=True)
+    #超过该时间仍未出库的预留会被释放
+    expires_at = models.DateTimeField()
+
+    def __str__(self) -> str:
+        return f"{self.order_id}: {self.medicine_id} x {self.quantity}"
+
+    class Meta:
+        #同一订单的同一药品只预留一次, 重复请求在插入时失败并整体回滚
+        unique_together = ('order_id', 'medicine')
+        indexes = [models.Index(fields=['status', 'expires_at'])]
+        verbose_name = "库存预留"
+        verbose_name_plural = "库存预留"
+        db_table = 'stock_reservation'
+
+
+#订单的配送路径: 下单时(或由后台任务)决策一次并保存, 跟踪页面只读; 调度员可以要求重新规划
+class RouteAssignment(models.Model):
+    order = models.OneToOneField('pay_app.Order', on_delete=models.CASCADE, related_name='route_assignment')
+    #动作索引
+    action_index = models.IntegerField()
+    #动作类型: select_hospital / wait_for_restock / redirect_alternative / split_order
+    action = models.CharField(max_length=50)
+    #选中的医院, 没有选中医院时为空
+    hospital_name = models.CharField(max_length=50, blank=True)
+    hospital_latitude = models.FloatField(null=True, blank=True)
+    hospital_longitude = models.FloatField(null=True, blank=True)
+    #用户到医院的距离(公里)
+    distance = models.FloatField(default=0.0)
+    #库存匹配度
+    inventory_match = models.FloatField(default=0.0)
+    #选择理由
+    reasons = models.JSONField(default=list, blank=True)
+    message = models.TextField(blank=True)
+    #重新规划的次数
+    replans = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"{self.order_id}: {self.action} {self.hospital_name}"
+
+    class Meta:
+        verbose_name = "配送路径"
+        verbose_name_plural = "配送路径"
+        db_table = 'route_assignment'
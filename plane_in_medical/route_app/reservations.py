@@ -0,0 +1,262 @@
+"""
+库存预留
+订单派给某家医院时, 在一个事务内用一条条件 UPDATE 扣减该订单所有药品的库存:
+    UPDATE hospital_inventory
+       SET quantity = quantity - CASE medicine_id WHEN ... THEN n ... END
+     WHERE hospital_id = ? AND ((medicine_id = ? AND quantity >= ?) OR ...)
+受影响行数等于药品种数才算预留成功, 否则整体回滚。每个订单只有一条 UPDATE 和一条批量 INSERT,
+行锁只在这一个短事务内持有, 不会逐个药品往返数据库, 也不会在锁上排队等待其他订单的业务逻辑。
+
+后台批量派单时用 reserve_stock_bulk: 一次加锁读出涉及的库存行, 逐单判断后用一条 UPDATE 和一次批量 INSERT 写入。
+
+预留在超时(ROUTE_RESERVATION_TTL_SECONDS)或订单删除时释放, 配送完成后标记为已出库。
+超时释放的同时删除订单的配送路径, 订单回到派单队列重新决策并预留, 出库时才有预留可以扣减。
+数据库中的库存变化在事务提交后同步给本进程的路径决策服务, 并通过库存水位号通知其他进程(见 inventory_sync)。
+"""
+
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from shop_app.models import Medicine
+from .models import Hospital, HospitalInventory, RouteAssignment, StockReservation
+from .routing_service import routing_service
+
+
+def _order_needs(items):
+    """
+    订单药品 -> {药品名称: 需求数量}, 同名药品合并
+    """
+    needs = {}
+    for item in items or []:
+        name = item.get('name')
+        quantity = int(item.get('quantity', 1))
+        if name and quantity > 0:
+            needs[name] = needs.get(name, 0) + quantity
+    return needs
+
+
+def _medicine_ids(names):
+    """
+    药品名称 -> 药品 id, 同名药品取 id 最小的一个
+    """
+    medicine_ids = {}
+    for name, medicine_id in Medicine.objects.filter(name__in=names).order_by('id').values_list('name', 'id'):
+        medicine_ids.setdefault(name, medicine_id)
+    return medicine_ids
+
+
+def _apply_stock_changes(amounts):
+    """
+    用一条 UPDATE 把 {(医院 id, 药品 id): 变化量} 应用到库存表
+    """
+    HospitalInventory.objects.filter(
+        reduce(or_, (Q(hospital_id=h, medicine_id=m) for h, m in amounts))
+    ).update(quantity=F('quantity') + Case(
+        *(When(hospital_id=h, medicine_id=m, then=Value(qty)) for (h, m), qty in amounts.items()),
+        output_field=IntegerField(),
+    ))
+
+
+def _notify_routing_service(changes):
+    """
+    把 [(医院名称, 药品名称, 变化量), ...] 同步给本进程的路径决策服务, 并通知其他进程
+    """
+    routing_service.adjust_stock_many(changes)
+
+
+def reserve_stock(order_id, hospital_name, items):
+    """
+    为订单在指定医院预留库存
+
+    参数:
+        order_id: 订单号
+        hospital_name: 医院名称
+        items: 订单药品列表(包含 name / quantity)
+    返回:
+        bool: 预留成功, 或该订单此前已经预留过
+    """
+    needs = _order_needs(items)
+    if not needs:
+        return False
+    # 同一订单的路径页面可能被反复打开, 已预留过的订单直接返回
+    if StockReservation.objects.filter(order_id=order_id).exists():
+        return True
+    hospital_id = Hospital.objects.filter(name=hospital_name).values_list('id', flat=True).first()
+    if hospital_id is None:
+        return False
+    medicine_ids = _medicine_ids(needs)
+    if len(medicine_ids) != len(needs):
+        return False
+
+    expires_at = timezone.now() + timedelta(seconds=getattr(settings, 'ROUTE_RESERVATION_TTL_SECONDS', 1800))
+    try:
+        with transaction.atomic():
+            updated = HospitalInventory.objects.filter(hospital_id=hospital_id).filter(
+                reduce(or_, (Q(medicine_id=medicine_ids[name], quantity__gte=qty) for name, qty in needs.items()))
+            ).update(quantity=F('quantity') - Case(
+                *(When(medicine_id=medicine_ids[name], then=Value(qty)) for name, qty in needs.items()),
+                output_field=IntegerField(),
+            ))
+            if updated != len(needs):
+                # 有药品库存不足, 整单不预留
+                transaction.set_rollback(True)
+                return False
+            # 同一订单重复预留会违反 (order_id, medicine) 唯一约束, 连同上面的扣减一起回滚
+            StockReservation.objects.bulk_create([
+                StockReservation(
+                    order_id=order_id,
+                    hospital_id=hospital_id,
+                    medicine_id=medicine_ids[name],
+                    quantity=qty,
+                    expires_at=expires_at,
+                )
+                for name, qty in needs.items()
+            ])
+            changes = [(hospital_name, name, -qty) for name, qty in needs.items()]
+            transaction.on_commit(lambda: _notify_routing_service(changes))
+    except IntegrityError:
+        return StockReservation.objects.filter(order_id=order_id).exists()
+    return True
+
+
+def reserve_stock_bulk(requests):
+    """
+    批量为多个订单预留库存(后台派单使用)
+
+    在一个事务内: 一次查询锁定涉及的库存行, 按请求顺序逐单判断库存是否足够(整单预留或整单跳过),
+    再用一条 UPDATE 扣减、一次批量 INSERT 写入全部预留记录。
+
+    参数:
+        requests: [(订单号, 医院名称, 订单药品列表), ...]
+    返回:
+        set: 预留成功(或此前已经预留过)的订单号
+    """
+    plans = [(order_id, hospital_name, _order_needs(items)) for order_id, hospital_name, items in requests]
+    plans = [plan for plan in plans if plan[1] and plan[2]]
+    if not plans:
+        return set()
+    hospital_ids = dict(Hospital.objects.filter(name__in={plan[1] for plan in plans}).values_list('name', 'id'))
+    medicine_ids = _medicine_ids({name for plan in plans for name in plan[2]})
+    expires_at = timezone.now() + timedelta(seconds=getattr(settings, 'ROUTE_RESERVATION_TTL_SECONDS', 1800))
+
+    try:
+        with transaction.atomic():
+            reserved = set(
+                StockReservation.objects.filter(order_id__in=[plan[0] for plan in plans])
+                .values_list('order_id', flat=True).distinct()
+            )
+            # 按主键顺序加锁, 避免与其他批次互相等待
+            available = {
+                (h, m): quantity
+                for h, m, quantity in HospitalInventory.objects.select_for_update().filter(
+                    hospital_id__in=set(hospital_ids.values()), medicine_id__in=set(medicine_ids.values())
+                ).order_by('id').values_list('hospital_id', 'medicine_id', 'quantity')
+            }
+            amounts = {}
+            reservations = []
+            changes = []
+            for order_id, hospital_name, needs in plans:
+                hospital_id = hospital_ids.get(hospital_name)
+                if order_id in reserved or hospital_id is None or any(name not in medicine_ids for name in needs):
+                    continue
+                keys = [((hospital_id, medicine_ids[name]), name, qty) for name, qty in needs.items()]
+                if any(available.get(key, 0) < qty for key, _, qty in keys):
+                    continue
+                for key, name, qty in keys:
+                    available[key] -= qty
+                    amounts[key] = amounts.get(key, 0) - qty
+                    reservations.append(StockReservation(
+                        order_id=order_id, hospital_id=key[0], medicine_id=key[1], quantity=qty, expires_at=expires_at,
+                    ))
+                    changes.append((hospital_name, name, -qty))
+                reserved.add(order_id)
+            if amounts:
+                _apply_stock_changes(amounts)
+                StockReservation.objects.bulk_create(reservations)
+                transaction.on_commit(lambda: _notify_routing_service(changes))
+    except IntegrityError:
+        # 与单个订单的预留并发冲突, 整批回滚后逐单预留
+        return {order_id for order_id, hospital_name, needs in plans
+                if reserve_stock(order_id, hospital_name, [{'name': n, 'quantity': q} for n, q in needs.items()])}
+    return reserved
+
+
+def _release(queryset, requeue=False):
+    """
+    释放查询集中仍处于预留状态的记录: 一条 UPDATE 归还库存, 再删除预留记录
+    requeue: 同时删除这些订单的配送路径, 让订单回到派单队列
+    返回: 释放的记录数
+    """
+    with transaction.atomic():
+        rows = list(
+            queryset.filter(status=StockReservation.STATUS_RESERVED)
+            .select_for_update()
+            .values_list('id', 'hospital_id', 'medicine_id', 'quantity', 'order_id')
+        )
+        if not rows:
+            return 0
+        # 同一医院同一药品可能来自多个订单, 先合并
+        amounts = {}
+        for _, hospital_id, medicine_id, quantity, _ in rows:
+            amounts[(hospital_id, medicine_id)] = amounts.get((hospital_id, medicine_id), 0) + quantity
+        _apply_stock_changes(amounts)
+        StockReservation.objects.filter(id__in=[row[0] for row in rows]).delete()
+        if requeue:
+            RouteAssignment.objects.filter(order__order_id__in={row[4] for row in rows}).delete()
+
+        hospital_names = dict(Hospital.objects.filter(id__in={h for h, _ in amounts}).values_list('id', 'name'))
+        medicine_names = dict(Medicine.objects.filter(id__in={m for _, m in amounts}).values_list('id', 'name'))
+        changes = [(hospital_names.get(h), medicine_names.get(m), qty) for (h, m), qty in amounts.items()]
+        transaction.on_commit(lambda: _notify_routing_service(changes))
+    return len(rows)
+
+
+def release_reservations(order_ids):
+    """
+    释放订单的库存预留(订单删除或取消时调用)
+
+    参数:
+        order_ids: 订单号或订单号列表
+    返回: 释放的记录数
+    """
+    if isinstance(order_ids, str):
+        order_ids = [order_ids]
+    return _release(StockReservation.objects.filter(order_id__in=list(order_ids)))
+
+
+def release_expired_reservations(now=None, batch_size=500):
+    """
+    释放已超时的库存预留, 每批在一个事务内完成
+    这些订单的配送路径一并删除: 路径指向的医院已经没有为它保留的库存, 由后台派单重新决策并预留
+    返回: 释放的记录数
+    """
+    now = now or timezone.now()
+    released = 0
+    while True:
+        ids = list(
+            StockReservation.objects.filter(status=StockReservation.STATUS_RESERVED, expires_at__lt=now)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return released
+        count = _release(StockReservation.objects.filter(id__in=ids), requeue=True)
+        released += count
+        if count == 0:
+            # 这一批已被其他进程释放
+            return released
+
+
+def consume_reservations(order_id):
+    """
+    配送完成: 预留转为正式出库, 不再超时释放
+    返回: 更新的记录数
+    """
+    return StockReservation.objects.filter(
+        order_id=order_id, status=StockReservation.STATUS_RESERVED
+    ).update(status=StockReservation.STATUS_CONSUMED)
@@ -21,6 +21,8 @@ class ActionSpace:
         #当单个医院无法满足整个订单时采取的动作
         self.action_descriptions[self.num_hospitals + 2] = "拆分订单"
         self.action_size = self.num_hospitals + 3 #总动作数
+        #用户位置 -> 各医院距离的缓存(DistanceCache), 由环境或决策服务设置
+        self.distance_cache = None
     
     def get_action_description(self,action_id):
         """
@@ -116,9 +118,15 @@ class ActionSpace:
     def _calculate_distance(self, lat1, lon1, lat2, lon2):
         """
         计算两点间距离（使用Haversine公式）
+        第二个点是缓存中的医院时直接查距离缓存
         """
         from math import radians, sin, cos, asin, sqrt
-        
+
+        if self.distance_cache is not None:
+            distance = self.distance_cache.distance_to(lat1, lon1, lat2, lon2)
+            if distance is not None:
+                return distance
+
         lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
         dlon = lon2 - lon1
         dlat = lat2 - lat1
@@ -0,0 +1,240 @@
+"""
+多进程采样(actor)
+N 个采样进程各自持有一个向量化环境和一份 Q 网络副本, 学习进程(持有 DQNAgent)按轮分派订单:
+    - 每轮把一段订单按进程均分, 每个进程用本轮的网络参数和探索率批量选择动作并执行
+    - 经验写入共享内存中该进程的槽位, 学习进程只通过队列收到"第几轮写完了多少条"
+    - 网络参数同样放在共享内存中, 学习进程处理完第 r 轮后发布参数, 供第 r + 2 轮使用
+      (两轮流水: 进程采样第 r + 1 轮时学习进程在训练第 r 轮)
+每轮使用哪份参数、探索率和随机数种子都只由轮次决定, 与进程调度的快慢无关,
+因此相同 --seed 和进程数下训练结果可以复现。
+"""
+
+import multiprocessing as mp
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import torch
+
+from .agent import DQN
+from .vec_environment import VecDroneDeliveryEnvironment
+
+# 流水深度: 第 r 轮使用学习进程处理完第 r - PIPELINE_DEPTH 轮后发布的参数
+PIPELINE_DEPTH = 2
+
+
+class SharedArrays:
+    """
+    一块共享内存上的若干 NumPy 数组
+
+    参数:
+        specs: {名称: (形状, dtype)}
+        name: 已存在的共享内存名称(子进程连接时使用), None 表示新建
+    """
+    def __init__(self, specs, name=None):
+        self.specs = specs
+        layout = []
+        offset = 0
+        for key, (shape, dtype) in specs.items():
+            dtype = np.dtype(dtype)
+            nbytes = int(np.prod(shape)) * dtype.itemsize
+            # 按 8 字节对齐
+            offset = (offset + 7) // 8 * 8
+            layout.append((key, shape, dtype, offset))
+            offset += nbytes
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.arrays = {
+            key: np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=start)
+            for key, shape, dtype, start in layout
+        }
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+    def close(self, unlink=False):
+        self.arrays = {}
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def transition_specs(capacity, state_size):
+    """
+    一个进程的经验槽位: 两个槽位交替使用(第 r 轮写入 r % 2)
+    """
+    return {
+        'states': ((2, capacity, state_size), np.float32),
+        'actions': ((2, capacity), np.int64),
+        'rewards': ((2, capacity), np.float64),
+        'next_states': ((2, capacity, state_size), np.float32),
+        'dones': ((2, capacity), np.bool_),
+    }
+
+
+def weight_specs(num_parameters):
+    return {'weights': ((PIPELINE_DEPTH, num_parameters), np.float32)}
+
+
+def rollout_worker(worker_id, seed, hospitals, orders, state_size, action_size,
+                   capacity, transitions_name, weights_name, tasks, results):
+    """
+    采样进程主循环: 从 tasks 取 (轮次, 订单下标, 探索率), 写完经验后向 results 报告
+    """
+    torch.set_num_threads(1)
+    transitions = SharedArrays(transition_specs(capacity, state_size), transitions_name)
+    network = DQN(state_size, action_size)
+    num_parameters = sum(p.numel() for p in network.parameters())
+    weights = SharedArrays(weight_specs(num_parameters), weights_name)
+    env = VecDroneDeliveryEnvironment(hospitals)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            round_id, indices, epsilon = task
+            started = time.perf_counter()
+            torch.nn.utils.vector_to_parameters(
+                torch.from_numpy(weights['weights'][round_id % PIPELINE_DEPTH].copy()), network.parameters()
+            )
+            batch = [orders[i] for i in indices]
+            states = env.reset(batch)
+            with torch.no_grad():
+                actions = network(torch.from_numpy(states)).argmax(dim=1).numpy()
+            # 探索的随机数只由 (种子, 轮次, 进程) 决定
+            rng = np.random.default_rng([seed, round_id, worker_id])
+            explore = rng.random(len(batch)) <= epsilon
+            actions[explore] = rng.integers(action_size, size=int(explore.sum()))
+            next_states, rewards, dones, _ = env.step(actions)
+
+            slot = round_id % 2
+            n = len(batch)
+            transitions['states'][slot, :n] = states
+            transitions['actions'][slot, :n] = actions
+            transitions['rewards'][slot, :n] = rewards
+            transitions['next_states'][slot, :n] = next_states
+            transitions['dones'][slot, :n] = dones
+            results.put((worker_id, round_id, n, time.perf_counter() - started))
+    finally:
+        transitions.close()
+        weights.close()
+
+
+class RolloutPool:
+    """
+    学习进程一侧的采样进程池
+
+    参数:
+        num_workers: 采样进程数
+        agent: DQNAgent, 提供要同步给采样进程的 Q 网络
+        hospitals / orders: 医院数据与订单列表(启动时复制到每个进程)
+        per_worker: 每个进程每轮最多处理的订单数
+        seed: 随机数种子
+    """
+    def __init__(self, num_workers, agent, hospitals, orders, per_worker, seed):
+        self.num_workers = int(num_workers)
+        self.agent = agent
+        self.per_worker = int(per_worker)
+        self.seed = int(seed)
+        self._ctx = mp.get_context('spawn')
+        self._results = self._ctx.Queue()
+        self._pending = {}
+        num_parameters = sum(p.numel() for p in agent.q_network.parameters())
+        self.weights = SharedArrays(weight_specs(num_parameters))
+        # 最开始的两轮使用初始参数
+        for slot in range(PIPELINE_DEPTH):
+            self.publish(slot)
+        self.transitions = []
+        self._tasks = []
+        self._workers = []
+        try:
+            for worker_id in range(self.num_workers):
+                shared = SharedArrays(transition_specs(self.per_worker, agent.state_size))
+                self.transitions.append(shared)
+                tasks = self._ctx.Queue()
+                self._tasks.append(tasks)
+                process = self._ctx.Process(
+                    target=rollout_worker,
+                    args=(worker_id, self.seed, hospitals, orders, agent.state_size, agent.action_size,
+                          self.per_worker, shared.name, self.weights.name, tasks, self._results),
+                    daemon=True,
+                )
+                process.start()
+                self._workers.append(process)
+        except Exception:
+            self.close()
+            raise
+        self.rollout_seconds = 0.0
+
+    def publish(self, round_id):
+        """
+        把学习进程当前的参数发布给第 round_id 轮使用
+        """
+        vector = torch.nn.utils.parameters_to_vector(self.agent.q_network.parameters()).detach()
+        self.weights['weights'][round_id % PIPELINE_DEPTH] = vector.cpu().numpy()
+
+    def submit(self, round_id, indices, epsilon):
+        """
+        分派一轮订单(订单下标列表), 按进程均分
+        """
+        parts = np.array_split(np.asarray(indices, dtype=np.int64), self.num_workers)
+        self._pending[round_id] = {}
+        for worker_id, part in enumerate(parts):
+            if len(part) > self.per_worker:
+                raise ValueError('每个进程每轮的订单数超过了槽位容量')
+            self._tasks[worker_id].put((round_id, part.tolist(), float(epsilon)))
+
+    def collect(self, round_id):
+        """
+        等待第 round_id 轮全部完成, 按进程顺序返回经验 (state, action, reward, next_state, done)
+        """
+        pending = self._pending[round_id]
+        while len(pending) < self.num_workers:
+            try:
+                worker_id, done_round, n, seconds = self._results.get(timeout=1.0)
+            except queue.Empty:
+                dead = [i for i, p in enumerate(self._workers) if not p.is_alive()]
+                if dead:
+                    raise RuntimeError(f'采样进程 {dead} 已退出')
+                continue
+            self._pending[done_round][worker_id] = n
+            self.rollout_seconds += seconds
+        del self._pending[round_id]
+        slot = round_id % 2
+        transitions = []
+        for worker_id in range(self.num_workers):
+            n = pending[worker_id]
+            shared = self.transitions[worker_id]
+            # 拷贝出来, 该槽位之后会被第 round_id + 2 轮覆盖
+            states = shared['states'][slot, :n].copy()
+            actions = shared['actions'][slot, :n].copy()
+            rewards = shared['rewards'][slot, :n].copy()
+            next_states = shared['next_states'][slot, :n].copy()
+            dones = shared['dones'][slot, :n].copy()
+            for i in range(n):
+                transitions.append((states[i], int(actions[i]), float(rewards[i]), next_states[i], bool(dones[i])))
+        return transitions
+
+    def close(self):
+        for tasks in self._tasks:
+            tasks.put(None)
+        for process in self._workers:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for shared in self.transitions:
+            shared.close(unlink=True)
+        self.weights.close(unlink=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -9,7 +9,7 @@ import torch.optim as optim
 import numpy as np
 import random
 from .environment import create_environment
-from collections import deque    #双端队列,用于经验回收
+from .replay_buffer import PrioritizedReplayBuffer, ReplayBuffer    #预分配的环形经验回放缓冲区
 
 class DQN(nn.Module):
     """
@@ -28,11 +28,14 @@ class DQN(nn.Module):
     
 class DQNAgent:
     """DQN智能体"""
-    def __init__(self, state_size, action_size, lr=0.001):
+    def __init__(self, state_size, action_size, lr=0.001, prioritized=False, alpha=0.6, beta=0.4):
         self.state_size = state_size
         self.action_size = action_size
-        #经验回收缓冲区,最大容量10000
-        self.memory = deque(maxlen=50000)
+        #经验回收缓冲区,最大容量50000; prioritized 时按 TD 误差优先抽样
+        if prioritized:
+            self.memory = PrioritizedReplayBuffer(capacity=50000, alpha=alpha, beta=beta)
+        else:
+            self.memory = ReplayBuffer(capacity=50000)
         #当前探索率
         self.epsilon = 1.0  # 探索率
         #最小探索率
@@ -57,7 +60,15 @@ class DQNAgent:
         
     def remember(self, state, action, reward, next_state, done):
         """存储经验"""
-        self.memory.append((state, action, reward, next_state, done))
+        self.memory.add(state, action, reward, next_state, done)
+
+    def save_memory(self, path):
+        """保存经验回放缓冲区(.npz), 用于中断后继续训练"""
+        self.memory.save(path)
+
+    def load_memory(self, path):
+        """加载 save_memory 保存的经验回放缓冲区"""
+        self.memory.load(path)
         
     def act(self, state):
         """选择动作"""
@@ -67,29 +78,49 @@ class DQNAgent:
         state_tensor = torch.FloatTensor(state).unsqueeze(0)
         q_values = self.q_network(state_tensor)
         return np.argmax(q_values.cpu().data.numpy())
+
+    def act_batch(self, states):
+        """
+        批量贪婪选择动作(不探索), states 为 (N, state_size) 数组, 返回 (N,) 动作数组
+        """
+        with torch.no_grad():
+            q_values = self.q_network(torch.as_tensor(np.asarray(states), dtype=torch.float32))
+        return q_values.argmax(dim=1).cpu().numpy()
     
-    def replay(self, batch_size=32):
-        """经验回放"""
+    def replay(self, batch_size=32, decay_epsilon=True):
+        """
+        经验回放: 抽一批经验做一次梯度更新, 返回损失值(经验不足一批时不更新, 返回 None)
+        decay_epsilon 为 False 时不衰减探索率, 由调用方按回合调用 decay_epsilon
+        """
         if len(self.memory) < batch_size:
-            return
+            return None
             
-        batch = random.sample(self.memory, batch_size)
-        states = torch.FloatTensor([e[0] for e in batch])
-        actions = torch.LongTensor([e[1] for e in batch])
-        rewards = torch.FloatTensor([e[2] for e in batch])
-        next_states = torch.FloatTensor([e[3] for e in batch])
-        dones = torch.BoolTensor([e[4] for e in batch])
+        batch = self.memory.sample(batch_size)
+        states, actions, rewards, next_states, dones = (torch.from_numpy(array) for array in batch[:5])
         
         current_q_values = self.q_network(states).gather(1, actions.unsqueeze(1))
         next_q_values = self.target_network(next_states).max(1)[0].detach()
         target_q_values = rewards + (0.99 * next_q_values * ~dones)
         
-        loss = nn.MSELoss()(current_q_values.squeeze(), target_q_values)
+        if isinstance(self.memory, PrioritizedReplayBuffer):
+            # 优先回放: 用重要性采样权重修正平方误差, 并用新的 TD 误差更新优先级
+            indices, weights = batch[5], torch.from_numpy(batch[6])
+            td_errors = current_q_values.squeeze(1) - target_q_values
+            loss = (weights * td_errors.pow(2)).mean()
+            self.memory.update_priorities(indices, td_errors.detach().cpu().numpy())
+        else:
+            loss = nn.MSELoss()(current_q_values.squeeze(), target_q_values)
         
         self.optimizer.zero_grad()
         loss.backward()
         self.optimizer.step()
         
+        if decay_epsilon:
+            self.decay_epsilon()
+        return float(loss.item())
+
+    def decay_epsilon(self):
+        """探索率衰减一次"""
         if self.epsilon > self.epsilon_min:
             self.epsilon *= self.epsilon_decay
 
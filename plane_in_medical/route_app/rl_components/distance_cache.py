@@ -0,0 +1,120 @@
+"""
+用户位置 -> 所有医院距离的缓存
+订单坐标高度集中(训练数据中同一配送地址会出现在多个增强样本里), 同一位置到所有医院的距离向量
+只计算一次, 之后 reset / step / 动作解释都直接查表。
+
+缓存键默认是精确坐标: 状态向量中的距离特征必须与训练时逐位一致, 量化后的距离会改变模型输入。
+设置 cell_degrees 后按经纬度网格量化(例如 0.0005 度约 50 米), 同一网格内的订单共用网格中心的距离,
+命中率更高但距离有最多约半个网格的误差, 只适合对距离精度不敏感的场合。
+"""
+
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# 默认最多缓存的位置数
+DEFAULT_CACHE_SIZE = 4096
+
+
+class DistanceCache:
+    """
+    按位置缓存到所有医院的 Haversine 距离向量, LRU 淘汰
+
+    参数:
+        arrays: HospitalArrays, 提供医院坐标
+        max_entries: 最多缓存的位置数
+        cell_degrees: 网格边长(度), None 表示按精确坐标缓存
+    """
+    def __init__(self, arrays, max_entries=DEFAULT_CACHE_SIZE, cell_degrees=None):
+        self.arrays = arrays
+        self.max_entries = max_entries
+        self.cell_degrees = cell_degrees
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # 医院坐标 -> 行号, 供按坐标查询单个医院距离的调用方使用
+        self._row_by_coordinates = {}
+        for row, (lat, lon) in enumerate(zip(arrays.latitudes.tolist(), arrays.longitudes.tolist())):
+            self._row_by_coordinates.setdefault((lat, lon), row)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _key(self, latitude, longitude):
+        latitude, longitude = float(latitude), float(longitude)
+        if self.cell_degrees is None:
+            return latitude, longitude
+        return round(latitude / self.cell_degrees), round(longitude / self.cell_degrees)
+
+    def _origin(self, key):
+        # 计算距离时使用的位置: 精确坐标或网格中心
+        if self.cell_degrees is None:
+            return key
+        return key[0] * self.cell_degrees, key[1] * self.cell_degrees
+
+    def distances(self, latitude, longitude):
+        """
+        位置到所有医院的距离(公里), 形状 (H,), 与 StateSpace._calculate_distance 逐位一致
+        返回的数组只读, 调用方不得修改
+        """
+        key = self._key(latitude, longitude)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+            self.misses += 1
+        vector = self._compute(*self._origin(key))
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return vector
+
+    def distance_to(self, latitude, longitude, hospital_latitude, hospital_longitude):
+        """
+        位置到某个医院的距离, 医院坐标不在缓存的医院列表中时返回 None
+        """
+        row = self._row_by_coordinates.get((float(hospital_latitude), float(hospital_longitude)))
+        if row is None:
+            return None
+        return float(self.distances(latitude, longitude)[row])
+
+    def _compute(self, latitude, longitude):
+        # 逐医院走 math, 保证与 math 版 Haversine 逐位一致
+        lat_radians, lon_radians, cos_lat = self.arrays._coordinate_lists
+        lat1 = math.radians(latitude)
+        lon1 = math.radians(longitude)
+        cos_lat1 = math.cos(lat1)
+        distances = np.empty(len(lat_radians), dtype=np.float64)
+        for row, (lat2, lon2, cos_lat2) in enumerate(zip(lat_radians, lon_radians, cos_lat)):
+            a = math.sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * cos_lat2 * math.sin((lon2 - lon1) / 2) ** 2
+            distances[row] = 6371.0 * (2 * math.asin(math.sqrt(a)))
+        distances.setflags(write=False)
+        return distances
+
+    def clear(self):
+        """
+        清空缓存(医院数据变化时调用)
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'cell_degrees': self.cell_degrees,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
@@ -7,49 +7,83 @@ import numpy as np
 from .states import state_space
 from .actions import create_action_space
 from .rewards import reward_function
+from .hospital_arrays import HospitalArrays
+from .inventory import InventoryOverlay, OverlayHospitals
 import copy  # 引入 copy 模块
 
 
 class DroneDeliveryEnvironment:
     def __init__(self, hospitals_data):
-        # 保存原始医院数据的深拷贝作为模板，用于每次 reset 时创建独立副本
+        # 保存原始医院数据的深拷贝作为只读模板(基础库存表)
         self._hospitals_data_template = copy.deepcopy(hospitals_data)
-        # self.hospitals_data 将在 reset 中被初始化为模板的副本
-        self.hospitals_data = None
         self.state = None
         self.action_space = create_action_space(self._hospitals_data_template) # 使用模板创建 action_space
+        # 模板的数组形式(坐标数组 + 库存矩阵), 用于向量化构建状态
+        self.hospital_arrays = HospitalArrays(self._hospitals_data_template)
+        # 动作解释中的距离计算与状态构建共用同一份距离缓存
+        self.action_space.distance_cache = self.hospital_arrays.distance_cache
+        # step 中的库存改动只写入增量层, reset 时清空, 不再深拷贝模板
+        self.inventory = InventoryOverlay(self.hospital_arrays)
+        # 医院列表的只读视图, 库存透过增量层读取
+        self.hospitals_data = OverlayHospitals(self.inventory)
+        # 医院 id -> 行号, 用于根据动作结果定位医院
+        self._row_by_id = {}
+        for row, hobj in enumerate(self._hospitals_data_template):
+            if hobj.get('id') is not None:
+                self._row_by_id.setdefault(hobj.get('id'), row)
         self.state_space = state_space
         self._user_request = None
         self._order_medicines = None
 
+    @property
+    def hospitals_template(self):
+        """
+        只读的医院数据模板, 供不修改库存的推理路径直接使用(调用方不得修改)
+        """
+        return self._hospitals_data_template
+
     def reset(self, user_request, order_medicines):
         """
         重置环境
         """
         self._user_request = user_request
         self._order_medicines = order_medicines
-        # 每次 reset 时，都从模板创建一个新的医院数据副本，确保库存独立
-        self.hospitals_data = copy.deepcopy(self._hospitals_data_template)
-        # 重新创建 action_space，因为它依赖于 hospitals_data (虽然当前实现可能不需要，但更安全)
-        # self.action_space = create_action_space(self.hospitals_data) 
+        # 每次 reset 时清空库存增量层, 代价只与上一轮改动过的条目数有关
+        self.inventory.clear()
+        # reset 后的库存与模板一致, 直接使用模板的数组形式构建状态
         self.state = self.state_space.build_state_vector(
-            user_request, self.hospitals_data, order_medicines
+            user_request, self.hospital_arrays, order_medicines
         )
         return self.state
+
+    def _find_row(self, hosp):
+        """
+        根据 id (或坐标) 找到医院所在的行号
+        """
+        hid = hosp.get('id')
+        if hid is not None and hid in self._row_by_id:
+            return self._row_by_id[hid]
+        # fallback: try to match by coordinates
+        for row, hobj in enumerate(self._hospitals_data_template):
+            if float(hobj.get('latitude', 0) or 0) == float(hosp.get('latitude', 0) or 0) and \
+               float(hobj.get('longitude', 0) or 0) == float(hosp.get('longitude', 0) or 0):
+                return row
+        return None
+
     def step(self, action):
         """
         执行动作并返回结果
         """
-        # 1. 调用 action_space 执行动作 (不修改 self.hospitals_data)
+        # 1. 调用 action_space 执行动作 (只读 self.hospitals_data 视图)
         execution_result = self.action_space.execute_action(
-            action, self._user_request or {}, self.hospitals_data # 传入副本
+            action, self._user_request or {}, self.hospitals_data
         )
 
         # 2. 计算订单总物品数 (通用信息)
         total_order_items = sum(int(it.get('quantity', 1)) for it in self._order_medicines or [])
         execution_result['total_items'] = total_order_items
 
-        # 3. 根据动作类型，补充详细信息并可能修改 self.hospitals_data 副本
+        # 3. 根据动作类型，补充详细信息并可能修改库存增量层
         # --- 库存更新逻辑 (修改部分) ---
         if execution_result.get('action') == 'select_hospital' and execution_result.get('hospital'):
             hosp = execution_result['hospital']
@@ -61,12 +95,17 @@ class DroneDeliveryEnvironment:
                 lat1 = float(self._user_request.get('latitude', 0.0) or 0.0)
                 lon2 = float(hosp.get('longitude', 0.0) or 0.0)
                 lat2 = float(hosp.get('latitude', 0.0) or 0.0)
-                lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-                dlon = lon2 - lon1
-                dlat = lat2 - lat1
-                a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-                c = 2 * asin(sqrt(a))
-                distance_km = 6371.0 * c
+                distance_km = None
+                if self.hospital_arrays.distance_cache is not None:
+                    # 同一位置到各医院的距离在 reset 构建状态时已经缓存
+                    distance_km = self.hospital_arrays.distance_cache.distance_to(lat1, lon1, lat2, lon2)
+                if distance_km is None:
+                    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
+                    dlon = lon2 - lon1
+                    dlat = lat2 - lat1
+                    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+                    c = 2 * asin(sqrt(a))
+                    distance_km = 6371.0 * c
             except Exception:
                 distance_km = 0.0
 
@@ -84,7 +123,7 @@ class DroneDeliveryEnvironment:
                     match_count += 1
             inventory_match = (match_count / total) if total > 0 else 0
 
-            # 将计算结果附加到 hospital 对象（这是副本中的对象）
+            # 将计算结果附加到 hospital 对象（这是视图返回的浅拷贝）
             hosp['distance'] = distance_km
             hosp['inventory_match'] = inventory_match
 
@@ -97,34 +136,17 @@ class DroneDeliveryEnvironment:
             execution_result['hospital_id'] = hosp.get('id')
             execution_result['distance_km'] = distance_km # 显式添加距离
 
-            # 如果能够完全满足，则从该医院库存中扣除所需数量（持久化到 self.hospitals_data 副本）
+            # 如果能够完全满足，则从该医院库存中扣除所需数量（写入库存增量层）
             if fully_sufficient:
-                # ... (查找并修改副本中医院库存的代码保持不变，但稍作调整以获取 target_hosp_obj) ...
-                 # find the hospital object inside self.hospitals_data (副本) that matches hosp by id or coordinates
-                hid = hosp.get('id')
-                target_hosp_obj = None
-                for hobj in self.hospitals_data:
-                    if hid is not None and hobj.get('id') == hid:
-                        target_hosp_obj = hobj
-                        break
-                if target_hosp_obj is None:
-                    # fallback: try to match by coordinates
-                    for hobj in self.hospitals_data:
-                        if float(hobj.get('latitude', 0) or 0) == float(hosp.get('latitude', 0) or 0) and \
-                           float(hobj.get('longitude', 0) or 0) == float(hosp.get('longitude', 0) or 0):
-                            target_hosp_obj = hobj
-                            break
+                # find the hospital row that matches hosp by id or coordinates
+                target_row = self._find_row(hosp)
 
-                if target_hosp_obj is not None:
-                    # 直接修改 self.hospitals_data 副本中的库存
-                    inv_to_modify = target_hosp_obj.get('inventory', {})
+                if target_row is not None:
                     for it in self._order_medicines or []:
                         key = it.get('name') or str(it.get('id'))
                         need = int(it.get('quantity', 1))
-                        prev = int(inv_to_modify.get(key, 0))
-                        inv_to_modify[key] = max(0, prev - need)
-                    # 更新副本中的库存字典
-                    target_hosp_obj['inventory'] = inv_to_modify
+                        prev = self.inventory.get(target_row, key)
+                        self.inventory.set(target_row, key, max(0, prev - need))
                     execution_result['decremented'] = True
                     
                     # --- 增强 execution_result 信息 (完全满足情况) ---
@@ -151,15 +173,15 @@ class DroneDeliveryEnvironment:
                 execution_result['travel_minutes'] = distance_km # 即使不满足也可能飞行
 
         elif execution_result.get('action') == 'wait_for_restock':
-            # ... (模拟补货并修改 self.hospitals_data 副本的代码保持不变) ...
-            # 简单模拟：对所有医院中缺少的物品补货少量 (修改副本)
-            for hobj in self.hospitals_data: # 修改副本
-                inv = hobj.get('inventory', {}) or {}
-                for it in self._order_medicines or []:
-                    key = it.get('name') or str(it.get('id'))
-                    if int(inv.get(key, 0)) < int(it.get('quantity', 1)):
-                        inv[key] = int(inv.get(key, 0)) + 5  # 补货5件
-                hobj['inventory'] = inv # 更新副本
+            # 简单模拟：对所有医院中缺少的物品补货少量 (写入库存增量层)
+            # 每家医院按订单顺序逐个药品检查; 只有库存不足的医院需要写入, 用倒排索引排除库存充足的医院
+            for it in self._order_medicines or []:
+                key = it.get('name') or str(it.get('id'))
+                need = int(it.get('quantity', 1))
+                lacking = np.ones(len(self.inventory), dtype=bool)
+                lacking[self.inventory.rows_with_at_least(key, need)] = False
+                for row in np.flatnonzero(lacking).tolist():
+                    self.inventory.set(row, key, self.inventory.get(row, key) + 5)  # 补货5件
             
             execution_result['restocked'] = True
             
@@ -173,47 +195,37 @@ class DroneDeliveryEnvironment:
             execution_result['is_fully_satisfied'] = False
 
         elif execution_result.get('action') == 'redirect_alternative':
-            # ... (查找替代医院并修改 self.hospitals_data 副本库存的代码保持不变，但稍作调整) ...
-             # 找到最近且库存足够的医院并执行派单 (修改副本库存)
+            # 找到最近且库存足够的医院并执行派单 (读写库存增量层)
             user_lon = float(self._user_request.get('longitude', 0.0) or 0.0)
             user_lat = float(self._user_request.get('latitude', 0.0) or 0.0)
-            best = None
-            best_dist = None
-            for idx, hobj in enumerate(self.hospitals_data): # 使用副本
-                # compute distance
-                try:
-                    from math import radians, sin, cos, asin, sqrt
-                    lon2 = float(hobj.get('longitude', 0.0) or 0.0)
-                    lat2 = float(hobj.get('latitude', 0.0) or 0.0)
-                    lon1, lat1, lon2r, lat2r = map(radians, [user_lon, user_lat, lon2, lat2])
-                    dlon = lon2r - lon1
-                    dlat = lat2r - lat1
-                    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2r) * sin(dlon / 2) ** 2
-                    c = 2 * asin(sqrt(a))
-                    dist = 6371.0 * c
-                except Exception:
-                    dist = 1e9
+            needs = [
+                (it.get('name') or str(it.get('id')), int(it.get('quantity', 1)))
+                for it in self._order_medicines or []
+            ]
+            # check sufficiency: 库存倒排索引求交集 (已叠加库存增量层)
+            sufficient = self.inventory.sufficient_rows(needs)
+            best_row, best_dist = None, None
+            if len(sufficient) and self.hospital_arrays.distance_cache is not None:
+                # reset 时已缓存到所有医院的距离, 直接在满足条件的医院中取最近(同距离取行号小的)
+                distances = self.hospital_arrays.distance_cache.distances(user_lat, user_lon)[sufficient]
+                best_row = int(sufficient[np.argmin(distances)])
+                best_dist = float(distances.min())
+            elif len(sufficient):
+                # 没有距离缓存时通过空间索引由近到远查找
+                sufficient_set = set(sufficient.tolist())
+                best_row, best_dist = self.hospital_arrays.spatial_index.nearest_where(
+                    user_lat, user_lon, sufficient_set.__contains__,
+                    lambda row: self.hospital_arrays.exact_distance(user_lat, user_lon, row),
+                )
+            best = self._hospitals_data_template[best_row] if best_row is not None else None
 
-                # check sufficiency (使用副本库存)
-                inv = hobj.get('inventory', {}) or {}
-                ok = True
-                for it in self._order_medicines or []:
-                    key = it.get('name') or str(it.get('id'))
-                    need = int(it.get('quantity', 1))
-                    if int(inv.get(key, 0)) < need:
-                        ok = False
-                        break
-                if ok and (best is None or dist < best_dist):
-                    best = hobj
-                    best_dist = dist
-                    
             if best is not None:
-                # perform decrement on best (修改副本库存)
+                # perform decrement on best (写入库存增量层)
                 for it in self._order_medicines or []:
                     key = it.get('name') or str(it.get('id'))
                     need = int(it.get('quantity', 1))
-                    prev = int(best.get('inventory', {}).get(key, 0))
-                    best.setdefault('inventory', {})[key] = max(0, prev - need) # 修改副本
+                    prev = self.inventory.get(best_row, key)
+                    self.inventory.set(best_row, key, max(0, prev - need))
                 
                 execution_result['redirected_to'] = best.get('id')
                 execution_result['redirected_distance'] = best_dist
@@ -237,24 +249,20 @@ class DroneDeliveryEnvironment:
                 execution_result['travel_minutes'] = 0
 
         elif execution_result.get('action') == 'split_order':
-            # ... (拆单并修改 self.hospitals_data 副本库存的代码保持不变，但稍作调整) ...
-            # 分配订单到多家医院：对每个物品按医院顺序尝试扣减 (修改副本库存)
+            # 分配订单到多家医院：对每个物品按医院顺序尝试扣减 (写入库存增量层)
             assignments = []
             for it in self._order_medicines or []:
                 need = int(it.get('quantity', 1))
                 key = it.get('name') or str(it.get('id'))
                 remaining = need
-                # try to fulfill from hospitals in order (使用副本)
-                for hobj in self.hospitals_data:
+                # try to fulfill from hospitals in order (只遍历倒排索引中有货的医院)
+                for row in self.inventory.rows_with_at_least(key, 1).tolist():
                     if remaining <= 0:
                         break
-                    have = int(hobj.get('inventory', {}).get(key, 0))
-                    if have <= 0:
-                        continue
+                    have = self.inventory.get(row, key)
                     take = min(have, remaining)
-                    # 修改副本库存
-                    hobj.setdefault('inventory', {})[key] = have - take
-                    assignments.append({'hospital_id': hobj.get('id'), 'item': key, 'qty': take})
+                    self.inventory.set(row, key, have - take)
+                    assignments.append({'hospital_id': self._hospitals_data_template[row].get('id'), 'item': key, 'qty': take})
                     remaining -= take
                 # record if fully assigned
                 if remaining > 0:
@@ -274,9 +282,9 @@ class DroneDeliveryEnvironment:
 
         # --- 库存更新逻辑结束 ---
 
-        # 4. 计算下一个状态
+        # 4. 计算下一个状态 (基础库存表 + 增量层)
         next_state = self.state_space.build_state_vector(
-            self._user_request, self.hospitals_data, self._order_medicines
+            self._user_request, self.inventory, self._order_medicines
         )
         
         # 5. 计算奖励 (奖励函数现在可以使用增强后的 execution_result)
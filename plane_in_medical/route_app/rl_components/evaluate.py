@@ -0,0 +1,248 @@
+"""
+离线策略评估
+用任意订单 JSONL(data_pool.jsonl / data_pool_train.jsonl)回放模型检查点和内置基线策略:
+    - dqn: 检查点中 Q 网络的贪婪动作
+    - nearest: 总是选择最近的医院
+    - nearest_sufficient: 选择能满足整单的最近医院, 没有时拆单
+    - random: 均匀随机动作
+订单按分片分给多个进程, 每个进程在分片内用向量化环境按批评估, 最后汇总成表格:
+平均奖励、成功率(整单满足)、平均配送距离, 以及等待/重定向/拆单动作的比例。
+
+用法:
+    python -m plane_in_medical.route_app.rl_components.evaluate --orders data/data_pool.jsonl --workers 4
+"""
+
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import numpy as np
+
+from .rewards import REDIRECT_ALTERNATIVE, SPLIT_ORDER, WAIT_FOR_RESTOCK
+from .vec_environment import VecDroneDeliveryEnvironment
+
+POLICIES = ('dqn', 'nearest', 'nearest_sufficient', 'random')
+
+DATA_DIR = Path(__file__).resolve().parents[2] / 'data'
+DEFAULT_CHECKPOINT = DATA_DIR / 'prepared' / 'dqn_full_checkpoint.pth'
+
+# 子进程中的评估器(由进程池的 initializer 创建)
+_evaluator = None
+
+
+def load_orders(path):
+    orders = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                orders.append(json.loads(line))
+    return orders
+
+
+class PolicyEvaluator:
+    """
+    在一批订单上评估若干策略
+
+    参数:
+        hospitals: 医院数据
+        policies: 要评估的策略名称
+        checkpoint: dqn 策略使用的检查点路径
+        seed: random 策略的随机数种子
+    """
+    def __init__(self, hospitals, policies=POLICIES, checkpoint=DEFAULT_CHECKPOINT, seed=0):
+        unknown = set(policies) - set(POLICIES)
+        if unknown:
+            raise ValueError(f'未知策略: {sorted(unknown)}')
+        self.policies = list(policies)
+        self.env = VecDroneDeliveryEnvironment(hospitals)
+        self.arrays = self.env.hospital_arrays
+        self.num_hospitals = self.env.num_hospitals
+        self.seed = seed
+        self.network = self._load_network(checkpoint) if 'dqn' in self.policies else None
+
+    def _load_network(self, checkpoint):
+        import torch
+        from .agent import DQN
+
+        torch.set_num_threads(1)
+        network = DQN(self.env.state_space.state_dimensions, self.env.action_space.action_size)
+        state = torch.load(checkpoint, map_location=torch.device('cpu'))
+        network.load_state_dict(state.get('q_state_dict', state))
+        network.eval()
+        return network
+
+    def _distances(self, order):
+        latitude = float(order.get('latitude', 0.0) or 0.0)
+        longitude = float(order.get('longitude', 0.0) or 0.0)
+        if self.arrays.distance_cache is not None:
+            return self.arrays.distance_cache.distances(latitude, longitude)
+        return self.arrays.exact_distances(latitude, longitude, range(self.num_hospitals))
+
+    def actions(self, policy, orders, states, batch_id):
+        """
+        某个策略在一批订单上的动作
+        """
+        if policy == 'dqn':
+            import torch
+
+            with torch.no_grad():
+                return self.network(torch.from_numpy(states)).argmax(dim=1).numpy()
+        if policy == 'random':
+            rng = np.random.default_rng([self.seed, batch_id])
+            return rng.integers(self.env.action_space.action_size, size=len(orders))
+        actions = np.empty(len(orders), dtype=np.int64)
+        for i, order in enumerate(orders):
+            distances = self._distances(order)
+            if policy == 'nearest':
+                actions[i] = int(np.argmin(distances))
+                continue
+            # 与环境相同的药品键和默认数量
+            needs = [
+                (item.get('name') or str(item.get('id')), int(item.get('quantity', 1)))
+                for item in order.get('items', []) or []
+            ]
+            rows = self.arrays.sufficient_rows(needs)
+            actions[i] = int(rows[np.argmin(distances[rows])]) if len(rows) else self.num_hospitals + 2
+        return actions
+
+    def evaluate(self, orders, batch_size=512, batch_offset=0):
+        """
+        返回 {策略: 汇总量}, 汇总量可以直接跨分片相加
+        """
+        totals = {policy: _empty_totals() for policy in self.policies}
+        for b, start in enumerate(range(0, len(orders), batch_size)):
+            batch = orders[start:start + batch_size]
+            for policy in self.policies:
+                states = self.env.reset(batch)
+                actions = self.actions(policy, batch, states, batch_offset + b)
+                _, rewards, _, info = self.env.step(actions)
+                _accumulate(totals[policy], rewards, info)
+        return totals
+
+
+def _empty_totals():
+    return {'orders': 0, 'reward': 0.0, 'success': 0, 'distance': 0.0, 'deliveries': 0,
+            'wait': 0, 'redirect': 0, 'split': 0}
+
+
+def _accumulate(totals, rewards, info):
+    kind = info['kind']
+    delivered = info['hospital_row'] >= 0
+    totals['orders'] += len(rewards)
+    totals['reward'] += float(rewards.sum())
+    totals['success'] += int(info['is_fully_satisfied'].sum())
+    totals['distance'] += float(info['distance'][delivered].sum())
+    totals['deliveries'] += int(delivered.sum())
+    totals['wait'] += int((kind == WAIT_FOR_RESTOCK).sum())
+    totals['redirect'] += int((kind == REDIRECT_ALTERNATIVE).sum())
+    totals['split'] += int((kind == SPLIT_ORDER).sum())
+
+
+def _merge(results):
+    merged = {}
+    for totals in results:
+        for policy, values in totals.items():
+            target = merged.setdefault(policy, _empty_totals())
+            for key, value in values.items():
+                target[key] += value
+    return merged
+
+
+def summarize(totals):
+    """
+    汇总量 -> 指标
+    """
+    n = max(totals['orders'], 1)
+    return {
+        'orders': totals['orders'],
+        'avg_reward': totals['reward'] / n,
+        'success_rate': totals['success'] / n,
+        'mean_distance_km': totals['distance'] / totals['deliveries'] if totals['deliveries'] else 0.0,
+        'wait_rate': totals['wait'] / n,
+        'redirect_rate': totals['redirect'] / n,
+        'split_rate': totals['split'] / n,
+    }
+
+
+def _init_worker(hospitals, policies, checkpoint, seed):
+    global _evaluator
+    _evaluator = PolicyEvaluator(hospitals, policies, checkpoint, seed)
+
+
+def _evaluate_shard(task):
+    orders, batch_size, batch_offset = task
+    return _evaluator.evaluate(orders, batch_size, batch_offset)
+
+
+def evaluate_pool(orders, hospitals, policies=POLICIES, checkpoint=DEFAULT_CHECKPOINT,
+                  workers=1, batch_size=512, seed=0):
+    """
+    在整个订单池上评估, workers > 1 时按分片在多个进程中并行
+    返回: {策略: 指标}
+    """
+    # 分片按批对齐, 保证 random 策略的随机数与分片方式无关
+    num_batches = (len(orders) + batch_size - 1) // batch_size
+    shards = [
+        (orders[s * batch_size:e * batch_size], batch_size, s)
+        for s, e in _split_range(num_batches, max(1, workers))
+    ]
+    if workers <= 1:
+        _init_worker(hospitals, policies, checkpoint, seed)
+        results = [_evaluate_shard(shard) for shard in shards]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=get_context('spawn'),
+            initializer=_init_worker, initargs=(hospitals, policies, checkpoint, seed),
+        ) as pool:
+            results = list(pool.map(_evaluate_shard, shards))
+    merged = _merge(results)
+    return {policy: summarize(merged[policy]) for policy in policies}
+
+
+def _split_range(n, parts):
+    bounds = np.linspace(0, n, min(parts, max(n, 1)) + 1).astype(int)
+    return [(int(s), int(e)) for s, e in zip(bounds[:-1], bounds[1:]) if e > s]
+
+
+def format_table(metrics):
+    columns = ('orders', 'avg_reward', 'success_rate', 'mean_distance_km', 'wait_rate', 'redirect_rate', 'split_rate')
+    width = max(len('policy'), *(len(p) for p in metrics))
+    lines = [' '.join([f"{'policy':<{width}}"] + [f'{c:>16}' for c in columns])]
+    for policy, values in metrics.items():
+        cells = [f'{values[c]:>16d}' if c == 'orders' else f'{values[c]:>16.4f}' for c in columns]
+        lines.append(' '.join([f'{policy:<{width}}'] + cells))
+    return '\n'.join(lines)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description='离线评估 DQN 检查点与基线策略')
+    parser.add_argument('--orders', type=str, default=str(DATA_DIR / 'data_pool.jsonl'), help='订单 JSONL 文件')
+    parser.add_argument('--hospitals', type=str, default=str(DATA_DIR / 'hospitals.json'))
+    parser.add_argument('--checkpoint', type=str, default=str(DEFAULT_CHECKPOINT))
+    parser.add_argument('--policies', type=str, default=','.join(POLICIES), help='逗号分隔的策略名称')
+    parser.add_argument('--workers', type=int, default=1, help='评估进程数')
+    parser.add_argument('--batch_size', type=int, default=512)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', type=str, default=None, help='把结果另存为 JSON')
+    args = parser.parse_args()
+
+    orders = load_orders(args.orders)
+    with open(args.hospitals, 'r', encoding='utf-8') as f:
+        hospitals = json.load(f)
+    policies = [p.strip() for p in args.policies.split(',') if p.strip()]
+
+    start = time.time()
+    metrics = evaluate_pool(orders, hospitals, policies, args.checkpoint, args.workers, args.batch_size, args.seed)
+    elapsed = time.time() - start
+    print(format_table(metrics))
+    print(f'{len(orders)} orders x {len(policies)} policies in {elapsed:.1f}s ({args.workers} workers)')
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(metrics, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+"""
+推理模型导出
+把检查点中的 Q 网络导出为推理格式, 供决策服务按 ROUTE_MODEL_FORMAT 加载:
+    - eager: 原始的 DQN 模块(fp32), 不需要导出
+    - numpy: 权重导出为 .npz, 用纯 NumPy 做前向计算(见 numpy_policy), web 进程不需要导入 torch
+    - script: 冻结的 TorchScript(fp32), 省去 Python 层的模块调度, 单条推理的 CPU 时间约减半
+    - int8: 线性层动态量化为 int8 后再转为 TorchScript, 批量推理更快, 但有量化误差
+      (当前状态特征未归一化, Q 值范围很大, 量化后贪婪动作与 eager 大量不一致, 导出时会被一致性检查拒绝)
+导出文件与检查点放在同一目录: dqn_full_checkpoint.pth -> dqn_full_checkpoint.npz / .script.pt / .int8.pt
+
+用法:
+    python -m plane_in_medical.route_app.rl_components.export --formats numpy,script,int8 --benchmark
+导出前在订单池上检查贪婪动作与 eager 的一致率, 低于 --min_agreement 时不写出文件;
+--benchmark 再比较各格式单条/批量推理的 p50/p99 延迟。
+"""
+
+import json
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+from .numpy_policy import NumpyQNetwork, content_hash, npz_path
+
+# torch 只在函数内导入: 决策服务使用 numpy 格式时会导入本模块, 但不应导入 torch
+MODEL_FORMATS = ('eager', 'script', 'int8', 'numpy')
+
+DATA_DIR = Path(__file__).resolve().parents[2] / 'data'
+DEFAULT_CHECKPOINT = DATA_DIR / 'prepared' / 'dqn_full_checkpoint.pth'
+
+
+def exported_path(checkpoint, model_format):
+    if model_format == 'numpy':
+        return npz_path(checkpoint)
+    checkpoint = Path(checkpoint)
+    return checkpoint.with_name(f'{checkpoint.stem}.{model_format}.pt')
+
+
+def load_eager(checkpoint, state_size, action_size):
+    import torch
+    from .agent import DQN
+
+    network = DQN(state_size, action_size)
+    state = torch.load(checkpoint, map_location=torch.device('cpu'))
+    network.load_state_dict(state['q_state_dict'])
+    network.eval()
+    return network
+
+
+def convert(network, model_format):
+    """
+    eager 的 DQN -> 指定格式的推理模块
+    """
+    if model_format not in MODEL_FORMATS:
+        raise ValueError(f'未知模型格式: {model_format}')
+    if model_format == 'eager':
+        return network
+    if model_format == 'numpy':
+        return NumpyQNetwork.from_state_dict(network.state_dict())
+    import torch
+
+    # torch.jit 和 torch.ao.quantization 在新版本中会给出弃用警告, 这里的用法仍然受支持
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        if model_format == 'int8':
+            network = torch.ao.quantization.quantize_dynamic(network, {torch.nn.Linear}, dtype=torch.qint8)
+        scripted = torch.jit.script(network.eval())
+        if model_format == 'script':
+            scripted = torch.jit.freeze(scripted)
+    return scripted
+
+
+def argmax_agreement(network, reference, states):
+    return float((predict(network, states).argmax(axis=1) == predict(reference, states).argmax(axis=1)).mean())
+
+
+def export_model(checkpoint, model_format, state_size, action_size, output=None,
+                 validation_states=None, min_agreement=1.0):
+    """
+    导出检查点, 返回导出文件路径
+    给出 validation_states 时, 贪婪动作与 eager 的一致率低于 min_agreement 则抛出 ValueError, 不写出文件
+    """
+    output = Path(output) if output is not None else exported_path(checkpoint, model_format)
+    eager = load_eager(checkpoint, state_size, action_size)
+    module = convert(eager, model_format)
+    if model_format == 'numpy':
+        # 加载时据此判断导出文件是否对应当前检查点
+        module.source_hash = content_hash(checkpoint)
+    if validation_states is not None:
+        agreement = argmax_agreement(module, eager, validation_states)
+        if agreement < min_agreement:
+            raise ValueError(f'{model_format} 的贪婪动作与 eager 一致率只有 {agreement:.2%}, 未导出')
+    if model_format == 'numpy':
+        module.save(output)
+        return output
+    import torch
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        torch.jit.save(module, str(output))
+    return output
+
+
+def load_exported(path):
+    if Path(path).suffix == '.npz':
+        return NumpyQNetwork.load(path)
+    import torch
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        module = torch.jit.load(str(path), map_location=torch.device('cpu'))
+    module.eval()
+    return module
+
+
+def predict(network, states):
+    if isinstance(network, NumpyQNetwork):
+        return network(states)
+    import torch
+
+    with torch.inference_mode():
+        return network(torch.as_tensor(states, dtype=torch.float32)).numpy()
+
+
+def latency(network, states, batch_size, repeats=2000, warmup=200):
+    """
+    与决策服务相同的调用方式(NumPy -> 张量 -> Q 值), 返回 (p50, p99) 微秒
+    """
+    rng = np.random.default_rng(0)
+    starts = rng.integers(0, max(len(states) - batch_size, 0) + 1, size=warmup + repeats)
+    timings = np.empty(repeats)
+    for i, start in enumerate(starts):
+        batch = states[start:start + batch_size]
+        began = time.perf_counter()
+        predict(network, batch)
+        if i >= warmup:
+            timings[i - warmup] = time.perf_counter() - began
+    p50, p99 = np.percentile(timings, [50, 99]) * 1e6
+    return float(p50), float(p99)
+
+
+def benchmark(networks, states, batch_size=32, repeats=2000):
+    """
+    networks: {格式: 推理模块}, 必须包含 eager 作为参照
+    返回: {格式: 指标}
+    """
+    reference = predict(networks['eager'], states)
+    reference_actions = reference.argmax(axis=1)
+    results = {}
+    for model_format, network in networks.items():
+        q_values = predict(network, states)
+        single = latency(network, states, 1, repeats)
+        batched = latency(network, states, batch_size, repeats)
+        results[model_format] = {
+            'single_p50_us': single[0],
+            'single_p99_us': single[1],
+            'batch_p50_us': batched[0],
+            'batch_p99_us': batched[1],
+            'argmax_agreement': float((q_values.argmax(axis=1) == reference_actions).mean()),
+            'max_abs_q_error': float(np.abs(q_values - reference).max()),
+        }
+    return results
+
+
+def format_table(results, batch_size):
+    columns = ('single_p50_us', 'single_p99_us', 'batch_p50_us', 'batch_p99_us', 'argmax_agreement', 'max_abs_q_error')
+    lines = [f'batch = {batch_size}', ' '.join([f"{'format':<8}"] + [f'{c:>17}' for c in columns])]
+    for model_format, values in results.items():
+        lines.append(' '.join([f'{model_format:<8}'] + [f'{values[c]:>17.4f}' for c in columns]))
+    return '\n'.join(lines)
+
+
+def main():
+    import argparse
+    from .evaluate import load_orders
+    from .states import state_space
+    from .vec_environment import VecDroneDeliveryEnvironment
+
+    parser = argparse.ArgumentParser(description='导出 TorchScript / int8 推理模型并做延迟对比')
+    parser.add_argument('--checkpoint', type=str, default=str(DEFAULT_CHECKPOINT))
+    parser.add_argument('--formats', type=str, default='numpy,script,int8', help='逗号分隔: numpy, script, int8')
+    parser.add_argument('--min_agreement', type=float, default=1.0, help='导出要求的贪婪动作一致率')
+    parser.add_argument('--benchmark', action='store_true', help='导出后在订单池上做延迟和一致性对比')
+    parser.add_argument('--orders', type=str, default=str(DATA_DIR / 'data_pool.jsonl'))
+    parser.add_argument('--hospitals', type=str, default=str(DATA_DIR / 'hospitals.json'))
+    parser.add_argument('--batch_size', type=int, default=32, help='批量推理的批大小')
+    parser.add_argument('--repeats', type=int, default=2000)
+    parser.add_argument('--json', type=str, default=None, help='把对比结果另存为 JSON')
+    args = parser.parse_args()
+
+    with open(args.hospitals, 'r', encoding='utf-8') as f:
+        hospitals = json.load(f)
+    env = VecDroneDeliveryEnvironment(hospitals)
+    state_size, action_size = state_space.state_dimensions, env.action_space.action_size
+
+    orders = load_orders(args.orders)
+    states = env.reset(orders)
+    formats = [f.strip() for f in args.formats.split(',') if f.strip() and f.strip() != 'eager']
+    networks = {'eager': load_eager(args.checkpoint, state_size, action_size)}
+    for model_format in formats:
+        try:
+            path = export_model(args.checkpoint, model_format, state_size, action_size,
+                                validation_states=states, min_agreement=args.min_agreement)
+        except ValueError as e:
+            print(e)
+            # 没通过检查的格式仍参与对比, 便于查看量化误差
+            networks[model_format] = convert(load_eager(args.checkpoint, state_size, action_size), model_format)
+            continue
+        print(f'已导出 {model_format}: {path}')
+        networks[model_format] = load_exported(path)
+
+    if args.benchmark:
+        import torch
+
+        # 共享主机上每个 web 进程按单核计算 CPU 时间
+        torch.set_num_threads(1)
+        results = benchmark(networks, states, args.batch_size, args.repeats)
+        print(f'{len(orders)} orders')
+        print(format_table(results, args.batch_size))
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
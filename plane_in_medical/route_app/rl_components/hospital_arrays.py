@@ -0,0 +1,196 @@
+"""
+医院数据的数组表示
+把医院列表(字典)转换成坐标数组 + 库存矩阵(医院 × 药品), 供向量化的状态构建使用
+"""
+
+import math
+from functools import cached_property
+
+import numpy as np
+
+from .distance_cache import DEFAULT_CACHE_SIZE, DistanceCache
+from .spatial_index import HospitalSpatialIndex
+from .stock_index import StockIndex
+
+# 地球半径(公里), 与 StateSpace._calculate_distance 保持一致
+EARTH_RADIUS_KM = 6371.0
+
+
+def exact_map(fn, values):
+    """
+    对数组逐元素调用 math 中的函数
+
+    numpy 的 SIMD 版超越函数与 libm 在最后一位上可能不同,
+    进入状态向量的距离特征需要与 math 实现逐位一致(已训练模型依赖这些特征)。
+    """
+    values = np.asarray(values, dtype=np.float64)
+    return np.fromiter(map(fn, values.ravel()), dtype=np.float64, count=values.size).reshape(values.shape)
+
+
+class HospitalArrays:
+    """
+    数组形式的医院数据
+
+    属性:
+        hospitals: 原始医院字典列表(行号与数组下标一一对应)
+        latitudes / longitudes: 医院坐标(角度), 形状 (H,)
+        medicine_index: 药品名称 -> 库存矩阵列号
+        inventory: 库存矩阵, 形状 (H, M + 1), 最后一列恒为 0, 用于不在任何医院库存中的药品
+        total_inventory: 每家医院的库存总量, 形状 (H,)
+        spatial_index: 医院坐标的 k-d 树索引(首次使用时构建)
+        stock_index: 药品 -> 医院库存的倒排索引(首次使用时构建)
+        distance_cache: 用户位置 -> 所有医院距离的缓存, distance_cache_size 为 0 时为 None
+    """
+    def __init__(self, hospitals_data, distance_cache_size=DEFAULT_CACHE_SIZE, distance_cache_cell=None):
+        self.hospitals = list(hospitals_data)
+        self.latitudes = np.array([float(h.get('latitude', 0)) for h in self.hospitals], dtype=np.float64)
+        self.longitudes = np.array([float(h.get('longitude', 0)) for h in self.hospitals], dtype=np.float64)
+        self.lat_radians = np.radians(self.latitudes)
+        self.lon_radians = np.radians(self.longitudes)
+        self.cos_lat = exact_map(math.cos, self.lat_radians)
+        # 逐行精确计算距离时使用的 Python 浮点列表
+        self._coordinate_lists = (self.lat_radians.tolist(), self.lon_radians.tolist(), self.cos_lat.tolist())
+
+        names = []
+        seen = set()
+        for h in self.hospitals:
+            for name in (h.get('inventory') or {}):
+                if name not in seen:
+                    seen.add(name)
+                    names.append(name)
+        self.medicine_index = {name: col for col, name in enumerate(names)}
+        self.unknown_column = len(names)
+
+        self.inventory = np.zeros((len(self.hospitals), len(names) + 1), dtype=np.int64)
+        for row, h in enumerate(self.hospitals):
+            for name, qty in (h.get('inventory') or {}).items():
+                self.inventory[row, self.medicine_index[name]] = int(qty)
+        self.total_inventory = self.inventory.sum(axis=1)
+
+        # 缓存与医院坐标绑定, 医院数据变化时随 HospitalArrays 一起重建
+        self.distance_cache = (
+            DistanceCache(self, max_entries=distance_cache_size, cell_degrees=distance_cache_cell)
+            if distance_cache_size else None
+        )
+
+    def __len__(self):
+        return len(self.hospitals)
+
+    @cached_property
+    def spatial_index(self):
+        return HospitalSpatialIndex(self.latitudes, self.longitudes)
+
+    @cached_property
+    def stock_index(self):
+        return StockIndex(self)
+
+    def get(self, row, key, default=0):
+        """
+        某医院某药品的库存
+        """
+        col = self.medicine_index.get(key)
+        return int(self.inventory[row, col]) if col is not None else default
+
+    def rows_with_at_least(self, medicine_name, quantity):
+        """
+        该药品库存不少于 quantity 的医院行号(升序)
+        """
+        return self.stock_index.rows_with_at_least(medicine_name, quantity)
+
+    def sufficient_rows(self, needs):
+        """
+        能同时满足 needs = [(药品名称, 需求数量), ...] 的医院行号(升序)
+        """
+        return self.stock_index.sufficient_rows(needs)
+
+    def column_of(self, medicine_name):
+        """
+        药品名称对应的库存矩阵列号, 未知药品返回恒为 0 的那一列
+        """
+        return self.medicine_index.get(medicine_name, self.unknown_column)
+
+    def order_columns(self, order_medicines):
+        """
+        订单中每个药品对应的列号与需求数量
+        返回: (columns, quantities), 两个长度为订单药品数的 int64 数组
+        """
+        columns = np.fromiter(
+            (self.column_of(item.get('name', '')) for item in order_medicines),
+            dtype=np.int64, count=len(order_medicines)
+        )
+        quantities = np.fromiter(
+            (int(item.get('quantity', 0)) for item in order_medicines),
+            dtype=np.int64, count=len(order_medicines)
+        )
+        return columns, quantities
+
+    def ordered_inventory(self, order_medicines):
+        """
+        订单药品在各医院的库存
+        返回: (inventory, quantities), 形状 (H, L) 与 (L,), L 为订单药品数
+        """
+        columns, quantities = self.order_columns(order_medicines)
+        return self.inventory[:, columns], quantities
+
+    def order_columns_batch(self, order_item_lists):
+        """
+        把多个订单的药品补齐成等长的二维数组
+        返回: (columns, quantities, mask), 形状均为 (N, L), L 为最长订单的药品数;
+              补齐位置的列号指向恒为 0 的那一列, 数量为 0, mask 为 False
+        """
+        n = len(order_item_lists)
+        width = max((len(items) for items in order_item_lists), default=0)
+        columns = np.full((n, width), self.unknown_column, dtype=np.int64)
+        quantities = np.zeros((n, width), dtype=np.int64)
+        mask = np.zeros((n, width), dtype=bool)
+        for i, items in enumerate(order_item_lists):
+            if items:
+                columns[i, :len(items)], quantities[i, :len(items)] = self.order_columns(items)
+                mask[i, :len(items)] = True
+        return columns, quantities, mask
+
+    def distances_from(self, latitude, longitude):
+        """
+        一次向量化计算用户位置到所有医院的 Haversine 距离(公里)
+        latitude/longitude 为标量时返回 (H,), 为 (N,) 数组时返回 (N, H)
+
+        numpy 的 SIMD 超越函数与 libm 可能相差几个 ulp, 这里的结果只保证在 1e-12 量级内
+        与 StateSpace._calculate_distance 一致; 需要逐位一致的场合使用 exact_distances
+        """
+        lat1 = np.radians(np.asarray(latitude, dtype=np.float64))[..., None]
+        lon1 = np.radians(np.asarray(longitude, dtype=np.float64))[..., None]
+        sin_dlat = np.sin((self.lat_radians - lat1) / 2)
+        sin_dlon = np.sin((self.lon_radians - lon1) / 2)
+        a = sin_dlat * sin_dlat + np.cos(lat1) * self.cos_lat * (sin_dlon * sin_dlon)
+        distances = EARTH_RADIUS_KM * (2 * np.arcsin(np.sqrt(a)))
+        return distances if np.ndim(latitude) else distances.reshape(-1)
+
+    def exact_distance(self, latitude, longitude, row):
+        """
+        到单个医院的距离, 与 exact_distances 逐位一致
+        """
+        lat_radians, lon_radians, cos_lat = self._coordinate_lists
+        lat1 = math.radians(float(latitude))
+        lon1 = math.radians(float(longitude))
+        dlon = lon_radians[row] - lon1
+        dlat = lat_radians[row] - lat1
+        a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * cos_lat[row] * math.sin(dlon / 2) ** 2
+        return EARTH_RADIUS_KM * (2 * math.asin(math.sqrt(a)))
+
+    def exact_distances(self, latitude, longitude, rows):
+        """
+        计算到指定医院的距离, 与 StateSpace._calculate_distance 逐位一致
+        (逐行走 math, 只适合少量候选医院)
+
+        参数:
+            latitude/longitude: 标量, 或与 rows 等长的序列(逐对计算)
+            rows: 医院行号序列
+        返回:
+            np.ndarray, 与 rows 等长
+        """
+        rows = list(rows)
+        if np.ndim(latitude) == 0:
+            latitude = [latitude] * len(rows)
+            longitude = [longitude] * len(rows)
+        distances = [self.exact_distance(lat, lon, row) for lat, lon, row in zip(latitude, longitude, rows)]
+        return np.array(distances, dtype=np.float64)
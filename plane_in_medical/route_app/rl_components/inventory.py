@@ -0,0 +1,197 @@
+"""
+写时复制的库存增量层
+基础库存表(HospitalArrays / 医院数据模板)只读, 环境 step() 中的扣减、补货都写入稀疏的增量层,
+reset() 只需清空增量层, 代价与改动过的条目数成正比, 不再深拷贝全部医院数据。
+"""
+
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+
+class InventoryOverlay:
+    """
+    叠加在基础库存表之上的稀疏增量层
+
+    参数:
+        arrays: HospitalArrays, 提供医院行号、坐标和基础库存
+    """
+    def __init__(self, arrays):
+        self.arrays = arrays
+        # 行号 -> {药品名: 数量}, 只记录被改动过的条目
+        self._changes = {}
+        # 药品名 -> 改动过该药品的行号集合, 用于修正倒排索引的查询结果
+        self._rows_by_key = {}
+
+    def __len__(self):
+        return len(self.arrays)
+
+    # 坐标与距离计算不受库存影响, 直接使用基础表
+    @property
+    def latitudes(self):
+        return self.arrays.latitudes
+
+    @property
+    def longitudes(self):
+        return self.arrays.longitudes
+
+    @property
+    def spatial_index(self):
+        return self.arrays.spatial_index
+
+    @property
+    def distance_cache(self):
+        return self.arrays.distance_cache
+
+    def distances_from(self, latitude, longitude):
+        return self.arrays.distances_from(latitude, longitude)
+
+    def exact_distance(self, latitude, longitude, row):
+        return self.arrays.exact_distance(latitude, longitude, row)
+
+    def exact_distances(self, latitude, longitude, rows):
+        return self.arrays.exact_distances(latitude, longitude, rows)
+
+    def base_quantity(self, row, key):
+        """
+        基础库存表中的数量(不含增量)
+        """
+        col = self.arrays.medicine_index.get(key)
+        return int(self.arrays.inventory[row, col]) if col is not None else 0
+
+    def get(self, row, key, default=0):
+        """
+        读取某医院某药品的当前库存
+        """
+        changed = self._changes.get(row)
+        if changed is not None and key in changed:
+            return changed[key]
+        col = self.arrays.medicine_index.get(key)
+        return int(self.arrays.inventory[row, col]) if col is not None else default
+
+    def rows_with_at_least(self, key, quantity):
+        """
+        当前库存不少于 quantity 的医院行号(升序)
+        基础库存走倒排索引, 再用增量层中改动过该药品的医院修正
+        """
+        rows = self.arrays.rows_with_at_least(key, quantity)
+        if quantity <= 0:
+            return rows
+        changed_rows = self._rows_by_key.get(key)
+        if not changed_rows:
+            return rows
+        mask = np.zeros(len(self), dtype=bool)
+        mask[rows] = True
+        for row in changed_rows:
+            mask[row] = self._changes[row][key] >= quantity
+        return np.flatnonzero(mask)
+
+    def sufficient_rows(self, needs):
+        """
+        当前库存能同时满足 needs = [(药品名称, 需求数量), ...] 的医院行号(升序)
+        """
+        result = None
+        for key, quantity in needs:
+            rows = self.rows_with_at_least(key, quantity)
+            result = rows if result is None else np.intersect1d(result, rows, assume_unique=True)
+            if not len(result):
+                break
+        return np.arange(len(self), dtype=np.int64) if result is None else result
+
+    def set(self, row, key, quantity):
+        """
+        写入某医院某药品的库存(只写增量层)
+        """
+        self._changes.setdefault(row, {})[key] = int(quantity)
+        self._rows_by_key.setdefault(key, set()).add(row)
+
+    def clear(self):
+        """
+        丢弃所有改动, 恢复到基础库存
+        """
+        self._changes.clear()
+        self._rows_by_key.clear()
+
+    def changed_rows(self):
+        return list(self._changes)
+
+    def inventory_view(self, row):
+        """
+        某医院当前库存的只读映射视图
+        """
+        return OverlayInventory(self, row)
+
+    @property
+    def total_inventory(self):
+        """
+        每家医院当前的库存总量, 形状 (H,)
+        """
+        if not self._changes:
+            return self.arrays.total_inventory
+        totals = self.arrays.total_inventory.copy()
+        for row, changed in self._changes.items():
+            totals[row] += sum(qty - self.base_quantity(row, key) for key, qty in changed.items())
+        return totals
+
+    def ordered_inventory(self, order_medicines):
+        """
+        订单药品在各医院的当前库存, 与 HospitalArrays.ordered_inventory 含义相同
+        返回: (inventory, quantities), 形状 (H, L) 与 (L,)
+        """
+        inventory, quantities = self.arrays.ordered_inventory(order_medicines)
+        if self._changes:
+            inventory = inventory.copy()
+            names = [item.get('name', '') for item in order_medicines]
+            for row, changed in self._changes.items():
+                for j, name in enumerate(names):
+                    if name in changed:
+                        inventory[row, j] = changed[name]
+        return inventory, quantities
+
+
+class OverlayInventory(Mapping):
+    """
+    单个医院库存的只读视图: 先查增量层, 再查医院数据模板中的库存字典
+    """
+    def __init__(self, overlay, row):
+        self._overlay = overlay
+        self._row = row
+        self._base = overlay.arrays.hospitals[row].get('inventory') or {}
+
+    def __getitem__(self, key):
+        changed = self._overlay._changes.get(self._row)
+        if changed is not None and key in changed:
+            return changed[key]
+        return self._base[key]
+
+    def __iter__(self):
+        yield from self._base
+        for key in self._overlay._changes.get(self._row, ()):
+            if key not in self._base:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class OverlayHospitals(Sequence):
+    """
+    医院列表的只读视图, 每个元素是医院字典的浅拷贝, 其中 inventory 为 OverlayInventory
+    用于兼容按医院字典列表读取数据的代码(如 ActionSpace.execute_action)
+    """
+    def __init__(self, overlay):
+        self._overlay = overlay
+
+    def __len__(self):
+        return len(self._overlay)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        hospital = dict(self._overlay.arrays.hospitals[index])
+        hospital['inventory'] = self._overlay.inventory_view(index)
+        return hospital
@@ -0,0 +1,117 @@
+"""
+纯 NumPy 的 Q 网络推理
+决策服务只需要 DQN 的前向计算(36 -> 128 -> 128 -> 73 的三层全连接), 不需要 torch:
+    - export_npz 把检查点中的 q_state_dict 导出为 .npz(约 120KB), 并记录检查点的内容哈希
+    - NumpyQNetwork 从 .npz 加载权重, 用 float32 矩阵乘法和 ReLU 完成前向计算
+web 进程使用 numpy 格式时不会导入 torch, 省去 torch 的导入时间和几百 MB 内存。
+导出和校验(与 torch 的贪婪动作比较)仍然需要 torch, 只在离线执行。
+"""
+
+import hashlib
+from pathlib import Path
+
+import numpy as np
+
+# 与 agent.DQN 的层名一致
+LAYERS = ('fc1', 'fc2', 'fc3')
+
+
+def content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def npz_path(checkpoint):
+    checkpoint = Path(checkpoint)
+    return checkpoint.with_name(f'{checkpoint.stem}.npz')
+
+
+class NumpyQNetwork:
+    """
+    与 agent.DQN 等价的前向计算
+
+    参数:
+        weights: [(weight, bias), ...], weight 形状为 (输出, 输入), 与 torch.nn.Linear 相同
+        source_hash: 导出来源检查点的内容哈希
+    """
+    def __init__(self, weights, source_hash=None):
+        # 预先转置并保证内存连续, 前向计算时直接做 x @ W
+        self.layers = [
+            (np.ascontiguousarray(np.asarray(w, dtype=np.float32).T), np.asarray(b, dtype=np.float32))
+            for w, b in weights
+        ]
+        self.source_hash = source_hash
+        self.state_size = self.layers[0][0].shape[0]
+        self.action_size = self.layers[-1][0].shape[1]
+
+    @classmethod
+    def from_state_dict(cls, state_dict, source_hash=None):
+        """
+        state_dict: q_state_dict(torch 张量或 NumPy 数组)
+        """
+        def to_numpy(value):
+            return value.detach().cpu().numpy() if hasattr(value, 'detach') else np.asarray(value)
+
+        return cls(
+            [(to_numpy(state_dict[f'{name}.weight']), to_numpy(state_dict[f'{name}.bias'])) for name in LAYERS],
+            source_hash,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            weights = [(data[f'{name}.weight'], data[f'{name}.bias']) for name in LAYERS]
+            source_hash = str(data['source_hash']) if 'source_hash' in data.files else None
+        return cls(weights, source_hash)
+
+    def save(self, path):
+        arrays = {}
+        for name, (w, b) in zip(LAYERS, self.layers):
+            arrays[f'{name}.weight'] = w.T
+            arrays[f'{name}.bias'] = b
+        if self.source_hash is not None:
+            arrays['source_hash'] = np.array(self.source_hash)
+        # 通过文件对象写入, 避免 np.savez 自动追加扩展名
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    def __call__(self, states):
+        """
+        (B, state_size) -> (B, action_size) 的 Q 值
+        """
+        x = np.asarray(states, dtype=np.float32)
+        last = len(self.layers) - 1
+        for i, (w, b) in enumerate(self.layers):
+            x = x @ w
+            x += b
+            if i < last:
+                np.maximum(x, 0.0, out=x)
+        return x
+
+
+def predict_q(network, states):
+    """
+    NumpyQNetwork 或 torch 模块的批量 Q 值, 返回 NumPy 数组
+    """
+    if isinstance(network, NumpyQNetwork):
+        return network(states)
+    import torch
+
+    with torch.no_grad():
+        return network(torch.as_tensor(states, dtype=torch.float32)).cpu().numpy()
+
+
+def export_npz(checkpoint, output=None):
+    """
+    导出检查点的 q_state_dict, 返回 (导出文件路径, NumpyQNetwork)
+    """
+    import torch
+
+    output = Path(output) if output is not None else npz_path(checkpoint)
+    state = torch.load(checkpoint, map_location=torch.device('cpu'))
+    network = NumpyQNetwork.from_state_dict(state['q_state_dict'], content_hash(checkpoint))
+    network.save(output)
+    return output, network
@@ -0,0 +1,245 @@
+"""
+经验回放缓冲区
+预分配的环形缓冲区: states / actions / rewards / next_states / dones 各是一块连续的 NumPy 数组,
+写入是 O(1) 的下标赋值, 采样用一次向量化下标取出整批, 可以直接转成张量, 不再逐条拼列表。
+缓冲区可以保存到 .npz 文件并重新加载, 用于中断后继续训练。
+"""
+
+import numpy as np
+
+# 默认容量, 与原先 deque(maxlen=50000) 一致
+DEFAULT_CAPACITY = 50000
+
+
+class ReplayBuffer:
+    """
+    环形经验回放缓冲区, 写满后覆盖最旧的经验
+
+    参数:
+        capacity: 最多保存的经验条数
+        state_size: 状态向量维度
+    """
+    def __init__(self, capacity=DEFAULT_CAPACITY, state_size=None):
+        if capacity < 1:
+            raise ValueError('capacity 必须大于 0')
+        self.capacity = int(capacity)
+        self.state_size = state_size
+        self.position = 0
+        self.size = 0
+        self.states = None
+        # 数组在第一次写入时按容量一次性分配, 只做推理的智能体不占用这部分内存
+        if state_size is not None:
+            self._allocate(state_size)
+
+    def _allocate(self, state_size):
+        self.state_size = int(state_size)
+        self.states = np.zeros((self.capacity, self.state_size), dtype=np.float32)
+        self.actions = np.zeros(self.capacity, dtype=np.int64)
+        self.rewards = np.zeros(self.capacity, dtype=np.float32)
+        self.next_states = np.zeros((self.capacity, self.state_size), dtype=np.float32)
+        self.dones = np.zeros(self.capacity, dtype=bool)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, action, reward, next_state, done):
+        """
+        写入一条经验
+        """
+        if self.states is None:
+            self._allocate(len(state))
+        i = self.position
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def sample_indices(self, batch_size):
+        """
+        随机抽取 batch_size 个下标(有放回抽样, 代价与缓冲区大小无关)
+        """
+        return np.random.randint(0, self.size, size=batch_size)
+
+    def sample(self, batch_size):
+        """
+        随机抽取一批经验
+        返回: (states, actions, rewards, next_states, dones) 五个数组
+        """
+        idx = self.sample_indices(batch_size)
+        return self.states[idx], self.actions[idx], self.rewards[idx], self.next_states[idx], self.dones[idx]
+
+    def save(self, path):
+        """
+        按时间顺序(最旧的在前)保存已写入的经验到 .npz 文件
+        """
+        # 传入文件对象, 避免 np.savez 自动给路径追加 .npz 后缀
+        with open(path, 'wb') as f:
+            np.savez(f, **self._saved_arrays())
+
+    def _saved_arrays(self):
+        if self.states is None:
+            # 还没有写入过经验, 保存一个空缓冲区
+            empty = np.zeros((0, self.state_size or 0), dtype=np.float32)
+            return {
+                'states': empty, 'actions': np.zeros(0, dtype=np.int64), 'rewards': np.zeros(0, dtype=np.float32),
+                'next_states': empty, 'dones': np.zeros(0, dtype=bool),
+            }
+        order = self._chronological()
+        return {
+            'states': self.states[order],
+            'actions': self.actions[order],
+            'rewards': self.rewards[order],
+            'next_states': self.next_states[order],
+            'dones': self.dones[order],
+        }
+
+    def load(self, path):
+        """
+        从 save 保存的文件恢复经验; 文件中的经验多于容量时只保留最新的 capacity 条
+        """
+        with np.load(path) as data:
+            states = data['states']
+            n = min(len(states), self.capacity)
+            if n and (self.states is None or self.state_size != states.shape[1]):
+                self._allocate(states.shape[1])
+            self.size = n
+            self.position = n % self.capacity
+            if n:
+                self.states[:n] = states[-n:]
+                self.actions[:n] = data['actions'][-n:]
+                self.rewards[:n] = data['rewards'][-n:]
+                self.next_states[:n] = data['next_states'][-n:]
+                self.dones[:n] = data['dones'][-n:]
+            self._loaded(data, n)
+        return self
+
+    def _loaded(self, data, n):
+        """
+        load 恢复出 n 条经验后的钩子, 子类用来恢复额外的状态
+        """
+
+    def _chronological(self):
+        if self.size < self.capacity:
+            return np.arange(self.size)
+        return (np.arange(self.capacity) + self.position) % self.capacity
+
+
+class SumTree:
+    """
+    求和树: 叶子保存每条经验的优先级, 内部节点保存子树优先级之和
+    按前缀和查找叶子与更新优先级都是 O(log n), 并且整批下标一起向量化处理
+
+    参数:
+        capacity: 叶子数
+    """
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        # 叶子数补齐到 2 的幂, 节点 i 的子节点为 2i / 2i+1, 根为节点 1
+        self.leaf_count = 1 << max(0, (self.capacity - 1).bit_length())
+        self.depth = self.leaf_count.bit_length() - 1
+        self.tree = np.zeros(2 * self.leaf_count, dtype=np.float64)
+
+    @property
+    def total(self):
+        return float(self.tree[1])
+
+    def priorities(self, indices):
+        return self.tree[self.leaf_count + np.asarray(indices)]
+
+    def update(self, indices, priorities):
+        """
+        设置一批叶子的优先级, 并逐层向上更新父节点的和
+        """
+        nodes = self.leaf_count + np.asarray(indices, dtype=np.int64)
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        """
+        前缀和 -> 叶子下标: 对每个 value 找到第一个累计优先级超过它的叶子
+        """
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            go_right = values >= left_sum
+            values = np.where(go_right, values - left_sum, values)
+            nodes = np.where(go_right, left + 1, left)
+        return nodes - self.leaf_count
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    优先经验回放: 按 (|TD 误差| + eps) ** alpha 的比例抽样, 并返回重要性采样权重
+
+    参数:
+        capacity / state_size: 同 ReplayBuffer
+        alpha: 优先级指数, 0 时退化为均匀抽样
+        beta: 重要性采样修正指数, 训练中逐步增加到 1
+        eps: 加到 |TD 误差| 上的小常数, 保证每条经验都有机会被抽到
+    """
+    def __init__(self, capacity=DEFAULT_CAPACITY, state_size=None, alpha=0.6, beta=0.4, eps=1e-6):
+        super().__init__(capacity, state_size)
+        self.alpha = alpha
+        self.beta = beta
+        self.eps = eps
+        self.sum_tree = SumTree(self.capacity)
+        # 新经验使用目前见过的最大优先级, 保证至少被抽到一次
+        self.max_priority = 1.0
+
+    def add(self, state, action, reward, next_state, done):
+        position = self.position
+        super().add(state, action, reward, next_state, done)
+        self.sum_tree.update([position], [self.max_priority])
+
+    def sample_indices(self, batch_size):
+        """
+        分层抽样: 把总优先级均分成 batch_size 段, 每段内均匀取一个前缀和
+        """
+        total = self.sum_tree.total
+        values = (np.arange(batch_size) + np.random.rand(batch_size)) * (total / batch_size)
+        # 浮点误差可能落到尚未写入的叶子上
+        return np.minimum(self.sum_tree.find(values), self.size - 1)
+
+    def sample(self, batch_size):
+        """
+        按优先级抽取一批经验
+        返回: (states, actions, rewards, next_states, dones, indices, weights),
+              weights 为按本批最大值归一化的重要性采样权重(float32)
+        """
+        idx = self.sample_indices(batch_size)
+        probabilities = self.sum_tree.priorities(idx) / self.sum_tree.total
+        weights = (self.size * probabilities) ** -self.beta
+        weights = (weights / weights.max()).astype(np.float32)
+        return (
+            self.states[idx], self.actions[idx], self.rewards[idx], self.next_states[idx], self.dones[idx],
+            idx, weights,
+        )
+
+    def update_priorities(self, indices, td_errors):
+        """
+        用本批的 TD 误差更新优先级
+        """
+        priorities = (np.abs(np.asarray(td_errors, dtype=np.float64)) + self.eps) ** self.alpha
+        self.sum_tree.update(indices, priorities)
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+
+    def _saved_arrays(self):
+        arrays = super()._saved_arrays()
+        arrays['priorities'] = self.sum_tree.priorities(self._chronological()) if self.states is not None \
+            else np.zeros(0, dtype=np.float64)
+        return arrays
+
+    def _loaded(self, data, n):
+        # 普通缓冲区保存的文件没有优先级, 全部使用最大优先级
+        self.sum_tree = SumTree(self.capacity)
+        priorities = data['priorities'][-n:] if 'priorities' in data and n else np.full(n, self.max_priority)
+        if n:
+            self.sum_tree.update(np.arange(n), priorities)
+            self.max_priority = max(self.max_priority, float(priorities.max()))
@@ -5,6 +5,12 @@
 """
 import math
 
+import numpy as np
+
+# 批量计算奖励时的动作类型编号(下标)
+ACTION_KINDS = ('select_hospital', 'wait_for_restock', 'redirect_alternative', 'split_order')
+SELECT_HOSPITAL, WAIT_FOR_RESTOCK, REDIRECT_ALTERNATIVE, SPLIT_ORDER = range(len(ACTION_KINDS))
+
 class RewardFunction:
     def __init__(self):
         # ... (权重配置保持不变或根据新逻辑调整) ...
@@ -106,5 +112,55 @@ class RewardFunction:
 
         return reward
 
+    def calculate_reward_batch(self, outcome):
+        """
+        批量计算奖励, 与逐个调用 calculate_reward 的结果逐位一致
+        每一项只加到对应的订单上(其余订单加 0.0), 累加顺序与 calculate_reward 相同
+
+        Args:
+            outcome: 字典, 每个值都是长度为 B 的数组
+                kind: 动作类型编号(ACTION_KINDS 的下标)
+                inventory_match / distance: 选择医院时的库存匹配度与距离
+                redirected_distance: 重定向成功时的距离, 失败为 0
+                is_fully_satisfied / unfulfilled_items_count / fulfilled_items / total_items
+                estimated_travel_time: 同 execution_result 中的同名字段
+
+        Returns:
+            np.ndarray: 形状 (B,) 的奖励值
+        """
+        kind = np.asarray(outcome['kind'])
+        select = kind == SELECT_HOSPITAL
+        redirect = kind == REDIRECT_ALTERNATIVE
+        inventory_match = np.asarray(outcome['inventory_match'], dtype=np.float64)
+        reward = np.zeros(len(kind), dtype=np.float64)
+
+        # 1. 动作即时奖励
+        reward += np.where(select, self.weights['inventory_match'] * inventory_match, 0.0)
+        reward += np.where(select, self.weights['distance_penalty'] * np.asarray(outcome['distance'], dtype=np.float64), 0.0)
+        reward += np.where(select & (inventory_match == 1.0), 20.0, 0.0)
+        reward += np.where(kind == WAIT_FOR_RESTOCK, self.weights['wait_penalty'], 0.0)
+        reward += np.where(kind == SPLIT_ORDER, self.weights['split_order_penalty'], 0.0)
+        reward += np.where(redirect, self.weights['redirect_penalty_base'], 0.0)
+        reward += np.where(
+            redirect,
+            self.weights['redirect_distance_penalty'] * np.asarray(outcome['redirected_distance'], dtype=np.float64),
+            0.0,
+        )
+
+        # 2. 配送结果奖励
+        fully = np.asarray(outcome['is_fully_satisfied'], dtype=bool)
+        fulfilled = np.asarray(outcome['fulfilled_items'])
+        total_items = np.asarray(outcome['total_items'])
+        travel_time = np.asarray(outcome['estimated_travel_time'], dtype=np.float64)
+        reward += np.where(fully, self.weights['delivery_success_base'], 0.0)
+        reward += np.where(fully, self.weights['time_efficiency'] * np.maximum(0.0, 30.0 - travel_time), 0.0)
+        reward += np.where((np.asarray(outcome['unfulfilled_items_count']) > 0) & ~fully,
+                           self.weights['delivery_failure_penalty'], 0.0)
+        reward += self.weights['inventory_efficiency'] * fulfilled
+        partial = ~fully & (fulfilled > 0)
+        ratio = fulfilled / np.where(partial, total_items, 1)
+        reward += np.where(partial, self.weights['partial_fulfillment_bonus'] * ratio * 100, 0.0)
+        return reward
+
 # 单例实例
 reward_function = RewardFunction()
\ No newline at end of file
@@ -0,0 +1,157 @@
+"""
+医院空间索引
+把医院坐标转换成单位球面上的三维点, 建立 k-d 树。
+球面弦长与大圆距离单调对应, 因此按弦长找到的最近邻就是按 Haversine 距离的最近邻。
+支持:
+    - k 个最近的医院
+    - 按距离从近到远逐个枚举医院(用于"最近且能满足整单"的查询)
+"""
+
+import heapq
+import math
+
+import numpy as np
+
+# 叶子节点最多容纳的医院数
+LEAF_SIZE = 8
+# 弦长比较的容差, 距离相差在容差内的医院会再用精确距离比较
+CHORD_TOLERANCE = 1e-9
+
+
+def to_unit_vectors(latitudes, longitudes):
+    """
+    经纬度(角度) -> 单位球面上的三维坐标, 形状 (N, 3)
+    """
+    lat = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lon = np.radians(np.asarray(longitudes, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+class _Node:
+    __slots__ = ('lower', 'upper', 'left', 'right', 'rows')
+
+    def __init__(self, lower, upper, left=None, right=None, rows=None):
+        # 查询时逐维比较, 用 Python 元组比小数组的 numpy 运算快得多
+        self.lower = tuple(lower.tolist())
+        self.upper = tuple(upper.tolist())
+        self.left = left
+        self.right = right
+        self.rows = rows
+
+
+class HospitalSpatialIndex:
+    """
+    医院坐标的 k-d 树索引
+
+    参数:
+        latitudes / longitudes: 医院坐标(角度)
+        rows: 参与索引的医院行号, 默认全部; 查询结果返回的是这些行号
+    """
+    def __init__(self, latitudes, longitudes, rows=None):
+        points = to_unit_vectors(latitudes, longitudes)
+        if rows is None:
+            rows = np.arange(len(points))
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self._points = points
+        self._point_lists = points.tolist()
+        self._root = self._build(self.rows) if len(self.rows) else None
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _build(self, rows):
+        pts = self._points[rows]
+        lower, upper = pts.min(axis=0), pts.max(axis=0)
+        if len(rows) <= LEAF_SIZE:
+            return _Node(lower, upper, rows=rows.tolist())
+        axis = int(np.argmax(upper - lower))
+        order = np.argsort(pts[:, axis], kind='stable')
+        mid = len(rows) // 2
+        return _Node(
+            lower, upper,
+            left=self._build(rows[order[:mid]]),
+            right=self._build(rows[order[mid:]]),
+        )
+
+    @staticmethod
+    def _box_distance(point, node):
+        # 点到节点包围盒的欧氏距离, 是该节点内所有点弦长的下界
+        total = 0.0
+        for p, lo, hi in zip(point, node.lower, node.upper):
+            gap = lo - p if p < lo else (p - hi if p > hi else 0.0)
+            total += gap * gap
+        return math.sqrt(total)
+
+    def iter_nearest(self, latitude, longitude):
+        """
+        按距离从近到远依次产出 (弦长, 医院行号), 距离相同时行号小的在前
+        """
+        if self._root is None:
+            return
+        point = tuple(to_unit_vectors(latitude, longitude).tolist())
+        px, py, pz = point
+        points = self._point_lists
+        # 堆元素: (弦长下界, 类型, 序号/行号, 节点); 类型 0 为医院点, 保证同距离时先产出点
+        heap = [(0.0, 1, 0, self._root)]
+        counter = 1
+        while heap:
+            bound, kind, key, node = heapq.heappop(heap)
+            if kind == 0:
+                yield bound, key
+                continue
+            if node.rows is not None:
+                for row in node.rows:
+                    x, y, z = points[row]
+                    chord = math.sqrt((x - px) ** 2 + (y - py) ** 2 + (z - pz) ** 2)
+                    heapq.heappush(heap, (chord, 0, row, None))
+            else:
+                for child in (node.left, node.right):
+                    heapq.heappush(heap, (self._box_distance(point, child), 1, counter, child))
+                    counter += 1
+
+    def nearest(self, latitude, longitude, k=1):
+        """
+        距离最近的 k 家医院的行号(由近到远)
+        """
+        result = []
+        for _, row in self.iter_nearest(latitude, longitude):
+            if len(result) >= k:
+                break
+            result.append(row)
+        return result
+
+    def nearest_where(self, latitude, longitude, predicate, distance_fn):
+        """
+        满足 predicate(row) 的最近医院
+
+        弦长只用于剪枝; 与最近候选弦长相差在容差内的医院会用 distance_fn(row) 重新比较,
+        保证结果与"线性扫描 + 严格小于比较"完全一致(距离相同取行号小的)。
+
+        返回:
+            (行号, 距离) 或 (None, None)
+        """
+        best_chord = None
+        candidates = []
+        for chord, row in self.iter_nearest(latitude, longitude):
+            if best_chord is not None and chord > best_chord + CHORD_TOLERANCE:
+                break
+            if predicate(row):
+                if best_chord is None:
+                    best_chord = chord
+                candidates.append(row)
+        if not candidates:
+            return None, None
+        best_row, best_dist = None, None
+        for row in sorted(candidates):
+            dist = distance_fn(row)
+            if best_row is None or dist < best_dist:
+                best_row, best_dist = row, dist
+        return best_row, best_dist
+
+
+def chord_to_km(chord):
+    """
+    弦长 -> 大圆距离(公里)
+    """
+    return 6371.0 * 2 * math.asin(min(1.0, chord / 2))
@@ -3,8 +3,24 @@
 定义强化学习中使用的状态表示
 """
 
+import heapq
 import math
 
+import numpy as np
+
+from .hospital_arrays import HospitalArrays
+from .inventory import InventoryOverlay
+from .spatial_index import chord_to_km
+
+# 状态中保留的医院数量
+TOP_K_HOSPITALS = 5
+# 向量化距离与精确距离的误差远小于该容差, 相关性落在第 k 名容差范围内的医院都会重新精确排序
+RELEVANCE_TOLERANCE = 1e-6
+# 医院数达到该值时, 前 k 名通过空间索引由近到远查找, 不再计算到所有医院的距离
+SPATIAL_INDEX_MIN_HOSPITALS = 4096
+# 弦长换算的距离与 Haversine 距离之间的误差上限(公里), 用于放宽剪枝条件
+DISTANCE_SLACK_KM = 1e-6
+
 
 class StateSpace:
     def __init__(self):
@@ -20,12 +36,15 @@ class StateSpace:
 
         参数:
             user_request: 用户请求信息
-            hospital_data: 所有医院数据
+            hospital_data: 所有医院数据(字典列表或 HospitalArrays)
             order_medicines: 订单中的药品信息
         
         返回:
             list:状态向量
         """
+        if isinstance(hospital_data, (HospitalArrays, InventoryOverlay)):
+            return self.build_state_vector_from_arrays(user_request, hospital_data, order_medicines)
+
         features = []
         
         # 1. 用户位置特征(2维)
@@ -62,6 +81,229 @@ class StateSpace:
             features.extend(hospital_features)
             top_hospital_distances.append(hospital_features[3]) # 索引3是距离
             
+        return self._finish_state_vector(features, top_hospital_distances)
+
+    def build_state_vector_from_arrays(self, user_request, arrays, order_medicines):
+        """
+        基于 HospitalArrays 的向量化状态构建
+        匹配度走库存倒排索引, 距离走距离缓存, 前5个医院用 argpartition 选出,
+        结果与 build_state_vector 逐位一致
+
+        参数:
+            user_request: 用户请求信息
+            arrays: HospitalArrays 或叠加了库存增量的 InventoryOverlay
+            order_medicines: 订单中的药品信息
+
+        返回:
+            list:状态向量
+        """
+        features = []
+
+        # 1. 用户位置特征(2维)
+        features.extend([
+            float(user_request.get('latitude', 0)),
+            float(user_request.get('longitude', 0))
+        ])
+
+        # 2. 订单信息特征(2维)
+        total_order_quantity = sum(int(item.get('quantity', 0)) for item in order_medicines)
+        order_item_types = len(order_medicines)
+        features.extend([total_order_quantity, order_item_types])
+
+        # 3. 医院特征: 匹配度由库存倒排索引累加, 只遍历有货医院的倒排表
+        total_inventory = arrays.total_inventory
+        if order_item_types:
+            match_counts = np.zeros(len(arrays))
+            for item in order_medicines:
+                match_counts[arrays.rows_with_at_least(item.get('name', ''), int(item.get('quantity', 0)))] += 1
+            match_scores = match_counts / order_item_types
+        else:
+            match_scores = np.zeros(len(arrays))
+
+        rows, distances = self._top_k_rows(
+            arrays, features[0], features[1], match_scores, TOP_K_HOSPITALS
+        )
+        top_hospital_distances = []
+        for row, distance in zip(rows, distances):
+            matching_inventory = sum(
+                arrays.get(row, item.get('name'), 0) * int(item.get('quantity', 0))
+                for item in order_medicines
+            )
+            features.extend([
+                float(arrays.latitudes[row]),
+                float(arrays.longitudes[row]),
+                float(match_scores[row]),
+                distance,
+                int(total_inventory[row]),
+                matching_inventory,
+            ])
+            top_hospital_distances.append(distance)
+
+        return self._finish_state_vector(features, top_hospital_distances)
+
+    def _top_k_rows(self, arrays, latitude, longitude, match_scores, k):
+        """
+        按相关性从高到低取前 k 家医院, 分数相同时保持原有顺序(与 sorted(..., reverse=True) 一致)
+
+        先用向量化距离算出近似相关性, argpartition 选出候选(含与第 k 名差距在容差内的医院),
+        再只对候选医院计算逐位精确的距离并排序。
+        返回: (行号列表, 对应的精确距离列表)
+        """
+        n = len(arrays)
+        if n == 0:
+            return [], []
+        k = min(k, n)
+        if n >= SPATIAL_INDEX_MIN_HOSPITALS:
+            return self._top_k_rows_indexed(arrays, latitude, longitude, match_scores, k)
+        if arrays.distance_cache is not None:
+            return self._top_k_rows_cached(arrays, latitude, longitude, match_scores, k)
+        relevance = match_scores * 100 + 1000 / (1 + arrays.distances_from(latitude, longitude))
+        if k < n:
+            kth = relevance[np.argpartition(-relevance, k - 1)[:k]].min()
+            candidates = np.flatnonzero(relevance >= kth - RELEVANCE_TOLERANCE)
+        else:
+            candidates = np.arange(n)
+        distances = arrays.exact_distances(latitude, longitude, candidates)
+        exact_relevance = match_scores[candidates] * 100 + 1000 / (1 + distances)
+        order = np.lexsort((candidates, -exact_relevance))[:k]
+        return candidates[order].tolist(), distances[order].tolist()
+
+    def _top_k_rows_cached(self, arrays, latitude, longitude, match_scores, k):
+        """
+        _top_k_rows 的距离缓存版本: 缓存中的距离本身就是精确值, 不需要再对候选医院重算
+        """
+        n = len(arrays)
+        distances = arrays.distance_cache.distances(latitude, longitude)
+        relevance = match_scores * 100 + 1000 / (1 + distances)
+        if k < n:
+            kth = relevance[np.argpartition(-relevance, k - 1)[:k]].min()
+            candidates = np.flatnonzero(relevance >= kth)
+        else:
+            candidates = np.arange(n)
+        order = np.lexsort((candidates, -relevance[candidates]))[:k]
+        rows = candidates[order]
+        return rows.tolist(), distances[rows].tolist()
+
+    def _top_k_rows_indexed(self, arrays, latitude, longitude, match_scores, k):
+        """
+        _top_k_rows 的空间索引版本, 结果与之一致
+
+        相关性 = 匹配度 * 100 + 1000 / (1 + 距离), 匹配度不超过所有医院中的最大值,
+        因此由近到远遍历医院时, 一旦"最大匹配度 + 当前距离下界"的相关性上界低于已找到的第 k 名,
+        更远的医院都不可能进入前 k 名, 可以停止遍历。
+        """
+        max_match = float(match_scores.max())
+        visited, visited_distances, top = [], [], []
+        for chord, row in arrays.spatial_index.iter_nearest(latitude, longitude):
+            if len(top) >= k:
+                lower_bound = max(0.0, chord_to_km(chord) - DISTANCE_SLACK_KM)
+                if max_match * 100 + 1000 / (1 + lower_bound) < top[0] - RELEVANCE_TOLERANCE:
+                    break
+            distance = arrays.exact_distance(latitude, longitude, row)
+            relevance = match_scores[row] * 100 + 1000 / (1 + distance)
+            visited.append(row)
+            visited_distances.append(distance)
+            if len(top) < k:
+                heapq.heappush(top, relevance)
+            else:
+                heapq.heappushpop(top, relevance)
+        rows = np.array(visited, dtype=np.int64)
+        distances = np.array(visited_distances, dtype=np.float64)
+        exact_relevance = match_scores[rows] * 100 + 1000 / (1 + distances)
+        order = np.lexsort((rows, -exact_relevance))[:k]
+        return rows[order].tolist(), distances[order].tolist()
+
+    def build_state_batch(self, orders, hospital_data, chunk_size=1024, ordered_inventory=None, total_inventory=None):
+        """
+        批量构建状态向量, 所有订单共享同一份医院坐标数组和库存矩阵
+
+        参数:
+            orders: 订单列表, 每个订单包含 latitude / longitude / items
+            hospital_data: 所有医院数据(字典列表或 HospitalArrays)
+            chunk_size: 每次向量化处理的订单数, 用于限制中间数组的内存占用
+            ordered_inventory / total_inventory: 可选, 每个订单各自的当前库存(向量化环境 step 后使用),
+                形状分别为 (N, L, H) 与 (N, H), L 为最长订单的药品数; 不提供时使用基础库存
+
+        返回:
+            np.ndarray: 形状 (N, state_dimensions) 的 float32 数组,
+                        每一行与 build_state_vector 的结果一致
+        """
+        arrays = hospital_data if isinstance(hospital_data, HospitalArrays) else HospitalArrays(hospital_data)
+        states = np.zeros((len(orders), self.state_dimensions), dtype=np.float32)
+        if ordered_inventory is not None:
+            # 分块后最长订单的药品数可能变短, 按整体宽度一次处理
+            chunk_size = max(len(orders), 1)
+        for start in range(0, len(orders), chunk_size):
+            chunk = orders[start:start + chunk_size]
+            override = None
+            if ordered_inventory is not None:
+                override = (ordered_inventory[start:start + len(chunk)], total_inventory[start:start + len(chunk)])
+            states[start:start + len(chunk)] = self._build_state_chunk(chunk, arrays, override)
+        return states
+
+    def _build_state_chunk(self, orders, arrays, inventory_override=None):
+        """
+        build_state_batch 的一个分块, 返回 float64 的 (n, state_dimensions) 数组
+        inventory_override 为 (ordered_inventory, total_inventory) 时使用每个订单各自的库存
+        """
+        n = len(orders)
+        latitudes = np.array([float(o.get('latitude', 0)) for o in orders], dtype=np.float64)
+        longitudes = np.array([float(o.get('longitude', 0)) for o in orders], dtype=np.float64)
+        columns, quantities, mask = arrays.order_columns_batch([o.get('items', []) or [] for o in orders])
+        item_counts = mask.sum(axis=1)
+
+        features = np.zeros((n, self.state_dimensions), dtype=np.float64)
+        # 1. 用户位置特征 / 2. 订单信息特征
+        features[:, 0] = latitudes
+        features[:, 1] = longitudes
+        features[:, 2] = quantities.sum(axis=1)
+        features[:, 3] = item_counts
+
+        k = min(TOP_K_HOSPITALS, len(arrays))
+        if k == 0:
+            return features
+
+        # 3. 医院特征: (n, L, H) 的订单药品库存
+        if inventory_override is None:
+            ordered_inventory = np.moveaxis(arrays.inventory[:, columns], 0, -1)
+            total_inventory = np.broadcast_to(arrays.total_inventory, (n, len(arrays)))
+        else:
+            ordered_inventory, total_inventory = inventory_override
+        satisfied = (ordered_inventory >= quantities[..., None]) & mask[..., None]
+        match_scores = satisfied.sum(axis=1) / np.maximum(item_counts, 1)[:, None]
+        matching_inventory = (ordered_inventory * quantities[..., None]).sum(axis=1)
+
+        # 近似相关性选出候选, 候选医院再计算精确距离并排序(同 _top_k_rows)
+        relevance = match_scores * 100 + 1000 / (1 + arrays.distances_from(latitudes, longitudes))
+        kth = -np.partition(-relevance, k - 1, axis=1)[:, k - 1]
+        order_idx, hospital_idx = np.nonzero(relevance >= (kth - RELEVANCE_TOLERANCE)[:, None])
+        distances = arrays.exact_distances(latitudes[order_idx], longitudes[order_idx], hospital_idx)
+        exact_relevance = match_scores[order_idx, hospital_idx] * 100 + 1000 / (1 + distances)
+        ranked = np.lexsort((hospital_idx, -exact_relevance, order_idx))
+        group_start = np.searchsorted(order_idx[ranked], np.arange(n))
+        positions = group_start[:, None] + np.arange(k)
+        top_rows = hospital_idx[ranked][positions]
+        top_distances = distances[ranked][positions]
+        rows = np.arange(n)[:, None]
+
+        block = features[:, 4:4 + 6 * k].reshape(n, k, 6)
+        block[..., 0] = arrays.latitudes[top_rows]
+        block[..., 1] = arrays.longitudes[top_rows]
+        block[..., 2] = match_scores[rows, top_rows]
+        block[..., 3] = top_distances
+        block[..., 4] = total_inventory[rows, top_rows]
+        block[..., 5] = matching_inventory[rows, top_rows]
+
+        # 4. 全局信息特征, 取法与 _finish_state_vector 一致
+        hospital_end = 2 + 2 + TOP_K_HOSPITALS * 6
+        features[:, hospital_end] = top_distances.min(axis=1)
+        features[:, hospital_end + 1] = features[:, [6 + i for i in range(hospital_end - 6) if i % 6 == 5]].max(axis=1)
+        return features
+
+    def _finish_state_vector(self, features, top_hospital_distances):
+        """
+        填充医院特征并追加全局信息特征
+        """
         # 填充未达到5个医院的情况
         while len(features) < 2 + 2 + 5 * 6: # 用户位置(2) + 订单信息(2) + 5医院*(纬度,经度,匹配度,距离,总库存,匹配库存)
             features.extend([0, 0, 0, 0, 0, 0]) # 用0填充医院特征
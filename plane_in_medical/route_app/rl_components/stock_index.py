@@ -0,0 +1,80 @@
+"""
+药品 -> 医院库存的倒排索引
+每种药品对应一个按医院行号排序的倒排表 (rows, quantities), 只记录库存大于 0 的医院。
+"哪些医院能满足整单"变成对订单中几个药品倒排表的交集, 不再逐医院逐药品扫描。
+"""
+
+import numpy as np
+
+_EMPTY = np.zeros(0, dtype=np.int64)
+
+
+class StockIndex:
+    """
+    库存倒排索引
+
+    参数:
+        arrays: HospitalArrays, 索引按其库存矩阵构建
+    """
+    def __init__(self, arrays):
+        self.num_hospitals = len(arrays)
+        self._all_rows = np.arange(self.num_hospitals, dtype=np.int64)
+        # 药品名称 -> (医院行号数组, 库存数量数组), 行号升序
+        self._postings = {}
+        for name, col in arrays.medicine_index.items():
+            column = arrays.inventory[:, col]
+            rows = np.flatnonzero(column > 0)
+            self._postings[name] = (rows.astype(np.int64), column[rows].astype(np.int64))
+
+    def posting(self, medicine_name):
+        """
+        某药品的倒排表 (rows, quantities), 没有任何医院有货时为两个空数组
+        """
+        return self._postings.get(medicine_name, (_EMPTY, _EMPTY))
+
+    def rows_with_at_least(self, medicine_name, quantity):
+        """
+        该药品库存不少于 quantity 的医院行号(升序)
+        需求数量不大于 0 时, 所有医院都满足(没有库存记为 0)
+        """
+        if quantity <= 0:
+            return self._all_rows
+        rows, quantities = self.posting(medicine_name)
+        return rows[quantities >= quantity]
+
+    def sufficient_rows(self, needs):
+        """
+        能同时满足所有需求的医院行号(升序)
+
+        参数:
+            needs: [(药品名称, 需求数量), ...]
+        """
+        result = self._all_rows
+        # 从最短的倒排表开始求交集
+        for rows in sorted((self.rows_with_at_least(name, qty) for name, qty in needs), key=len):
+            result = np.intersect1d(result, rows, assume_unique=True)
+            if not len(result):
+                break
+        return result
+
+    def set_quantity(self, row, medicine_name, quantity):
+        """
+        增量更新某医院某药品的库存
+        """
+        rows, quantities = self.posting(medicine_name)
+        pos = int(np.searchsorted(rows, row))
+        present = pos < len(rows) and rows[pos] == row
+        if quantity > 0:
+            if present:
+                quantities = quantities.copy()
+                quantities[pos] = quantity
+            else:
+                rows = np.insert(rows, pos, row)
+                quantities = np.insert(quantities, pos, quantity)
+        elif present:
+            rows = np.delete(rows, pos)
+            quantities = np.delete(quantities, pos)
+        else:
+            return
+        # 整体替换倒排表, 并发读取方拿到的总是完整的旧表或新表
+        self._postings[medicine_name] = (rows, quantities)
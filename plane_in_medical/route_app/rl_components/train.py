@@ -3,9 +3,12 @@ import json
 from pathlib import Path
 import time
 import numpy as np
+import torch
+from .actors import PIPELINE_DEPTH, RolloutPool
 from .agent import DQNAgent
 from .environment import create_environment
-from ...utils.prepare_training_data import load_jsonl
+from .numpy_policy import export_npz
+from .vec_environment import VecDroneDeliveryEnvironment
 import copy    #用于在评估时创建医院数据的深拷贝,确保评估过程不会影响训练环境
 
 
@@ -30,11 +33,15 @@ def evaluate(agent, env, hospitals_template, orders_subset, n_eval=100):
     if hasattr(agent, 'epsilon'):
         agent.epsilon = 0.0
 
+    #评估时 epsilon=0, 动作是纯贪婪的, 一次性批量构建状态并批量选择动作
+    eval_orders = orders_subset[:n]
+    states = eval_env.state_space.build_state_batch(eval_orders, eval_env.hospital_arrays)
+    actions = agent.act_batch(states) if n > 0 else []
+
     for i in range(n):
-        order = orders_subset[i]
-        state = eval_env.reset(order, order.get('items', []))
-        action = agent.act(state)
-        _, r, _, info = eval_env.step(action)
+        order = eval_orders[i]
+        eval_env.reset(order, order.get('items', []))
+        _, r, _, info = eval_env.step(int(actions[i]))
         total_r += float(r)
 
         sufficient = False
@@ -57,8 +64,91 @@ def evaluate(agent, env, hospitals_template, orders_subset, n_eval=100):
     #返回平均奖励和成功率
     return (total_r / n) if n > 0 else 0.0, (total_succ / n) if n > 0 else 0.0
 
+def _transitions(agent, env, orders):
+    """
+    逐个订单与环境交互, 产生 (state, action, reward, next_state, done)
+    """
+    for order in orders:
+        state = env.reset(order, order.get('items', []))
+        action = agent.act(state)
+        next_state, reward, done, info = env.step(action)
+        yield state, action, reward, next_state, done
+
+
+def _vec_transitions(agent, vec_env, orders, num_envs):
+    """
+    每次用向量化环境推进 num_envs 个订单, 逐条产生与 _transitions 相同格式的经验
+    同一批订单共用一次批量前向计算的贪婪动作, 探索仍按当前 epsilon 逐个订单决定
+    """
+    for start in range(0, len(orders), num_envs):
+        batch = orders[start:start + num_envs]
+        states = vec_env.reset(batch)
+        actions = agent.act_batch(states)
+        for i in range(len(batch)):
+            if np.random.rand() <= agent.epsilon:
+                actions[i] = random.randrange(agent.action_size)
+        next_states, rewards, dones, info = vec_env.step(actions)
+        for i in range(len(batch)):
+            yield states[i], int(actions[i]), float(rewards[i]), next_states[i], bool(dones[i])
+
+
+def _epsilon_after(agent, epsilon, steps):
+    """
+    从 epsilon 开始按回合衰减 steps 次后的探索率(与 agent.decay_epsilon 逐次相乘的结果一致)
+    """
+    for _ in range(steps):
+        if epsilon > agent.epsilon_min:
+            epsilon *= agent.epsilon_decay
+    return epsilon
+
+
+def _parallel_transitions(pool, agent, num_orders, epochs):
+    """
+    多进程采样: 每个 epoch 打乱订单下标并按轮分派给采样进程, 按轮次、进程顺序逐条产生经验
+    每轮的探索率取学习进程处理到该轮开头时的值; 处理完第 r 轮后发布参数并分派第 r + PIPELINE_DEPTH 轮
+    """
+    round_size = pool.per_worker * pool.num_workers
+    indices = list(range(num_orders))
+    rounds = []
+    for _ in range(epochs):
+        random.shuffle(indices)
+        rounds.extend(indices[s:s + round_size] for s in range(0, num_orders, round_size))
+
+    epsilon = agent.epsilon
+    for round_id in range(min(PIPELINE_DEPTH, len(rounds))):
+        pool.submit(round_id, rounds[round_id], epsilon)
+        epsilon = _epsilon_after(agent, epsilon, len(rounds[round_id]))
+    for round_id in range(len(rounds)):
+        yield from pool.collect(round_id)
+        next_round = round_id + PIPELINE_DEPTH
+        if next_round < len(rounds):
+            pool.publish(next_round)
+            pool.submit(next_round, rounds[next_round], epsilon)
+            epsilon = _epsilon_after(agent, epsilon, len(rounds[next_round]))
+
+
+def _learn_step(agent, transition, n_steps, args, total_steps):
+    """
+    存储第 n_steps 条经验; 每收集 args.collect_steps 条经验做 args.updates_per_collect 次梯度更新
+    返回: 本次实际完成的梯度更新次数(经验不足一批时 replay 不更新)
+    """
+    agent.remember(*transition)
+    #每个订单是一个回合, 探索率按回合衰减, 与梯度更新次数无关
+    agent.decay_epsilon()
+    updates = 0
+    if n_steps % args.collect_steps == 0:
+        if args.prioritized:
+            agent.memory.beta = args.per_beta + (1.0 - args.per_beta) * min(1.0, n_steps / total_steps)
+        for _ in range(args.updates_per_collect):
+            if agent.replay(args.batch_size, decay_epsilon=False) is not None:
+                updates += 1
+    return updates
+
+
 def main():
     import argparse
+    #只在命令行训练时需要, 按包路径运行(python -m ...train)才能解析
+    from ...utils.prepare_training_data import load_jsonl
     parser = argparse.ArgumentParser()
     #训练轮数,默认是10轮
     parser.add_argument('--epochs', type=int, default=10, help='number of full passes over the orders')
@@ -70,7 +160,23 @@ def main():
     parser.add_argument('--eval_interval_steps', type=int, default=2000)
     #随机种子
     parser.add_argument('--seed', type=int, default=42)
+    #使用向量化环境, 每次批量推进 num_envs 个订单
+    parser.add_argument('--vec_env', action='store_true')
+    parser.add_argument('--num_envs', type=int, default=64)
+    #经验回放缓冲区文件(.npz): 存在时先加载, 训练结束后保存, 用于中断后继续训练
+    parser.add_argument('--replay_buffer', type=str, default=None)
+    #优先经验回放(按 TD 误差抽样), alpha 为优先级指数, beta 为重要性采样修正的初始值(训练中线性增加到 1)
+    parser.add_argument('--prioritized', action='store_true')
+    parser.add_argument('--per_alpha', type=float, default=0.6)
+    parser.add_argument('--per_beta', type=float, default=0.4)
+    #更新/数据比: 每收集 collect_steps 条经验做 updates_per_collect 次梯度更新(每次 batch_size 条)
+    parser.add_argument('--collect_steps', type=int, default=1)
+    parser.add_argument('--updates_per_collect', type=int, default=1)
+    #多进程采样: num_workers 个采样进程各自持有环境和网络副本, 每个进程每轮处理 num_envs 个订单
+    parser.add_argument('--num_workers', type=int, default=0)
     args = parser.parse_args()
+    if args.collect_steps < 1 or args.updates_per_collect < 0:
+        parser.error('--collect_steps must be >= 1 and --updates_per_collect >= 0')
     #项目根目录
     root = Path(__file__).resolve().parents[3]
     data_dir = root / 'plane_in_medical' / 'data'
@@ -96,61 +202,101 @@ def main():
             state_size = env.state_space.state_dimensions
     #获取动作空间大小
     action_size = env.action_space.action_size
-    #创建DQN智能体,指定状态大小,动作大小和学习率
-    agent = DQNAgent(state_size, action_size, lr=5e-4)
+    #向量化环境与标量环境共用医院数据, 每个订单的结果与标量环境一致
+    vec_env = VecDroneDeliveryEnvironment(hospitals) if args.vec_env else None
     #设置随机种子以确保实验可重现
     random.seed(args.seed)
     np.random.seed(args.seed)
-    #当前训练步数
+    torch.manual_seed(args.seed)
+    #创建DQN智能体,指定状态大小,动作大小和学习率
+    agent = DQNAgent(
+        state_size, action_size, lr=5e-4,
+        prioritized=args.prioritized, alpha=args.per_alpha, beta=args.per_beta,
+    )
+    if args.replay_buffer and Path(args.replay_buffer).exists():
+        agent.load_memory(args.replay_buffer)
+        print(f'Loaded {len(agent.memory)} transitions from {args.replay_buffer}')
+    #当前训练步数(与环境交互的步数)
     n_steps = 0
+    #梯度更新次数
+    n_updates = 0
+    #评估耗时, 计算吞吐量时扣除
+    eval_time = 0.0
     #训练日志
     log = []
     total_steps = args.epochs * len(orders)
-    print(f'Training for {args.epochs} epochs over {len(orders)} orders ({total_steps} steps)')
+    print(f'Training for {args.epochs} epochs over {len(orders)} orders ({total_steps} steps), '
+          f'{args.updates_per_collect} updates every {args.collect_steps} steps')
+
+    def learn(state, action, reward, next_state, done):
+        nonlocal n_steps, n_updates, eval_time
+        n_steps += 1
+        n_updates += _learn_step(agent, (state, action, reward, next_state, done), n_steps, args, total_steps)
+        #定期更新目标网格参数
+        if n_steps % args.target_update == 0:
+            agent.update_target_network()
+        #定期评估智能体性能并记录日志
+        if n_steps % args.eval_interval_steps == 0:
+            eval_start = time.time()
+            avg_r, avg_succ = evaluate(agent, env, hospitals, orders[:200], n_eval=100)
+            eval_time += time.time() - eval_start
+            throughput = n_steps / max(time.time() - start - eval_time, 1e-9)
+            print(f'[step {n_steps}] eval avg_reward={avg_r:.2f} success_rate={avg_succ:.2f} eps={agent.epsilon:.3f} '
+                  f'updates={n_updates} {throughput:.1f} transitions/s')
+            log.append({
+                'step': n_steps, 'updates': n_updates, 'avg_reward': avg_r, 'success_rate': avg_succ,
+                'epsilon': agent.epsilon, 'transitions_per_s': throughput,
+            })
 
     start = time.time()
-    for epoch in range(args.epochs):
-        random.shuffle(orders)
-        """
-        1.增加步数计数
-        2.重置环境
-        3.智能体选择动作
-        4.执行动作并获取环境反馈
-        5.存储经验到回收缓冲区
-        6.进行经验回收训练
-        """
-        for order in orders:
-            n_steps += 1
-            state = env.reset(order, order.get('items', []))
-            action = agent.act(state)
-            next_state, reward, done, info = env.step(action)
-            agent.remember(state, action, reward, next_state, done)
-            agent.replay(args.batch_size)
-            #定期更新目标网格参数
-            if n_steps % args.target_update == 0:
-                agent.update_target_network()
-            #定期评估智能体性能并记录日志
-            if n_steps % args.eval_interval_steps == 0:
-                avg_r, avg_succ = evaluate(agent, env, hospitals, orders[:200], n_eval=100)
-                print(f'[step {n_steps}] eval avg_reward={avg_r:.2f} success_rate={avg_succ:.2f} eps={agent.epsilon:.3f}')
-                log.append({'step': n_steps, 'avg_reward': avg_r, 'success_rate': avg_succ, 'epsilon': agent.epsilon})
+    if args.num_workers > 0:
+        #采样进程持有原始订单列表, 这里只打乱下标
+        with RolloutPool(args.num_workers, agent, hospitals, orders, args.num_envs, args.seed) as pool:
+            for transition in _parallel_transitions(pool, agent, len(orders), args.epochs):
+                learn(*transition)
+            print('rollout workers busy %.1fs in total' % pool.rollout_seconds)
+    else:
+        for epoch in range(args.epochs):
+            random.shuffle(orders)
+            """
+            1.增加步数计数
+            2.重置环境
+            3.智能体选择动作
+            4.执行动作并获取环境反馈
+            5.存储经验到回收缓冲区
+            6.进行经验回收训练
+            """
+            if vec_env is not None:
+                transitions = _vec_transitions(agent, vec_env, orders, args.num_envs)
+            else:
+                transitions = _transitions(agent, env, orders)
+            for transition in transitions:
+                learn(*transition)
     #计算耗时时间
     elapsed = time.time() - start
-    print('Training finished, elapsed=%.1fs' % elapsed)
+    train_time = max(elapsed - eval_time, 1e-9)
+    print('Training finished, elapsed=%.1fs (eval %.1fs)' % (elapsed, eval_time))
+    print('%d transitions, %d gradient updates, %.1f transitions/s, %.1f updates/s' % (
+        n_steps, n_updates, n_steps / train_time, n_updates / train_time))
     #保存训练日志
     outp = data_dir / 'prepared' / 'dqn_full_log.json'
     outp.parent.mkdir(parents=True, exist_ok=True)
     with open(outp, 'w', encoding='utf-8') as f:
         json.dump(log, f, ensure_ascii=False, indent=2)
+    if args.replay_buffer:
+        agent.save_memory(args.replay_buffer)
+        print(f'Saved {len(agent.memory)} transitions to {args.replay_buffer}')
 
     try:
-        import torch
         ckpt = {
             'q_state_dict': agent.q_network.state_dict(),
             'target_state_dict': agent.target_network.state_dict(),
         }
         torch.save(ckpt, str(data_dir / 'prepared' / 'dqn_full_checkpoint.pth'))
         print('Saved checkpoint to', str(data_dir / 'prepared' / 'dqn_full_checkpoint.pth'))
+        # 决策服务默认使用的纯 NumPy 权重
+        npz, _ = export_npz(data_dir / 'prepared' / 'dqn_full_checkpoint.pth')
+        print('Saved NumPy weights to', str(npz))
     except Exception:
         print('torch not available or save failed')
 
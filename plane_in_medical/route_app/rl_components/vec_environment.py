@@ -0,0 +1,321 @@
+"""
+向量化的无人机配送训练环境
+一次推进 B 个订单: 状态、库存变化和奖励都用 NumPy 数组批量计算, 不再逐订单走字典逻辑和库存增量层。
+
+每个订单都是单步回合, 且 DroneDeliveryEnvironment.reset 会清空库存增量层,
+所以 B 个订单之间互不影响: 每个订单都从基础库存出发, 只需要为每个订单单独记录
+"订单中出现的药品在各医院的库存" (B, 药品种数, H), 四种动作的库存变化都在这个数组上完成。
+
+每个订单的状态、下一状态、奖励与逐个调用 DroneDeliveryEnvironment.reset / step 的结果一致
+(状态为 float32, 与训练时送入网络的精度相同)。药品缺少 name 或 quantity 字段的订单,
+环境与状态构建对它们的取值规则不同, 这类订单交给内部的标量环境逐个处理。
+"""
+
+import numpy as np
+
+from .environment import DroneDeliveryEnvironment
+from .rewards import (
+    ACTION_KINDS, REDIRECT_ALTERNATIVE, SELECT_HOSPITAL, SPLIT_ORDER, WAIT_FOR_RESTOCK, reward_function,
+)
+from .states import state_space
+
+# 等待补货时每家缺货医院补充的数量, 与 DroneDeliveryEnvironment.step 一致
+RESTOCK_QUANTITY = 5
+
+
+def _is_vectorizable(order):
+    """
+    订单的药品是否都带有 name 和 quantity(此时环境与状态构建使用相同的药品键和需求数量)
+    """
+    return all(item.get('name') and 'quantity' in item for item in order.get('items', []) or [])
+
+
+class VecDroneDeliveryEnvironment:
+    """
+    向量化环境
+
+    参数:
+        hospitals_data: 医院数据列表, 与 DroneDeliveryEnvironment 相同
+    """
+    def __init__(self, hospitals_data):
+        # 标量环境: 共用医院数组和动作空间, 并处理无法向量化的订单
+        self._scalar_env = DroneDeliveryEnvironment(hospitals_data)
+        self.hospital_arrays = self._scalar_env.hospital_arrays
+        self.action_space = self._scalar_env.action_space
+        self.state_space = state_space
+        self.num_hospitals = self.action_space.num_hospitals
+        template = self._scalar_env.hospitals_template
+        # 选择医院动作扣减库存的行号(与标量环境按 id 或坐标查找的结果一致), 找不到时为 -1
+        self._target_rows = np.array([
+            -1 if row is None else row
+            for row in (self._scalar_env._find_row(hospital) for hospital in template)
+        ], dtype=np.int64)
+        self._orders = []
+        self.states = None
+
+    @property
+    def hospitals_template(self):
+        return self._scalar_env.hospitals_template
+
+    def reset(self, orders):
+        """
+        重置为一批新订单
+
+        参数:
+            orders: 订单列表, 每个订单包含 latitude / longitude / items
+        返回:
+            np.ndarray: (B, state_dimensions) 的 float32 状态
+        """
+        self._orders = list(orders)
+        n = len(self._orders)
+        arrays = self.hospital_arrays
+        vectorizable = np.array([_is_vectorizable(order) for order in self._orders], dtype=bool)
+        self._vector_idx = np.flatnonzero(vectorizable)
+        self._scalar_idx = np.flatnonzero(~vectorizable)
+
+        # 订单药品的去重键: 同一订单中重复出现的药品指向同一份库存
+        items = [self._orders[i].get('items', []) or [] for i in self._vector_idx]
+        width = max((len(it) for it in items), default=0)
+        self._slot_key = np.zeros((len(items), width), dtype=np.int64)
+        self._slot_need = np.zeros((len(items), width), dtype=np.int64)
+        self._slot_mask = np.zeros((len(items), width), dtype=bool)
+        key_columns = np.full((len(items), width), arrays.unknown_column, dtype=np.int64)
+        for b, order_items in enumerate(items):
+            keys = {}
+            for j, item in enumerate(order_items):
+                u = keys.setdefault(item['name'], len(keys))
+                self._slot_key[b, j] = u
+                self._slot_need[b, j] = int(item['quantity'])
+                self._slot_mask[b, j] = True
+                key_columns[b, u] = arrays.column_of(item['name'])
+        # (b, 药品键, H) 的基础库存, 未知药品和补齐位置为 0
+        self._base_stock = np.moveaxis(arrays.inventory[:, key_columns], 0, -1)
+        self._total_items = (self._slot_need * self._slot_mask).sum(axis=1)
+        self._latitudes = np.array(
+            [float(self._orders[i].get('latitude', 0.0) or 0.0) for i in self._vector_idx], dtype=np.float64
+        )
+        self._longitudes = np.array(
+            [float(self._orders[i].get('longitude', 0.0) or 0.0) for i in self._vector_idx], dtype=np.float64
+        )
+
+        states = np.zeros((n, self.state_space.state_dimensions), dtype=np.float32)
+        if len(self._vector_idx):
+            states[self._vector_idx] = self.state_space.build_state_batch(
+                [self._orders[i] for i in self._vector_idx], arrays
+            )
+        for i in self._scalar_idx:
+            order = self._orders[i]
+            states[i] = self._scalar_env.reset(order, order.get('items', []))
+        self.states = states
+        return states
+
+    def _distances(self, b):
+        """
+        第 b 个(可向量化的)订单到所有医院的精确距离
+        """
+        arrays = self.hospital_arrays
+        if arrays.distance_cache is not None:
+            return arrays.distance_cache.distances(self._latitudes[b], self._longitudes[b])
+        return arrays.exact_distances(self._latitudes[b], self._longitudes[b], range(len(arrays)))
+
+    def _apply(self, stock, rows, b_idx, fn):
+        """
+        对 b_idx 中每个订单在对应行号 rows 上, 按订单药品顺序依次执行 fn(当前库存, 需求数量) -> 新库存
+        """
+        for j in range(self._slot_key.shape[1]):
+            active = b_idx[self._slot_mask[b_idx, j]]
+            if not len(active):
+                continue
+            keys = self._slot_key[active, j]
+            cells = (active, keys, rows[active])
+            stock[cells] = fn(stock[cells], self._slot_need[active, j])
+
+    def step(self, actions):
+        """
+        批量执行动作
+
+        参数:
+            actions: 长度为 B 的动作索引
+        返回:
+            (next_states, rewards, dones, info)
+            next_states: (B, state_dimensions) float32
+            rewards: (B,) float64
+            dones: (B,) bool, 单步回合恒为 True
+            info: 字典, 每个值为长度 B 的数组(动作类型、满足件数、是否完全满足、医院行号等)
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        n = len(self._orders)
+        next_states = self.states.copy()
+        rewards = np.zeros(n, dtype=np.float64)
+        info = {
+            'kind': np.zeros(n, dtype=np.int64),
+            'hospital_row': np.full(n, -1, dtype=np.int64),
+            'distance': np.zeros(n, dtype=np.float64),
+            'inventory_match': np.zeros(n, dtype=np.float64),
+            'fulfilled_items': np.zeros(n, dtype=np.int64),
+            'unfulfilled_items_count': np.zeros(n, dtype=np.int64),
+            'total_items': np.zeros(n, dtype=np.int64),
+            'is_fully_satisfied': np.zeros(n, dtype=bool),
+        }
+
+        if len(self._vector_idx):
+            self._step_vectorized(actions[self._vector_idx], next_states, rewards, info)
+        for i in self._scalar_idx:
+            self._step_scalar(i, int(actions[i]), next_states, rewards, info)
+        self.states = next_states
+        return next_states, rewards, np.ones(n, dtype=bool), info
+
+    def _step_vectorized(self, actions, next_states, rewards, info):
+        n = len(actions)
+        h = self.num_hospitals
+        stock = self._base_stock.copy()
+        valid = self._slot_mask
+        need = self._slot_need
+        total_items = self._total_items
+        key_stock = np.take_along_axis(self._base_stock, self._slot_key[..., None], axis=1)  # (n, L, H)
+
+        # 超出范围的动作与标量环境一样按选择第一家医院处理
+        kind = np.full(n, SELECT_HOSPITAL, dtype=np.int64)
+        kind[actions == h] = WAIT_FOR_RESTOCK
+        kind[actions == h + 1] = REDIRECT_ALTERNATIVE
+        kind[actions == h + 2] = SPLIT_ORDER
+        select_rows = np.where((actions >= 0) & (actions < h), actions, 0)
+
+        distance = np.zeros(n, dtype=np.float64)
+        redirected_distance = np.zeros(n, dtype=np.float64)
+        inventory_match = np.zeros(n, dtype=np.float64)
+        fulfilled = np.zeros(n, dtype=np.int64)
+        fully = np.zeros(n, dtype=bool)
+        travel_time = np.zeros(n, dtype=np.float64)
+        hospital_row = np.full(n, -1, dtype=np.int64)
+        rows = np.zeros(n, dtype=np.int64)
+
+        # 1. 选择医院: 按环境的规则计算匹配度, 完全满足时在目标医院扣减
+        select = np.flatnonzero(kind == SELECT_HOSPITAL)
+        if len(select):
+            have = key_stock[select, :, select_rows[select]] >= need[select]
+            counts = (have & valid[select]).sum(axis=1)
+            item_counts = valid[select].sum(axis=1)
+            inventory_match[select] = np.where(item_counts > 0, counts / np.maximum(item_counts, 1), 0)
+            for b in select.tolist():
+                distance[b] = self._distances(b)[select_rows[b]]
+            travel_time[select] = distance[select]
+            hospital_row[select] = select_rows[select]
+            sufficient = inventory_match[select] == 1.0
+            target = self._target_rows[select_rows[select]]
+            decrement = select[sufficient & (target >= 0)]
+            rows[decrement] = self._target_rows[select_rows[decrement]]
+            self._apply(stock, rows, decrement, lambda have, need: np.maximum(0, have - need))
+            fully[decrement] = True
+            fulfilled[decrement] = total_items[decrement]
+            partial = select[~sufficient]
+            fulfilled[partial] = (total_items[partial] * inventory_match[partial]).astype(np.int64)
+
+        # 2. 等待补货: 按订单药品顺序, 对库存不足的医院补货
+        wait = np.flatnonzero(kind == WAIT_FOR_RESTOCK)
+        for j in range(need.shape[1]):
+            active = wait[valid[wait, j]]
+            if len(active):
+                keys = self._slot_key[active, j]
+                lacking = stock[active, keys, :] < need[active, j][:, None]
+                stock[active, keys, :] += RESTOCK_QUANTITY * lacking
+
+        # 3. 重定向: 所有药品都满足的医院中取最近的一家(同距离取行号小的), 在该医院扣减
+        redirect = np.flatnonzero(kind == REDIRECT_ALTERNATIVE)
+        if len(redirect):
+            sufficient = np.all((key_stock[redirect] >= need[redirect][..., None]) | ~valid[redirect][..., None], axis=1)
+            found = []
+            for idx, b in enumerate(redirect.tolist()):
+                candidates = np.flatnonzero(sufficient[idx])
+                if not len(candidates):
+                    continue
+                distances = self._distances(b)[candidates]
+                best = int(np.argmin(distances))
+                rows[b] = candidates[best]
+                redirected_distance[b] = float(distances[best])
+                found.append(b)
+            found = np.array(found, dtype=np.int64)
+            self._apply(stock, rows, found, lambda have, need: np.maximum(0, have - need))
+            fully[found] = True
+            fulfilled[found] = total_items[found]
+            travel_time[found] = redirected_distance[found]
+            hospital_row[found] = rows[found]
+
+        # 4. 拆单: 每个药品按医院顺序依次从有货的医院取货
+        split = np.flatnonzero(kind == SPLIT_ORDER)
+        for j in range(need.shape[1]):
+            active = split[valid[split, j]]
+            if not len(active):
+                continue
+            keys = self._slot_key[active, j]
+            available = stock[active, keys, :]
+            # 只从有货的医院取货
+            positive = np.maximum(available, 0)
+            before = np.cumsum(positive, axis=1) - positive
+            take = np.clip(need[active, j][:, None] - before, 0, positive)
+            stock[active, keys, :] = available - take
+            fulfilled[active] += take.sum(axis=1)
+        fully[split] = fulfilled[split] == total_items[split]
+
+        unfulfilled = total_items - fulfilled
+        rewards_vec = reward_function.calculate_reward_batch({
+            'kind': kind,
+            'inventory_match': inventory_match,
+            'distance': distance,
+            'redirected_distance': redirected_distance,
+            'is_fully_satisfied': fully,
+            'unfulfilled_items_count': unfulfilled,
+            'fulfilled_items': fulfilled,
+            'total_items': total_items,
+            'estimated_travel_time': travel_time,
+        })
+
+        # 下一状态: 只有库存发生变化的订单需要重新构建
+        changed = np.flatnonzero((stock != self._base_stock).any(axis=(1, 2)))
+        if len(changed):
+            # 宽度取这些订单中最长订单的药品数, 与 build_state_batch 对订单药品的补齐方式一致
+            width = int(valid[changed].sum(axis=1).max())
+            ordered = np.take_along_axis(stock[changed], self._slot_key[changed, :width, None], axis=1)
+            ordered = ordered * valid[changed, :width, None]
+            totals = self.hospital_arrays.total_inventory + (stock[changed] - self._base_stock[changed]).sum(axis=1)
+            out = self._vector_idx[changed]
+            next_states[out] = self.state_space.build_state_batch(
+                [self._orders[i] for i in out], self.hospital_arrays,
+                ordered_inventory=ordered, total_inventory=totals,
+            )
+
+        out = self._vector_idx
+        rewards[out] = rewards_vec
+        info['kind'][out] = kind
+        info['hospital_row'][out] = hospital_row
+        info['distance'][out] = np.where(kind == REDIRECT_ALTERNATIVE, redirected_distance, distance)
+        info['inventory_match'][out] = inventory_match
+        info['fulfilled_items'][out] = fulfilled
+        info['unfulfilled_items_count'][out] = unfulfilled
+        info['total_items'][out] = total_items
+        info['is_fully_satisfied'][out] = fully
+
+    def _step_scalar(self, i, action, next_states, rewards, info):
+        """
+        无法向量化的订单交给标量环境
+        """
+        order = self._orders[i]
+        self._scalar_env.reset(order, order.get('items', []))
+        next_state, reward, _, result = self._scalar_env.step(action)
+        next_states[i] = next_state
+        rewards[i] = reward
+        kind = result.get('action')
+        info['kind'][i] = ACTION_KINDS.index(kind) if kind in ACTION_KINDS else SELECT_HOSPITAL
+        hospital_id = result.get('hospital_id')
+        if hospital_id is not None and hospital_id in self._scalar_env._row_by_id:
+            info['hospital_row'][i] = self._scalar_env._row_by_id[hospital_id]
+        info['distance'][i] = float(result.get('distance_km', result.get('redirected_distance', 0.0)) or 0.0)
+        info['inventory_match'][i] = float((result.get('hospital') or {}).get('inventory_match', 0.0))
+        info['fulfilled_items'][i] = result.get('fulfilled_items', 0)
+        info['unfulfilled_items_count'][i] = result.get('unfulfilled_items_count', 0)
+        info['total_items'][i] = result.get('total_items', 0)
+        info['is_fully_satisfied'][i] = bool(result.get('is_fully_satisfied', False))
+
+
+def create_vec_environment(hospitals_data):
+    return VecDroneDeliveryEnvironment(hospitals_data)
@@ -1,40 +1,77 @@
 """
 负责加载和初始化已训练的强化学习模型。
+torch 只在使用 eager / script / int8 格式时才导入, numpy 格式(默认)的 web 进程不加载 torch。
 """
 
 import os
 import json
 from pathlib import Path
-import torch
 import numpy as np
 
 # 导入你的 RL 组件
-from route_app.rl_components.agent import DQNAgent
 from route_app.rl_components.environment import create_environment
+from route_app.rl_components.export import MODEL_FORMATS, convert, exported_path, load_eager, load_exported
+from route_app.rl_components.numpy_policy import NumpyQNetwork, content_hash
 from route_app.rl_components.states import state_space
 
-# 全局变量存储模型和环境
-loaded_agent = None
-loaded_env = None
-# 如果状态构建需要医院数据模板
-hospital_data_template = None 
+# 已加载的模型和环境: (检查点路径, 模型格式) -> (智能体, 环境), 不同的参数各自加载一次
+_loaded = {}
 
-def load_model_and_environment():
+DATA_DIR = Path(__file__).resolve().parent.parent / 'data'
+# 默认的模型检查点
+DEFAULT_MODEL_PATH = DATA_DIR / 'prepared' / 'dqn_full_checkpoint.pth'
+
+
+class InferenceAgent:
     """
-    加载训练好的模型和创建环境实例。
-    这个函数应该在 Django 应用启动时调用一次，或者在首次需要时懒加载。
+    只做推理的智能体(不依赖 torch), 提供决策服务用到的 DQNAgent 属性
     """
-    global loaded_agent, loaded_env, hospital_data_template
+    def __init__(self, q_network, state_size, action_size):
+        self.q_network = q_network
+        self.state_size = state_size
+        self.action_size = action_size
+        self.epsilon = 0.0
 
-    if loaded_agent is not None and loaded_env is not None:
-        # 如果已经加载，则直接返回
-        return loaded_agent, loaded_env
 
+def load_q_network(model_path, state_size, action_size, model_format='eager'):
+    """
+    从检查点加载一个新的 Q 网络(不影响已加载的智能体), 用于热更新模型
+    model_format 为 numpy 时加载记录了同一检查点内容哈希的 .npz, 不导入 torch;
+    为 script / int8 时加载 export 导出的文件(导出时已检查贪婪动作与 eager 一致)。
+    导出文件与检查点不对应时: numpy / script 是无损转换, 直接在内存中转换(需要 torch); int8 没有经过检查, 退回 eager
+    """
+    if model_format not in MODEL_FORMATS:
+        raise ValueError(f'未知模型格式: {model_format}')
+    if model_format == 'numpy':
+        exported = exported_path(model_path, model_format)
+        if exported.exists():
+            network = NumpyQNetwork.load(exported)
+            if network.source_hash == content_hash(model_path):
+                return network
+        print(f"{exported} 与检查点不对应, 从检查点转换 NumPy 权重")
+    elif model_format != 'eager':
+        exported = exported_path(model_path, model_format)
+        if exported.exists() and exported.stat().st_mtime_ns >= Path(model_path).stat().st_mtime_ns:
+            return load_exported(exported)
+        if model_format == 'int8':
+            print(f"没有与检查点对应的 int8 导出文件 {exported}, 推理使用 eager 模型")
+            model_format = 'eager'
+    return convert(load_eager(model_path, state_size, action_size), model_format)
+
+
+def load_model_and_environment(model_path=None, model_format='eager'):
+    """
+    加载训练好的模型和创建环境实例。
+    这个函数应该在 Django 应用启动时调用一次，或者在首次需要时懒加载。
+    model_format: 推理使用的模型格式(numpy / eager / script / int8, 见 rl_components/export.py)
+    """
     # --- 1. 确定文件路径 ---
-    base_dir = Path(__file__).resolve().parent.parent # plane_in_medical/route_app -> plane_in_medical
-    data_dir = base_dir / 'data'
-    model_path = data_dir / 'prepared' / 'dqn_full_checkpoint.pth'
-    hospitals_file = data_dir / 'hospitals.json' # 需要最新的医院数据
+    model_path = Path(model_path) if model_path is not None else DEFAULT_MODEL_PATH
+    key = (str(model_path.resolve()), model_format)
+    if key in _loaded:
+        # 同一检查点和格式已经加载过, 直接返回
+        return _loaded[key]
+    hospitals_file = DATA_DIR / 'hospitals.json' # 冷启动快照, 决策服务之后会换成数据库中的实时库存
 
     # --- 2. 加载医院数据 ---
     if not hospitals_file.exists():
@@ -59,24 +96,40 @@ def load_model_and_environment():
     state_size = state_space.state_dimensions # 使用 states.py 中定义的维度
     action_size = loaded_env.action_space.action_size
 
+    if not model_path.exists():
+        raise FileNotFoundError(f"模型文件未找到: {model_path}")
+
+    if model_format == 'numpy':
+        # 纯 NumPy 推理, 不创建 DQNAgent(不导入 torch)
+        loaded_agent = InferenceAgent(load_q_network(model_path, state_size, action_size, model_format),
+                                      state_size, action_size)
+        print(f"已从 {model_path} 加载 NumPy 推理权重 (state_size={state_size}, action_size={action_size})。")
+        _loaded[key] = (loaded_agent, loaded_env)
+        return loaded_agent, loaded_env
+
+    import torch
+    from route_app.rl_components.agent import DQNAgent
+
     # 创建 DQNAgent 实例，学习率等参数在推理时通常不重要
     loaded_agent = DQNAgent(state_size, action_size, lr=1e-4) # lr 可以是任意值，因为不训练
     print(f"已初始化 DQN 智能体 (state_size={state_size}, action_size={action_size})。")
 
     # --- 5. 加载模型权重 ---
-    if not model_path.exists():
-        raise FileNotFoundError(f"模型文件未找到: {model_path}")
-
     try:
         checkpoint = torch.load(model_path, map_location=torch.device('cpu')) # 使用 CPU 加载
         loaded_agent.q_network.load_state_dict(checkpoint['q_state_dict'])
         # loaded_agent.target_network.load_state_dict(checkpoint['target_state_dict']) # 推理时通常不需要
         loaded_agent.q_network.eval() # 设置为评估模式，关闭 dropout/batchnorm 等
         print(f"已从 {model_path} 加载模型权重。")
+        if model_format != 'eager':
+            # 推理改用 TorchScript / int8 模块, 智能体的其余部分不变
+            loaded_agent.q_network = load_q_network(model_path, state_size, action_size, model_format)
+            print(f"推理使用 {model_format} 格式的模型。")
     except Exception as e:
         print(f"加载模型权重失败: {e}")
         raise
 
+    _loaded[key] = (loaded_agent, loaded_env)
     return loaded_agent, loaded_env
 
 if __name__ == "__main__":
@@ -0,0 +1,579 @@
+"""
+路径规划推理服务
+进程级常驻的强化学习决策服务:
+    - web 服务进程启动时(wsgi.py / asgi.py)预热加载模型和医院数据, 其他进程首次决策时懒加载, 整个进程只加载一次
+    - 多线程 WSGI 下通过锁保证只初始化一次, 推理路径本身不修改任何共享状态
+    - get_route / check_order 统一调用 decide(order) 获取决策
+    - 最近医院查询走空间索引, 后台增删改医院时由 signals 同步
+    - 库存以 data/hospitals.json 冷启动, 首次决策前替换为 HospitalInventory 表中的实时库存,
+      之后库存表的增删改由 signals 增量同步, 每次变化递增 inventory_version;
+      其他进程写入的库存通过共享的库存水位号在每次决策前追上(见 inventory_sync)
+    - 决策结果缓存在 Django 缓存中(见 decision_cache), 库存变化只使依赖这些医院和药品的缓存项失效
+    - 模型检查点更新后由 model_reloader 在后台加载、校验并原子替换 Q 网络, 无需重启进程
+    - 配置了候选检查点时, 候选模型在后台线程中对同样的状态做影子评估(见 shadow_mode), 不影响请求延迟
+"""
+
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from django.conf import settings
+
+from . import decision_cache, inventory_sync
+from .inference_batcher import MicroBatcher
+from .rl_components.hospital_arrays import HospitalArrays
+from .rl_components.numpy_policy import predict_q
+from .rl_components.states import TOP_K_HOSPITALS
+
+
+@dataclass
+class Decision:
+    """
+    一次路径决策的结果
+    """
+    #动作索引
+    action_index: int
+    #动作类型: select_hospital / wait_for_restock / redirect_alternative / split_order
+    action: str
+    #选中的医院(select_hospital 时为选中医院, redirect_alternative 时为最近且库存足够的医院)
+    hospital: Optional[Dict[str, Any]] = None
+    #选择理由
+    reasons: List[str] = field(default_factory=list)
+    message: str = ''
+    #用户到医院的距离(公里)
+    distance: float = 0.0
+    #库存匹配度
+    inventory_match: float = 0.0
+
+
+def build_user_request(order):
+    """
+    把 Order 模型实例(或同字段的字典)转换为强化学习组件使用的 user_request
+    """
+    if isinstance(order, dict):
+        return {
+            'latitude': order.get('latitude', 0),
+            'longitude': order.get('longitude', 0),
+            'items': order.get('items', []) or [],
+        }
+    return {
+        'latitude': order.latitude,
+        'longitude': order.longitude,
+        'items': order.items or [],
+    }
+
+
+class RoutingService:
+    """
+    路径决策服务(单例)
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._agent = None
+        self._env = None
+        self._batcher = None
+        self._model_reloader = None
+        self._shadow = None
+        # (医院字典列表, HospitalArrays), 医院增删改时整体替换, 读取方拿到的总是一致的一对
+        self._catalog = None
+        # 医院名称 -> 行号
+        self._row_by_name = {}
+        # 库存版本号, 医院或库存发生任何变化时递增
+        self._inventory_version = 0
+        # 是否已经从数据库加载过实时库存
+        self._live_synced = False
+        # 内存中的库存已经追上的库存水位号, 同一时间只有一个线程追赶
+        self._watermark = None
+        self._sync_lock = threading.Lock()
+
+    @property
+    def inventory_version(self):
+        return self._inventory_version
+
+    @property
+    def is_loaded(self):
+        return self._agent is not None and self._env is not None
+
+    def warm_up(self):
+        """
+        加载模型和环境, 重复调用只会加载一次
+        """
+        if self.is_loaded:
+            return
+        with self._lock:
+            if self.is_loaded:
+                return
+            from .model_reloader import ModelReloader, checkpoint_path
+            from .rl_model_loader import load_model_and_environment
+            path = checkpoint_path()
+            model_format = getattr(settings, 'ROUTE_MODEL_FORMAT', 'numpy')
+            agent, env = load_model_and_environment(path, model_format)
+            threads = getattr(settings, 'ROUTE_TORCH_NUM_THREADS', 1)
+            if model_format != 'numpy' and threads:
+                import torch
+
+                # torch 默认按核数开线程做矩阵运算, 会和请求线程争抢 CPU; 主模型和影子评估的候选模型共用这一设置
+                torch.set_num_threads(int(threads))
+            # 服务只做贪婪推理
+            agent.epsilon = 0.0
+            self._env = env
+            self._set_catalog(list(env.hospitals_template))
+            self._agent = agent
+            self._model_reloader = ModelReloader(self, path, model_format)
+            interval = getattr(settings, 'ROUTE_MODEL_WATCH_INTERVAL', 0)
+            if interval:
+                self._model_reloader.start(interval)
+            shadow_path = getattr(settings, 'ROUTE_SHADOW_MODEL_PATH', None)
+            if shadow_path:
+                self.start_shadow(shadow_path)
+            if getattr(settings, 'ROUTE_BATCHING_ENABLED', False):
+                self._batcher = MicroBatcher(
+                    self._predict_q,
+                    max_batch_size=getattr(settings, 'ROUTE_BATCH_MAX_SIZE', 32),
+                    flush_window_ms=getattr(settings, 'ROUTE_BATCH_WINDOW_MS', 2.0),
+                )
+
+    def reload_model(self, force=False, broadcast=False):
+        """
+        重新加载模型检查点(内容没有变化且 force 为 False 时不替换)
+        broadcast: 本进程加载成功(或内容没有变化)后通知其他 web 进程重载
+        返回: 是否替换了模型
+        """
+        self.warm_up()
+        reloaded = self._model_reloader.reload(force=force)
+        if broadcast and self._model_reloader.last_error is None:
+            self._model_reloader.broadcast()
+        return reloaded
+
+    def swap_q_network(self, network):
+        """
+        替换推理使用的 Q 网络: 一次属性赋值, 已经开始的前向计算继续使用旧网络
+        """
+        self._agent.q_network = network
+        # 缓存中的决策来自旧模型
+        decision_cache.bump_version()
+
+    def start_shadow(self, path):
+        """
+        开始用候选检查点做影子评估(替换正在进行的影子评估), 加载失败时不影响主模型
+        返回: 是否启动成功
+        """
+        from .shadow_mode import ShadowEvaluator
+        try:
+            shadow = ShadowEvaluator(
+                path,
+                self._env.state_space.state_dimensions,
+                self._env.action_space.action_size,
+                self._env.action_space.num_hospitals,
+                queue_size=getattr(settings, 'ROUTE_SHADOW_QUEUE_SIZE', 1024),
+                log_path=getattr(settings, 'ROUTE_SHADOW_LOG_PATH', None),
+                model_format=self._model_reloader.model_format,
+            )
+        except Exception as e:
+            print(f"候选模型加载失败, 不做影子评估: {e}")
+            return False
+        self.stop_shadow()
+        self._shadow = shadow
+        print(f"已开始影子评估候选模型: {path}")
+        return True
+
+    def stop_shadow(self):
+        shadow, self._shadow = self._shadow, None
+        if shadow is not None:
+            shadow.close()
+
+    def decide(self, order):
+        """
+        为订单做出配送决策
+
+        参数:
+            order: Order 实例或包含 latitude/longitude/items 的字典
+        返回:
+            Decision
+        """
+        self.warm_up()
+        user_request = build_user_request(order)
+        if not decision_cache.is_enabled():
+            self._sync_live_inventory()
+            return self._decide(user_request)
+        # 缓存项和库存水位号在同一次 get_many 中读出
+        entry, values = decision_cache.get_decision(user_request, inventory_sync.WATERMARK_KEY)
+        shared_watermark = values.get(inventory_sync.WATERMARK_KEY)
+        watermark = self._sync_live_inventory(shared_watermark)
+        hospitals, arrays = self._catalog
+        # 本进程的库存已经追上共享水位号时, 前 5 家医院的库存总量可以直接和本地库存比较
+        if entry is not None and watermark == shared_watermark and self._totals_unchanged(entry['totals'], arrays):
+            cached = entry['decision']
+            # 缓存中只有动作, 用当前的医院数据重建决策(依赖的库存没有变化, 结果与重新计算的相同)
+            decision = self._to_decision(user_request, cached['action_index'], hospitals)
+            if decision.action == cached['action'] and (decision.hospital or {}).get('name') == cached['hospital']:
+                return decision
+        totals = {}
+        decision = self._decide(user_request, totals)
+        decision_cache.set_decision(
+            user_request,
+            {
+                'action_index': decision.action_index,
+                'action': decision.action,
+                'hospital': (decision.hospital or {}).get('name'),
+            },
+            totals,
+            {inventory_sync.WATERMARK_KEY: watermark},
+        )
+        return decision
+
+    def decide_many(self, orders):
+        """
+        批量决策(后台派单使用): 所有订单的状态向量只做一次批量前向计算, 不经过决策缓存
+
+        参数:
+            orders: Order 实例或字典的列表
+        返回:
+            list[Decision], 与 orders 一一对应
+        """
+        self.warm_up()
+        self._sync_live_inventory()
+        user_requests = [build_user_request(order) for order in orders]
+        if not user_requests:
+            return []
+        hospitals, arrays = self._catalog
+        states = np.stack([
+            np.asarray(self._env.state_space.build_state_vector(r, arrays, r['items']), dtype=np.float32)
+            for r in user_requests
+        ])
+        q_values = self._predict_q(states)
+        actions = np.argmax(q_values, axis=1)
+        shadow = self._shadow
+        if shadow is not None:
+            shadow.submit(states, q_values)
+        return [
+            self._to_decision(r, int(action), hospitals)
+            for r, action in zip(user_requests, actions)
+        ]
+
+    def _decide(self, user_request, totals=None):
+        """
+        totals: 传入字典时, 写入状态向量中前 5 家医院的 {名称: 库存总量}(决策依赖它们的库存总量)
+        """
+        # 决策路径只读医院数据, 不需要像 env.reset 那样深拷贝库存
+        hospitals, arrays = self._catalog
+        state = self._env.state_space.build_state_vector(user_request, arrays, user_request['items'])
+        if totals is not None:
+            # 每家医院 6 个特征, 前两个是坐标; 按坐标找回行号(坐标相同的医院一并计入)
+            for offset in range(4, min(len(state), 4 + 6 * TOP_K_HOSPITALS), 6):
+                rows = np.flatnonzero(
+                    (arrays.latitudes == state[offset]) & (arrays.longitudes == state[offset + 1])
+                )
+                totals.update((hospitals[row].get('name'), int(arrays.total_inventory[row])) for row in rows)
+        return self._to_decision(user_request, self._select_action(state), hospitals)
+
+    def _totals_unchanged(self, totals, arrays):
+        """
+        缓存项记录的前 5 家医院库存总量与当前库存是否一致
+        """
+        for name, total in totals.items():
+            row = self._row_by_name.get(name)
+            if row is None or row >= len(arrays.total_inventory) or int(arrays.total_inventory[row]) != total:
+                return False
+        return True
+
+    def _to_decision(self, user_request, action, hospitals):
+        """
+        执行动作并整理为 Decision
+        """
+        order_items = user_request['items']
+        execution_result = self._env.action_space.execute_action(action, user_request, hospitals)
+        decision = Decision(
+            action_index=action,
+            action=execution_result.get('action', 'default'),
+            hospital=execution_result.get('hospital'),
+            reasons=execution_result.get('reasons', []),
+            message=execution_result.get('message', ''),
+            distance=execution_result.get('distance', 0),
+            inventory_match=execution_result.get('inventory_match', 0),
+        )
+        if decision.action == 'redirect_alternative':
+            # 重定向的目标: 离用户最近且能满足整单的医院
+            hospital, distance = self.nearest_sufficient_hospital(
+                user_request['latitude'], user_request['longitude'], order_items
+            )
+            if hospital is not None:
+                decision.hospital = hospital
+                decision.distance = distance
+                decision.inventory_match = 1.0
+        return decision
+
+    def nearest_hospitals(self, latitude, longitude, k=5):
+        """
+        离指定位置最近的 k 家医院
+        返回: [(医院字典, 距离公里数), ...], 由近到远
+        """
+        self.warm_up()
+        hospitals, arrays = self._catalog
+        rows = arrays.spatial_index.nearest(float(latitude), float(longitude), k)
+        return [(hospitals[row], arrays.exact_distance(latitude, longitude, row)) for row in rows]
+
+    def nearest_sufficient_hospital(self, latitude, longitude, order_items):
+        """
+        离指定位置最近且库存能满足整单的医院, 判断规则与环境的 redirect_alternative 一致
+        返回: (医院字典, 距离公里数), 没有满足条件的医院时为 (None, None)
+        """
+        self.warm_up()
+        hospitals, arrays = self._catalog
+        needs = [(it.get('name') or str(it.get('id')), int(it.get('quantity', 1))) for it in order_items]
+        sufficient = arrays.sufficient_rows(needs)
+        if not len(sufficient):
+            return None, None
+        sufficient = set(sufficient.tolist())
+
+        latitude, longitude = float(latitude), float(longitude)
+        row, distance = arrays.spatial_index.nearest_where(
+            latitude, longitude, sufficient.__contains__,
+            lambda r: arrays.exact_distance(latitude, longitude, r),
+        )
+        return (hospitals[row], distance) if row is not None else (None, None)
+
+    def upsert_hospital(self, name, latitude, longitude):
+        """
+        后台新增或修改医院坐标后同步到服务(按名称匹配), 服务尚未加载时无需处理
+        新增的医院没有库存数据, 只参与最近医院查询; 它不在模型的动作空间内, 不会被模型直接选中
+        """
+        if not self.is_loaded:
+            return
+        with self._lock:
+            hospitals = list(self._catalog[0])
+            for row, hospital in enumerate(hospitals):
+                if hospital.get('name') == name:
+                    hospitals[row] = dict(hospital, latitude=float(latitude), longitude=float(longitude))
+                    break
+            else:
+                next_id = max((h.get('id') or 0 for h in hospitals), default=0) + 1
+                hospitals.append({
+                    'id': next_id,
+                    'name': name,
+                    'latitude': float(latitude),
+                    'longitude': float(longitude),
+                    'inventory': {},
+                })
+            self._set_catalog(hospitals)
+        decision_cache.bump_version()
+
+    def remove_hospital(self, name):
+        """
+        后台删除医院后同步到服务
+        模型动作空间内的医院保留位置但清空库存(动作编号不能变化), 其余医院直接移除
+        """
+        if not self.is_loaded:
+            return
+        with self._lock:
+            fixed_rows = self._env.action_space.num_hospitals
+            hospitals = []
+            for row, hospital in enumerate(self._catalog[0]):
+                if hospital.get('name') != name:
+                    hospitals.append(hospital)
+                elif row < fixed_rows:
+                    hospitals.append(dict(hospital, inventory={}))
+            self._set_catalog(hospitals)
+        decision_cache.bump_version()
+
+    def _sync_live_inventory(self, watermark=None):
+        """
+        决策前追上其他进程写入的库存:
+        首次决策时从数据库加载全部实时库存(失败时继续使用冷启动快照),
+        之后每次读一次共享的库存水位号, 落后时只重新读取期间发生变化的库存行
+
+        参数:
+            watermark: 调用方已经读到的库存水位号, None 时在这里读取
+        返回:
+            内存中的库存对应的库存水位号, 未知时为 None
+        """
+        if watermark is None:
+            watermark = inventory_sync.current_watermark()
+        if not getattr(settings, 'ROUTE_LIVE_INVENTORY', True):
+            # 只使用本进程内的库存, 以决策前读到的水位号为准
+            return watermark
+        if self._live_synced and (watermark is None or watermark == self._watermark):
+            return self._watermark
+        with self._sync_lock:
+            if self._live_synced and watermark == self._watermark:
+                return self._watermark
+            try:
+                pairs = inventory_sync.changed_pairs(self._watermark, watermark) if self._live_synced else None
+                if pairs is None:
+                    self._load_live_inventory(watermark)
+                else:
+                    stock = inventory_sync.load_stock(pairs)
+                    with self._lock:
+                        for (hospital_name, medicine_name), quantity in stock.items():
+                            self._set_stock_locked(hospital_name, medicine_name, quantity)
+                    self._watermark = watermark
+            except Exception as e:
+                print(f"实时库存同步失败, 继续使用内存中的库存: {e}")
+            return self._watermark
+
+    def reload_inventory(self):
+        """
+        用一次批量查询从 HospitalInventory 重新加载全部库存
+        返回: 是否使用了数据库中的库存(库存表为空时回到冷启动快照)
+        """
+        self.warm_up()
+        with self._sync_lock:
+            # 首次加载发生在任何决策之前, 不需要使已有的决策缓存失效
+            reloaded = self._live_synced
+            found = self._load_live_inventory(inventory_sync.current_watermark())
+        if reloaded:
+            decision_cache.bump_version()
+        return found
+
+    def _load_live_inventory(self, watermark):
+        """
+        整体加载实时库存, watermark 为加载之前读到的库存水位号(加载期间发生的变化下次决策时会再应用一遍)
+        """
+        self.warm_up()
+        from .live_inventory import load_live_hospitals
+        with self._lock:
+            hospitals = load_live_hospitals(self._env.hospitals_template)
+            self._live_synced = True
+            self._watermark = watermark
+            if hospitals is None:
+                self._set_catalog(list(self._env.hospitals_template))
+            else:
+                self._set_catalog(hospitals)
+                print(f"已从数据库加载 {len(hospitals)} 家医院的实时库存。")
+        return hospitals is not None
+
+    def set_stock(self, hospital_name, medicine_name, quantity):
+        """
+        库存表单条记录变化(事务提交)后增量同步到服务, 并通知其他进程
+
+        参数:
+            quantity: 新的库存数量, None 表示该记录已删除
+        """
+        if self.is_loaded:
+            with self._lock:
+                self._set_stock_locked(hospital_name, medicine_name, quantity)
+        inventory_sync.publish_changes([(hospital_name, medicine_name)])
+
+    def adjust_stock(self, hospital_name, medicine_name, delta):
+        """
+        按变化量同步一条库存
+        """
+        self.adjust_stock_many([(hospital_name, medicine_name, delta)])
+
+    def adjust_stock_many(self, changes):
+        """
+        按变化量同步库存(批量 UPDATE 不会触发 signals, 由库存预留在事务提交后调用), 并通知其他进程
+
+        参数:
+            changes: [(医院名称, 药品名称, 变化量), ...]
+        """
+        if self.is_loaded:
+            with self._lock:
+                for hospital_name, medicine_name, delta in changes:
+                    hospitals, _ = self._catalog
+                    row = self._row_by_name.get(hospital_name)
+                    if row is None:
+                        continue
+                    current = int((hospitals[row].get('inventory') or {}).get(medicine_name, 0))
+                    self._set_stock_locked(hospital_name, medicine_name, max(0, current + int(delta)))
+        inventory_sync.publish_changes([(h, m) for h, m, _ in changes])
+
+    def _set_stock_locked(self, hospital_name, medicine_name, quantity):
+        hospitals, arrays = self._catalog
+        row = self._row_by_name.get(hospital_name)
+        if row is None:
+            return
+        inventory = dict(hospitals[row].get('inventory') or {})
+        if quantity is None:
+            inventory.pop(medicine_name, None)
+        else:
+            inventory[medicine_name] = int(quantity)
+        col = arrays.medicine_index.get(medicine_name)
+        if col is None:
+            # 新药品需要新增一列, 重建数组
+            hospitals = list(hospitals)
+            hospitals[row] = dict(hospitals[row], inventory=inventory)
+            self._set_catalog(hospitals)
+            return
+        quantity = int(quantity or 0)
+        # 原地更新库存矩阵、库存总量和倒排索引, 医院字典整体替换(不修改环境模板中的字典)
+        arrays.total_inventory[row] += quantity - arrays.inventory[row, col]
+        arrays.inventory[row, col] = quantity
+        arrays.stock_index.set_quantity(row, medicine_name, quantity)
+        hospitals[row] = dict(hospitals[row], inventory=inventory)
+        arrays.hospitals[row] = hospitals[row]
+        self._inventory_version += 1
+
+    def _set_catalog(self, hospitals):
+        """
+        用新的医院列表重建数组、空间索引和距离缓存, 旧的距离缓存随之失效
+        """
+        arrays = HospitalArrays(
+            hospitals,
+            distance_cache_size=getattr(settings, 'ROUTE_DISTANCE_CACHE_SIZE', 4096),
+            distance_cache_cell=getattr(settings, 'ROUTE_DISTANCE_CACHE_CELL_DEGREES', None),
+        )
+        previous = self._catalog
+        self._catalog = (hospitals, arrays)
+        self._row_by_name = {}
+        for row, hospital in enumerate(hospitals):
+            self._row_by_name.setdefault(hospital.get('name'), row)
+        self._inventory_version += 1
+        self._env.action_space.distance_cache = arrays.distance_cache
+        if previous is not None and previous[1].distance_cache is not None:
+            previous[1].distance_cache.clear()
+
+    def stats(self):
+        """
+        服务运行统计, 开启微批处理时包含实际达到的批大小分布
+        """
+        return {
+            'loaded': self.is_loaded,
+            'hospitals': len(self._catalog[0]) if self._catalog is not None else 0,
+            'live_inventory': self._live_synced,
+            'inventory_watermark': self._watermark,
+            'inventory_version': self._inventory_version,
+            'distance_cache': (
+                self._catalog[1].distance_cache.stats()
+                if self._catalog is not None and self._catalog[1].distance_cache is not None else None
+            ),
+            'batching': self._batcher.stats() if self._batcher is not None else None,
+            'model': self._model_reloader.stats() if self._model_reloader is not None else None,
+            'shadow': self._shadow.stats() if self._shadow is not None else None,
+        }
+
+    def _predict_q(self, states):
+        """
+        批量计算 Q 值: (B, state_size) -> (B, action_size)
+        """
+        # 先取出网络引用, 热更新替换网络不影响这次计算; numpy 格式的模型不需要 torch
+        return predict_q(self._agent.q_network, states)
+
+    def _select_action(self, state):
+        if self._batcher is not None:
+            action, q_values = self._batcher.submit(state)
+        else:
+            q_values = self._predict_q(np.asarray(state, dtype=np.float32)[None, :])[0]
+            action = int(np.argmax(q_values))
+        shadow = self._shadow
+        if shadow is not None:
+            shadow.submit(state, q_values)
+        return action
+
+
+# 单例实例
+routing_service = RoutingService()
+
+
+def preload_routing_service():
+    """
+    web 服务进程启动时预热决策服务, 避免第一个请求承担模型加载开销(由 wsgi.py / asgi.py 调用)
+    """
+    if not getattr(settings, 'ROUTE_SERVICE_EAGER_LOAD', True):
+        return
+    try:
+        routing_service.warm_up()
+    except Exception as e:
+        # 加载失败时不阻止项目启动, 首次请求时会再次尝试加载
+        print(f"路径决策服务预热失败: {e}")
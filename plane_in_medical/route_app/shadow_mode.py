@@ -0,0 +1,232 @@
+"""
+候选模型影子评估
+上线新检查点之前, 让候选 Q 网络在真实订单上"陪跑":
+    - 主模型每次决策后把状态和主模型的 Q 值复制一份放进有界队列, 队列满时直接丢弃, 不阻塞请求
+    - 后台线程每隔 FLUSH_INTERVAL 秒按批取出, 用候选网络计算 Q 值, 比较两者的贪婪动作
+    - 动作不一致时记录两边的动作和 Q 值(内存中保留最近若干条, 配置了日志文件时追加一行 JSON)
+    - 汇总计数写入 Django 缓存, 多个 web 进程共享, shadow_report 命令据此和日志文件输出分歧报告
+候选网络的计算全部在后台线程中进行, 请求路径上只有一次数组拷贝和一次非阻塞入队。
+"""
+
+import json
+import queue
+import threading
+from collections import Counter, deque
+from pathlib import Path
+
+import numpy as np
+from django.core.cache import cache
+from django.utils import timezone
+
+from .rl_components.numpy_policy import content_hash, predict_q
+from .rl_components.rewards import ACTION_KINDS
+from .rl_model_loader import load_q_network
+
+# 跨进程汇总计数的缓存键前缀(后接候选检查点的内容哈希前缀)
+COUNTER_KEY = 'route_shadow:{}:{}'
+COUNTERS = ('compared', 'diverged', 'dropped')
+# 后台线程取队列的间隔(秒)
+FLUSH_INTERVAL = 0.05
+# 内存中保留的最近分歧条数(只保留摘要字段, 完整的 Q 向量和状态只写入日志)
+RECENT_DIVERGENCES = 100
+RECENT_FIELDS = ('time', 'primary_action', 'candidate_action', 'primary_q', 'candidate_q')
+
+
+def action_kind(action, num_hospitals):
+    """
+    动作索引 -> 动作类型名称
+    """
+    return ACTION_KINDS[max(int(action) - num_hospitals + 1, 0)]
+
+
+class ShadowEvaluator:
+    """
+    候选模型影子评估器
+
+    参数:
+        path: 候选检查点路径
+        state_size / action_size / num_hospitals: 与主模型相同的维度
+        queue_size: 待评估队列的容量, 满时丢弃新的状态
+        batch_size: 后台线程每次最多评估的状态数
+        log_path: 分歧日志(JSONL), None 表示只保留在内存中
+        model_format: 候选模型的推理格式, 与主模型相同(numpy 格式时 web 进程不会因此导入 torch)
+    """
+    def __init__(self, path, state_size, action_size, num_hospitals,
+                 queue_size=1024, batch_size=256, log_path=None, model_format='eager'):
+        self.path = str(path)
+        self.action_size = action_size
+        self.num_hospitals = num_hospitals
+        self.batch_size = int(batch_size)
+        self.log_path = Path(log_path) if log_path else None
+        self.candidate_hash = content_hash(path)
+        self.model_format = model_format
+        # torch 的线程数由决策服务按 ROUTE_TORCH_NUM_THREADS 统一设置, 候选模型与主模型相同
+        self.network = load_q_network(path, state_size, action_size, model_format)
+        self._queue = queue.Queue(maxsize=int(queue_size))
+        self._lock = threading.Lock()
+        self._counts = Counter()
+        self._kind_pairs = Counter()
+        self._recent = deque(maxlen=RECENT_DIVERGENCES)
+        self._dropped_published = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='route-shadow', daemon=True)
+        self._thread.start()
+
+    def submit(self, states, primary_q):
+        """
+        提交主模型的一批状态和 Q 值(请求路径上调用, 从不阻塞)
+        """
+        states = np.array(states, dtype=np.float32, copy=True, ndmin=2)
+        primary_q = np.array(primary_q, dtype=np.float32, copy=True, ndmin=2)
+        for state, q_values in zip(states, primary_q):
+            try:
+                self._queue.put_nowait((state, q_values))
+            except queue.Full:
+                with self._lock:
+                    self._counts['dropped'] += 1
+
+    def _run(self):
+        # 定时醒来一次取空队列, 入队时不唤醒后台线程, 避免和请求线程争抢 CPU
+        while not self._stop.wait(FLUSH_INTERVAL):
+            self._flush()
+        self._flush()
+
+    def _flush(self):
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            try:
+                self._compare(batch)
+            except Exception as e:
+                print(f"影子模型评估失败: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _compare(self, batch):
+        states = np.stack([state for state, _ in batch])
+        primary_q = np.stack([q for _, q in batch])
+        candidate_q = predict_q(self.network, states)
+        primary_actions = primary_q.argmax(axis=1)
+        candidate_actions = candidate_q.argmax(axis=1)
+        diverged = np.flatnonzero(primary_actions != candidate_actions)
+
+        records = []
+        for i in diverged:
+            p, c = int(primary_actions[i]), int(candidate_actions[i])
+            records.append({
+                'time': timezone.now().isoformat(),
+                'primary_action': p,
+                'candidate_action': c,
+                'primary_kind': action_kind(p, self.num_hospitals),
+                'candidate_kind': action_kind(c, self.num_hospitals),
+                # 两个模型对两个动作的估值
+                'primary_q': [float(primary_q[i, p]), float(primary_q[i, c])],
+                'candidate_q': [float(candidate_q[i, p]), float(candidate_q[i, c])],
+                'primary_q_values': primary_q[i].round(4).tolist(),
+                'candidate_q_values': candidate_q[i].round(4).tolist(),
+                'state': states[i].round(6).tolist(),
+            })
+        with self._lock:
+            self._counts['compared'] += len(batch)
+            self._counts['diverged'] += len(records)
+            for record in records:
+                self._kind_pairs[(record['primary_kind'], record['candidate_kind'])] += 1
+                self._recent.append({k: record[k] for k in RECENT_FIELDS})
+            dropped = self._counts['dropped'] - self._dropped_published
+            self._dropped_published = self._counts['dropped']
+        self._publish({'compared': len(batch), 'diverged': len(records), 'dropped': dropped})
+        if records and self.log_path is not None:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(dict(record, candidate=self.candidate_hash[:12])) + '\n')
+
+    def _publish(self, deltas):
+        # 累加到共享缓存, 失败只影响跨进程报告
+        try:
+            for name, delta in deltas.items():
+                if delta:
+                    key = COUNTER_KEY.format(self.candidate_hash[:12], name)
+                    cache.add(key, 0, None)
+                    cache.incr(key, delta)
+        except Exception as e:
+            print(f"发布影子评估计数失败: {e}")
+
+    def drain(self):
+        """
+        等待队列中已提交的状态全部评估完(测试和关闭前使用)
+        """
+        self._queue.join()
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+
+    def stats(self):
+        with self._lock:
+            compared = self._counts['compared']
+            diverged = self._counts['diverged']
+            return {
+                'candidate_path': self.path,
+                'candidate_hash': self.candidate_hash,
+                'format': self.model_format,
+                'queue_depth': self._queue.qsize(),
+                'compared': compared,
+                'diverged': diverged,
+                'dropped': self._counts['dropped'],
+                'divergence_rate': diverged / compared if compared else 0.0,
+                'kind_pairs': {f'{p}->{c}': n for (p, c), n in self._kind_pairs.most_common()},
+                'recent': list(self._recent)[-10:],
+            }
+
+
+def shared_counts(candidate_hash):
+    """
+    所有进程累计的 compared / diverged / dropped
+    """
+    keys = {name: COUNTER_KEY.format(candidate_hash[:12], name) for name in COUNTERS}
+    values = cache.get_many(list(keys.values()))
+    return {name: int(values.get(key) or 0) for name, key in keys.items()}
+
+
+def divergence_report(log_path, candidate=None, top=10):
+    """
+    汇总分歧日志: 动作类型转移、最常见的动作对, 以及两个模型对彼此选择的估值差
+    candidate: 只统计该候选检查点(内容哈希前缀)的记录, None 表示全部
+    """
+    kind_pairs = Counter()
+    action_pairs = Counter()
+    primary_gap = []
+    candidate_gap = []
+    candidates = Counter()
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if candidate is not None and not record.get('candidate', '').startswith(candidate[:12]):
+                continue
+            candidates[record.get('candidate')] += 1
+            kind_pairs[(record['primary_kind'], record['candidate_kind'])] += 1
+            action_pairs[(record['primary_action'], record['candidate_action'])] += 1
+            # 主模型认为候选动作比自己的差多少, 候选模型认为自己的动作比主模型的好多少
+            primary_gap.append(record['primary_q'][0] - record['primary_q'][1])
+            candidate_gap.append(record['candidate_q'][1] - record['candidate_q'][0])
+    return {
+        'divergences': sum(kind_pairs.values()),
+        'candidates': dict(candidates),
+        'kind_pairs': {f'{p}->{c}': n for (p, c), n in kind_pairs.most_common()},
+        'top_action_pairs': [
+            {'primary_action': p, 'candidate_action': c, 'count': n}
+            for (p, c), n in action_pairs.most_common(top)
+        ],
+        'mean_primary_q_gap': float(np.mean(primary_gap)) if primary_gap else 0.0,
+        'mean_candidate_q_gap': float(np.mean(candidate_gap)) if candidate_gap else 0.0,
+    }
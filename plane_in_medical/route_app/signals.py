@@ -0,0 +1,34 @@
+"""
+医院数据、库存数据变更时同步路径决策服务
+    - Hospital: 医院坐标和空间索引
+    - HospitalInventory: 内存中的库存表(增量更新), 事务提交后再同步, 其他进程此时才能从数据库读到新的数量
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Hospital, HospitalInventory
+from .routing_service import routing_service
+
+
+@receiver(post_save, sender=Hospital)
+def sync_hospital_on_save(sender, instance, **kwargs):
+    routing_service.upsert_hospital(instance.name, instance.latitude, instance.longitude)
+
+
+@receiver(post_delete, sender=Hospital)
+def sync_hospital_on_delete(sender, instance, **kwargs):
+    routing_service.remove_hospital(instance.name)
+
+
+@receiver(post_save, sender=HospitalInventory)
+def sync_stock_on_save(sender, instance, **kwargs):
+    hospital_name, medicine_name, quantity = instance.hospital.name, instance.medicine.name, instance.quantity
+    transaction.on_commit(lambda: routing_service.set_stock(hospital_name, medicine_name, quantity))
+
+
+@receiver(post_delete, sender=HospitalInventory)
+def sync_stock_on_delete(sender, instance, **kwargs):
+    hospital_name, medicine_name = instance.hospital.name, instance.medicine.name
+    transaction.on_commit(lambda: routing_service.set_stock(hospital_name, medicine_name, None))
@@ -1,3 +1,1261 @@
-from django.test import TestCase
+import json
+from pathlib import Path
+
+from django.test import SimpleTestCase, TestCase, override_settings
 
 # Create your tests here.
+DATA_DIR = Path(__file__).resolve().parent.parent / 'data'
+
+
+def load_orders(limit=None):
+    orders = []
+    with open(DATA_DIR / 'data_pool.jsonl', 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                orders.append(json.loads(line))
+            if limit is not None and len(orders) >= limit:
+                break
+    return orders
+
+
+def restore_routing_snapshot():
+    """
+    清空测试中创建的医院和库存, 让决策服务回到 hospitals.json 快照, 避免影响其他测试
+    """
+    from .models import Hospital
+    from .routing_service import routing_service
+
+    Hospital.objects.all().delete()
+    routing_service.reload_inventory()
+
+
+@override_settings(ROUTE_LIVE_INVENTORY=False)
+class RoutingServiceTests(SimpleTestCase):
+    def test_decide_matches_environment_reset(self):
+        """
+        服务的只读决策路径与 env.reset 构建的状态、torch 的 Q 网络得到相同动作
+        """
+        import numpy as np
+        import torch
+        from .routing_service import routing_service
+        from .rl_components.export import load_eager
+        from .rl_model_loader import DEFAULT_MODEL_PATH, load_model_and_environment
+
+        agent, env = load_model_and_environment()
+        q_network = load_eager(DEFAULT_MODEL_PATH, agent.state_size, agent.action_size)
+        for order in load_orders(limit=50):
+            decision = routing_service.decide(order)
+            state = env.reset(order, order['items'])
+            with torch.no_grad():
+                q_values = q_network(torch.FloatTensor(state).unsqueeze(0))
+            self.assertEqual(decision.action_index, int(np.argmax(q_values.numpy())))
+
+    def test_only_server_processes_preload(self):
+        """
+        django.setup() 不加载模型(migrate、管理命令等), 加载 wsgi application 的进程才预热
+        """
+        import os
+        import subprocess
+        import sys
+
+        code = (
+            "import django; django.setup();"
+            "from route_app.routing_service import routing_service as s; print(s.is_loaded);"
+            "import plane_in_medical.wsgi; print(s.is_loaded)"
+        )
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'plane_in_medical.settings'))
+        out = subprocess.run([sys.executable, '-c', code], cwd=Path(__file__).resolve().parent.parent,
+                             env=env, capture_output=True, text=True, check=True).stdout.split()
+        self.assertEqual([line for line in out if line in ('True', 'False')], ['False', 'True'])
+
+    def test_loader_caches_per_path_and_format(self):
+        """
+        先加载 eager 后再请求 numpy 格式, 得到的是 NumPy 推理权重, 与调用顺序无关
+        """
+        from .rl_components.numpy_policy import NumpyQNetwork
+        from .rl_model_loader import DEFAULT_MODEL_PATH, load_model_and_environment
+
+        eager, _ = load_model_and_environment(DEFAULT_MODEL_PATH, 'eager')
+        numpy_agent, _ = load_model_and_environment(DEFAULT_MODEL_PATH, 'numpy')
+        self.assertNotIsInstance(eager.q_network, NumpyQNetwork)
+        self.assertIsInstance(numpy_agent.q_network, NumpyQNetwork)
+        self.assertIs(load_model_and_environment(str(DEFAULT_MODEL_PATH), 'numpy')[0], numpy_agent)
+        self.assertIs(load_model_and_environment(None, 'eager')[0], eager)
+
+    def test_numpy_runtime_matches_torch(self):
+        """
+        纯 NumPy 前向计算与 torch 的贪婪动作在整个订单池上一致, 随仓库提交的 .npz 对应当前检查点
+        """
+        import numpy as np
+        from .rl_components.export import load_eager, predict
+        from .rl_components.numpy_policy import NumpyQNetwork, content_hash, npz_path
+        from .rl_components.vec_environment import VecDroneDeliveryEnvironment
+        from .rl_model_loader import DEFAULT_MODEL_PATH
+
+        network = NumpyQNetwork.load(npz_path(DEFAULT_MODEL_PATH))
+        self.assertEqual(network.source_hash, content_hash(DEFAULT_MODEL_PATH))
+        with open(DATA_DIR / 'hospitals.json', 'r', encoding='utf-8') as f:
+            env = VecDroneDeliveryEnvironment(json.load(f))
+        states = env.reset(load_orders())
+        expected = predict(load_eager(DEFAULT_MODEL_PATH, 36, 73), states)
+        q_values = network(states)
+        np.testing.assert_allclose(q_values, expected, rtol=1e-4, atol=1e-2)
+        np.testing.assert_array_equal(q_values.argmax(axis=1), expected.argmax(axis=1))
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def test_concurrent_submits_share_batches(self):
+        """
+        并发提交的状态被合并成批, 每个调用方拿回自己那一行的 argmax
+        """
+        import numpy as np
+        from concurrent.futures import ThreadPoolExecutor
+        from .inference_batcher import MicroBatcher
+
+        def predict(states):
+            # 第 i 行的最大 Q 值出现在 int(states[i, 0]) 列
+            q_values = np.zeros((len(states), 8), dtype=np.float32)
+            q_values[np.arange(len(states)), states[:, 0].astype(int)] = 1.0
+            return q_values
+
+        batcher = MicroBatcher(predict, max_batch_size=8, flush_window_ms=50)
+        try:
+            with ThreadPoolExecutor(max_workers=16) as pool:
+                actions = list(pool.map(lambda i: batcher.submit([i % 8, 0.0])[0], range(64)))
+        finally:
+            batcher.close()
+        self.assertEqual(actions, [i % 8 for i in range(64)])
+        stats = batcher.stats()
+        self.assertEqual(stats['requests'], 64)
+        self.assertLessEqual(max(stats['batch_size_histogram']), 8)
+        self.assertGreater(stats['mean_batch_size'], 1.0)
+
+
+class VectorizedStateTests(SimpleTestCase):
+    def test_array_state_matches_legacy_builder(self):
+        """
+        基于 HospitalArrays 的状态向量与逐医院计算的状态向量逐位一致
+        """
+        from .rl_components.hospital_arrays import HospitalArrays
+        from .rl_components.states import state_space
+
+        with open(DATA_DIR / 'hospitals.json', 'r', encoding='utf-8') as f:
+            hospitals = json.load(f)
+        arrays = HospitalArrays(hospitals)
+        for order in load_orders():
+            expected = state_space.build_state_vector(order, hospitals, order['items'])
+            actual = state_space.build_state_vector(order, arrays, order['items'])
+            self.assertEqual(actual, expected)
+
+    def test_state_batch_matches_single_builder(self):
+        """
+        build_state_batch 的每一行与逐单构建的状态向量一致
+        """
+        import numpy as np
+        from .rl_components.hospital_arrays import HospitalArrays
+        from .rl_components.states import state_space
+
+        with open(DATA_DIR / 'hospitals.json', 'r', encoding='utf-8') as f:
+            hospitals = json.load(f)
+        arrays = HospitalArrays(hospitals)
+        orders = load_orders()
+        states = state_space.build_state_batch(orders, arrays, chunk_size=300)
+        self.assertEqual(states.shape, (len(orders), state_space.state_dimensions))
+        self.assertEqual(states.dtype, np.float32)
+        expected = np.array(
+            [state_space.build_state_vector(o, arrays, o['items']) for o in orders], dtype=np.float32
+        )
+        np.testing.assert_array_equal(states, expected)
+
+
+class InventoryOverlayTests(SimpleTestCase):
+    def test_step_writes_overlay_and_reset_restores_template(self):
+        """
+        step 的库存扣减只写入增量层, reset 后恢复为模板库存, 模板本身不被修改
+        """
+        from .rl_components.environment import create_environment
+
+        with open(DATA_DIR / 'hospitals.json', 'r', encoding='utf-8') as f:
+            hospitals = json.load(f)
+        env = create_environment(hospitals)
+        order = load_orders(limit=1)[0]
+        item = order['items'][0]
+        before = env.hospitals_template[0]['inventory'].get(item['name'], 0)
+
+        first_state = env.reset(order, order['items'])
+        env.step(env.action_space.num_hospitals + 2)  # 拆单会从第一家有货的医院开始扣减
+        self.assertTrue(env.inventory.changed_rows())
+        self.assertEqual(env.hospitals_template[0]['inventory'].get(item['name'], 0), before)
+
+        self.assertEqual(env.reset(order, order['items']), first_state)
+        self.assertEqual(env.inventory.changed_rows(), [])
+        self.assertEqual(env.hospitals_data[0]['inventory'].get(item['name'], 0), before)
+
+
+class VecEnvironmentTests(SimpleTestCase):
+    def test_vec_step_matches_scalar_environment(self):
+        """
+        向量化环境每个订单的状态、下一状态、奖励与逐个调用 reset / step 一致
+        """
+        import random
+        import numpy as np
+        from .rl_components.environment import create_environment
+        from .rl_components.vec_environment import VecDroneDeliveryEnvironment
+
+        with open(DATA_DIR / 'hospitals.json', 'r', encoding='utf-8') as f:
+            hospitals = json.load(f)
+        env = create_environment(hospitals)
+        vec_env = VecDroneDeliveryEnvironment(hospitals)
+        h = vec_env.num_hospitals
+        orders = load_orders(limit=300)
+        # 没有 name 的药品交给标量环境处理
+        orders.append({'latitude': 34.3, 'longitude': 108.9, 'items': [{'id': '777', 'quantity': 2}]})
+        rng = random.Random(0)
+        actions = [rng.choice([rng.randrange(h), h, h + 1, h + 2]) for _ in orders]
+
+        for start in range(0, len(orders), 64):
+            batch = orders[start:start + 64]
+            states = vec_env.reset(batch)
+            next_states, rewards, dones, info = vec_env.step(actions[start:start + 64])
+            self.assertTrue(dones.all())
+            for i, order in enumerate(batch):
+                state = env.reset(order, order['items'])
+                next_state, reward, _, result = env.step(actions[start + i])
+                np.testing.assert_array_equal(states[i], np.float32(state))
+                np.testing.assert_array_equal(next_states[i], np.float32(next_state))
+                self.assertEqual(rewards[i], reward)
+                self.assertEqual(info['fulfilled_items'][i], result['fulfilled_items'])
+
+
+class ReplayBufferTests(SimpleTestCase):
+    def test_ring_buffer_overwrites_oldest_and_round_trips(self):
+        """
+        写满后覆盖最旧的经验, 保存再加载后按时间顺序保留最新的经验
+        """
+        import tempfile
+        import numpy as np
+        from .rl_components.replay_buffer import ReplayBuffer
+
+        buffer = ReplayBuffer(capacity=4)
+        for i in range(6):
+            buffer.add(np.full(3, i, dtype=np.float32), i, float(i), np.full(3, i + 1, dtype=np.float32), i % 2 == 0)
+        self.assertEqual(len(buffer), 4)
+        self.assertEqual(sorted(buffer.actions.tolist()), [2, 3, 4, 5])
+        states, actions, rewards, next_states, dones = buffer.sample(16)
+        self.assertEqual(states.shape, (16, 3))
+        np.testing.assert_array_equal(states[:, 0], actions)
+        np.testing.assert_array_equal(next_states[:, 0], actions + 1)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'replay.npz'
+            buffer.save(path)
+            restored = ReplayBuffer(capacity=3).load(path)
+        self.assertEqual(len(restored), 3)
+        self.assertEqual(restored.actions.tolist(), [3, 4, 5])
+        self.assertEqual(restored.dones.tolist(), [False, True, False])
+        restored.add(np.zeros(3, dtype=np.float32), 6, 6.0, np.zeros(3, dtype=np.float32), True)
+        self.assertEqual(restored.actions.tolist(), [6, 4, 5])
+
+    def test_agent_replay_samples_from_buffer(self):
+        """
+        DQNAgent 的 remember / replay 使用环形缓冲区
+        """
+        import numpy as np
+        from .rl_components.agent import DQNAgent
+
+        agent = DQNAgent(4, 3)
+        for i in range(40):
+            agent.remember(np.random.rand(4), i % 3, 1.0, np.random.rand(4), True)
+        epsilon = agent.epsilon
+        agent.replay(batch_size=16)
+        self.assertEqual(len(agent.memory), 40)
+        self.assertLess(agent.epsilon, epsilon)
+
+    def test_replay_without_epsilon_decay(self):
+        """
+        replay(decay_epsilon=False) 不改变探索率; 经验不足一批时返回 None, 否则返回浮点数损失
+        """
+        import numpy as np
+        from .rl_components.agent import DQNAgent
+
+        agent = DQNAgent(4, 3)
+        for i in range(15):
+            agent.remember(np.random.rand(4), i % 3, 1.0, np.random.rand(4), False)
+        self.assertIsNone(agent.replay(batch_size=16, decay_epsilon=False))
+        agent.remember(np.random.rand(4), 0, 1.0, np.random.rand(4), True)
+        loss = agent.replay(batch_size=16, decay_epsilon=False)
+        self.assertIsInstance(loss, float)
+        self.assertEqual(agent.epsilon, 1.0)
+        agent.decay_epsilon()
+        self.assertEqual(agent.epsilon, agent.epsilon_decay)
+
+    def test_learn_step_update_to_data_schedule(self):
+        """
+        --collect_steps K --updates_per_collect M: 每收集 K 条经验做 M 次梯度更新, 探索率每条经验衰减一次
+        """
+        from types import SimpleNamespace
+        from unittest import mock
+        import numpy as np
+        from .rl_components.agent import DQNAgent
+        from .rl_components.train import _learn_step
+
+        args = SimpleNamespace(collect_steps=3, updates_per_collect=2, batch_size=4, prioritized=False, per_beta=0.4)
+        agent = DQNAgent(4, 3)
+        updates_at = {}
+        with mock.patch.object(agent, 'replay', wraps=agent.replay) as replay:
+            for n_steps in range(1, 13):
+                transition = (np.random.rand(4), n_steps % 3, 1.0, np.random.rand(4), True)
+                calls = replay.call_count
+                updates = _learn_step(agent, transition, n_steps, args, total_steps=12)
+                if replay.call_count > calls:
+                    updates_at[n_steps] = (replay.call_count - calls, updates)
+        # 第 3 步只有 3 条经验, 不足一批, replay 被调用但不更新
+        self.assertEqual(updates_at, {3: (2, 0), 6: (2, 2), 9: (2, 2), 12: (2, 2)})
+        replay.assert_called_with(4, decay_epsilon=False)
+        self.assertAlmostEqual(agent.epsilon, agent.epsilon_decay ** 12)
+
+
+class PrioritizedReplayTests(SimpleTestCase):
+    def test_sum_tree_samples_in_proportion_to_priority(self):
+        """
+        求和树按优先级比例查找叶子, 更新后父节点的和保持一致
+        """
+        import numpy as np
+        from .rl_components.replay_buffer import SumTree
+
+        tree = SumTree(5)
+        tree.update(np.arange(5), [1.0, 0.0, 3.0, 0.5, 0.5])
+        self.assertEqual(tree.total, 5.0)
+        self.assertEqual(tree.find([0.0, 0.99, 1.0, 3.99, 4.0, 4.5, 4.99]).tolist(), [0, 0, 2, 2, 3, 4, 4])
+        tree.update([2], [1.0])
+        self.assertEqual(tree.total, 3.0)
+        self.assertEqual(tree.find([2.4, 2.5]).tolist(), [3, 4])
+
+    def test_high_td_error_transitions_are_sampled_more_often(self):
+        """
+        TD 误差大的经验被抽中的次数更多, 重要性采样权重相应更小, 保存再加载后优先级不变
+        """
+        import tempfile
+        import numpy as np
+        from .rl_components.replay_buffer import PrioritizedReplayBuffer
+
+        np.random.seed(0)
+        buffer = PrioritizedReplayBuffer(capacity=100, alpha=1.0, beta=1.0)
+        for i in range(100):
+            buffer.add(np.zeros(2, dtype=np.float32), i, 0.0, np.zeros(2, dtype=np.float32), True)
+        buffer.update_priorities(np.arange(100), np.where(np.arange(100) == 7, 99.0, 1.0))
+        *_, indices, weights = buffer.sample(1000)
+        self.assertGreater((indices == 7).mean(), 0.4)
+        self.assertLess(weights[indices == 7].max(), weights[indices != 7].min())
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'replay.npz'
+            buffer.save(path)
+            restored = PrioritizedReplayBuffer(capacity=100, alpha=1.0).load(path)
+        np.testing.assert_allclose(restored.sum_tree.priorities(np.arange(100)), buffer.sum_tree.priorities(np.arange(100)))
+
+class RolloutPoolTests(SimpleTestCase):
+    def test_parallel_rollouts_are_reproducible(self):
+        """
+        采样进程写回的经验与标量环境一致, 相同种子下两次采样结果相同
+        """
+        import numpy as np
+        import torch
+        from .rl_components.actors import RolloutPool
+        from .rl_components.agent import DQNAgent
+        from .rl_components.environment import create_environment
+
+        with open(DATA_DIR / 'hospitals.json', 'r', encoding='utf-8') as f:
+            hospitals = json.load(f)
+        orders = load_orders(limit=40)
+        env = create_environment(hospitals)
+        torch.manual_seed(0)
+        agent = DQNAgent(env.state_space.state_dimensions, env.action_space.action_size)
+
+        runs = []
+        for _ in range(2):
+            with RolloutPool(2, agent, hospitals, orders, per_worker=16, seed=7) as pool:
+                pool.submit(0, list(range(30)), epsilon=0.5)
+                pool.submit(1, list(range(30, 40)), epsilon=0.5)
+                runs.append(pool.collect(0) + pool.collect(1))
+        self.assertEqual(len(runs[0]), 40)
+        self.assertEqual([t[1] for t in runs[0]], [t[1] for t in runs[1]])
+        self.assertGreater(len({t[1] for t in runs[0]}), 1)
+        for order, (state, action, reward, next_state, done) in zip(orders, runs[0]):
+            np.testing.assert_array_equal(state, np.float32(env.reset(order, order['items'])))
+            _, expected_reward, _, _ = env.step(action)
+            self.assertEqual(reward, expected_reward)
+
+class OfflineEvaluationTests(SimpleTestCase):
+    def test_baselines_match_scalar_environment(self):
+        """
+        离线评估的汇总奖励与逐单调用标量环境一致, 重复评估结果相同
+        """
+        import numpy as np
+        from .rl_components.environment import create_environment
+        from .rl_components.evaluate import PolicyEvaluator, evaluate_pool
+
+        with open(DATA_DIR / 'hospitals.json', 'r', encoding='utf-8') as f:
+            hospitals = json.load(f)
+        orders = load_orders(limit=120)
+        policies = ['nearest', 'nearest_sufficient', 'random']
+        metrics = evaluate_pool(orders, hospitals, policies, workers=1, batch_size=32)
+        self.assertEqual(metrics, evaluate_pool(orders, hospitals, policies, workers=1, batch_size=32))
+
+        env = create_environment(hospitals)
+        evaluator = PolicyEvaluator(hospitals, policies)
+        for policy in policies:
+            rewards = []
+            for b, start in enumerate(range(0, len(orders), 32)):
+                batch = orders[start:start + 32]
+                for order, action in zip(batch, evaluator.actions(policy, batch, None, b)):
+                    env.reset(order, order['items'])
+                    rewards.append(env.step(int(action))[1])
+            self.assertAlmostEqual(metrics[policy]['avg_reward'], float(np.mean(rewards)), places=9)
+        self.assertEqual(metrics['nearest']['split_rate'], 0.0)
+        self.assertGreater(metrics['nearest_sufficient']['success_rate'], metrics['nearest']['success_rate'])
+
+@override_settings(ROUTE_LIVE_INVENTORY=False, ROUTE_MODEL_WATCH_INTERVAL=0)
+class ModelReloadTests(SimpleTestCase):
+    def test_reload_validates_before_swap(self):
+        """
+        内容变化才重新加载; 损坏或输出 NaN 的检查点被拒绝, 继续使用旧网络
+        """
+        import tempfile
+        import torch
+        from .model_reloader import ModelReloader
+        from .routing_service import RoutingService
+        from .rl_model_loader import DEFAULT_MODEL_PATH
+
+        checkpoint = torch.load(DEFAULT_MODEL_PATH, map_location=torch.device('cpu'))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'checkpoint.pth'
+            torch.save(checkpoint, path)
+            with override_settings(ROUTE_MODEL_PATH=str(path)):
+                service = RoutingService()
+                order = load_orders(limit=1)[0]
+                before = service.decide(order)
+                network = service._agent.q_network
+
+                # 内容没有变化
+                path.touch()
+                self.assertFalse(service._model_reloader.check())
+                self.assertIs(service._agent.q_network, network)
+
+                # 损坏的文件
+                path.write_bytes(b'not a checkpoint')
+                self.assertFalse(service._model_reloader.check())
+                self.assertIs(service._agent.q_network, network)
+
+                # 输出 NaN 的权重
+                broken = {k: v.clone() for k, v in checkpoint['q_state_dict'].items()}
+                broken['fc3.bias'][:] = float('nan')
+                torch.save({**checkpoint, 'q_state_dict': broken}, path)
+                self.assertFalse(service.reload_model())
+                self.assertIs(service._agent.q_network, network)
+                self.assertEqual(service.stats()['model']['failures'], 2)
+
+                # 有效的新检查点(权重相同, 内容不同)
+                torch.save({**checkpoint, 'note': 'retrained'}, path)
+                self.assertTrue(service._model_reloader.check())
+                self.assertIsNot(service._agent.q_network, network)
+                model = service.stats()['model']
+                self.assertEqual(model['version'], 2)
+                self.assertIsNone(model['last_error'])
+                self.assertEqual(service.decide(order).action_index, before.action_index)
+
+                # 管理员触发的重载: 本进程只加载一次, 其他进程(另一个 ModelReloader)收到令牌后重载
+                other = ModelReloader(service, str(path))
+                self.assertTrue(service.reload_model(force=True, broadcast=True))
+                self.assertFalse(service._model_reloader.check())
+                self.assertEqual(service.stats()['model']['version'], 3)
+                self.assertTrue(other.check())
+
+@override_settings(ROUTE_LIVE_INVENTORY=False, ROUTE_MODEL_WATCH_INTERVAL=0, ROUTE_BATCHING_ENABLED=False)
+class ShadowModeTests(SimpleTestCase):
+    def test_candidate_divergence_is_logged(self):
+        """
+        候选模型总是选择等待补货: 与主模型动作不同的状态都被记录, 主模型的决策不受影响
+        """
+        import io
+        import tempfile
+        import torch
+        from django.core.management import call_command
+        from .routing_service import RoutingService
+        from .rl_model_loader import DEFAULT_MODEL_PATH
+        from .shadow_mode import divergence_report
+
+        checkpoint = torch.load(DEFAULT_MODEL_PATH, map_location=torch.device('cpu'))
+        weights = {k: v.clone() for k, v in checkpoint['q_state_dict'].items()}
+        orders = load_orders(limit=40)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'candidate.pth'
+            log_path = Path(tmp) / 'shadow.jsonl'
+            service = RoutingService()
+            with override_settings(ROUTE_SHADOW_MODEL_PATH=None):
+                expected = [d.action_index for d in service.decide_many(orders)]
+            num_hospitals = service._env.action_space.num_hospitals
+            weights['fc3.bias'][num_hospitals] = 1e6
+            torch.save({'q_state_dict': weights}, path)
+
+            with override_settings(ROUTE_SHADOW_MODEL_PATH=str(path), ROUTE_SHADOW_LOG_PATH=str(log_path)):
+                self.assertTrue(service.start_shadow(str(path)))
+                self.assertEqual([d.action_index for d in service.decide_many(orders)], expected)
+                service._shadow.drain()
+                stats = service.stats()['shadow']
+                diverged = sum(action != num_hospitals for action in expected)
+                self.assertEqual(stats['compared'], len(orders))
+                self.assertEqual(stats['diverged'], diverged)
+                self.assertEqual(stats['dropped'], 0)
+                self.assertTrue(all('state' not in r and 'primary_q_values' not in r for r in service._shadow._recent))
+
+                report = divergence_report(log_path)
+                self.assertEqual(report['divergences'], diverged)
+                self.assertTrue(all(kind.endswith('->wait_for_restock') for kind in report['kind_pairs']))
+                self.assertGreater(report['mean_candidate_q_gap'], 0)
+                out = io.StringIO()
+                call_command('shadow_report', '--json', stdout=out)
+                self.assertEqual(json.loads(out.getvalue())['log']['divergences'], diverged)
+            service.stop_shadow()
+
+    def test_numpy_candidate_does_not_import_torch(self):
+        """
+        主模型使用 numpy 格式时, 候选模型也使用 numpy 格式, web 进程不导入 torch
+        """
+        import os
+        import subprocess
+        import sys
+
+        code = (
+            "import sys, django; django.setup();"
+            "from route_app.routing_service import RoutingService;"
+            "from route_app.rl_model_loader import DEFAULT_MODEL_PATH;"
+            "s = RoutingService(); s.warm_up(); print(s.start_shadow(str(DEFAULT_MODEL_PATH)));"
+            "print(s.stats()['shadow']['format'], 'torch' in sys.modules)"
+        )
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'plane_in_medical.settings'))
+        out = subprocess.run([sys.executable, '-c', code], cwd=Path(__file__).resolve().parent.parent,
+                             env=env, capture_output=True, text=True, check=True).stdout.splitlines()
+        self.assertEqual(out[-2:], ['True', 'numpy False'])
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        import numpy as np
+        import tempfile
+        import torch
+        from .rl_model_loader import DEFAULT_MODEL_PATH
+        from .shadow_mode import ShadowEvaluator
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'candidate.pth'
+            torch.save(torch.load(DEFAULT_MODEL_PATH, map_location=torch.device('cpu')), path)
+            # 开启影子评估不改变进程的 torch 线程数
+            threads = torch.get_num_threads()
+            shadow = ShadowEvaluator(path, 36, 73, 70, queue_size=4)
+            self.assertEqual(torch.get_num_threads(), threads)
+            states = np.random.default_rng(0).random((500, 36), dtype=np.float32)
+            shadow.submit(states, np.zeros((500, 73), dtype=np.float32))
+            shadow.drain()
+            stats = shadow.stats()
+            self.assertEqual(stats['compared'] + stats['dropped'], 500)
+            self.assertGreater(stats['dropped'], 0)
+            shadow.close()
+
+class ModelExportTests(SimpleTestCase):
+    def test_exported_formats_match_eager_argmax(self):
+        """
+        TorchScript 导出与 eager 贪婪动作一致并被加载器使用; 一致率不达标的 int8 不会导出, 加载器退回 eager
+        """
+        import tempfile
+        import torch
+        from .rl_components.agent import DQN
+        from .rl_components.export import argmax_agreement, export_model, exported_path, load_eager
+        from .rl_components.vec_environment import VecDroneDeliveryEnvironment
+        from .rl_model_loader import DEFAULT_MODEL_PATH, load_q_network
+
+        with open(DATA_DIR / 'hospitals.json', 'r', encoding='utf-8') as f:
+            env = VecDroneDeliveryEnvironment(json.load(f))
+        states = env.reset(load_orders(limit=300))
+        with tempfile.TemporaryDirectory() as tmp:
+            checkpoint = Path(tmp) / 'checkpoint.pth'
+            checkpoint.write_bytes(DEFAULT_MODEL_PATH.read_bytes())
+            eager = load_eager(checkpoint, 36, 73)
+
+            path = export_model(checkpoint, 'script', 36, 73, validation_states=states)
+            self.assertEqual(path, exported_path(checkpoint, 'script'))
+            network = load_q_network(checkpoint, 36, 73, 'script')
+            self.assertIsInstance(network, torch.jit.ScriptModule)
+            self.assertEqual(argmax_agreement(network, eager, states), 1.0)
+
+            with self.assertRaises(ValueError):
+                export_model(checkpoint, 'int8', 36, 73, validation_states=states)
+            self.assertFalse(exported_path(checkpoint, 'int8').exists())
+            self.assertIsInstance(load_q_network(checkpoint, 36, 73, 'int8'), DQN)
+
+class SpatialIndexTests(SimpleTestCase):
+    def test_queries_match_linear_scan(self):
+        """
+        k 近邻与"最近且满足条件"查询的结果与线性扫描一致(距离相同取行号小的)
+        """
+        import random
+        from .rl_components.hospital_arrays import HospitalArrays
+
+        rng = random.Random(0)
+        hospitals = []
+        for i in range(400):
+            if i % 40 == 0 and hospitals:
+                # 重复坐标, 检查并列时的顺序
+                lat, lon = hospitals[-1]['latitude'], hospitals[-1]['longitude']
+            else:
+                lat, lon = rng.uniform(31.7, 39.6), rng.uniform(105.5, 111.2)
+            hospitals.append({'id': i, 'latitude': lat, 'longitude': lon, 'inventory': {}})
+        arrays = HospitalArrays(hospitals)
+        index = arrays.spatial_index
+        for _ in range(50):
+            lat, lon = rng.uniform(31.7, 39.6), rng.uniform(105.5, 111.2)
+            distances = arrays.exact_distances(lat, lon, range(len(arrays)))
+            expected = sorted(range(len(arrays)), key=lambda row: distances[row])
+            self.assertEqual(
+                [distances[row] for row in index.nearest(lat, lon, 10)],
+                [distances[row] for row in expected[:10]],
+            )
+            allowed = set(rng.sample(range(len(arrays)), 20))
+            best = min(allowed, key=lambda row: (distances[row], row))
+            self.assertEqual(
+                index.nearest_where(lat, lon, allowed.__contains__, lambda row: distances[row]),
+                (best, distances[best]),
+            )
+
+    def test_indexed_state_matches_legacy_builder(self):
+        """
+        通过空间索引选出前 5 名医院时, 状态向量与逐医院计算的结果逐位一致
+        """
+        from unittest import mock
+        from .rl_components import states
+        from .rl_components.hospital_arrays import HospitalArrays
+
+        with open(DATA_DIR / 'hospitals.json', 'r', encoding='utf-8') as f:
+            hospitals = json.load(f)
+        arrays = HospitalArrays(hospitals)
+        with mock.patch.object(states, 'SPATIAL_INDEX_MIN_HOSPITALS', 1):
+            for order in load_orders(limit=300):
+                expected = states.state_space.build_state_vector(order, hospitals, order['items'])
+                actual = states.state_space.build_state_vector(order, arrays, order['items'])
+                self.assertEqual(actual, expected)
+
+
+class HospitalSyncTests(TestCase):
+    def test_admin_changes_reach_spatial_index(self):
+        """
+        新增、删除医院后, 决策服务的最近医院查询立即反映变化
+        """
+        from .models import Hospital
+        from .routing_service import routing_service
+
+        routing_service.warm_up()
+        # 远离西安市区的新站点, 附近没有其他医院
+        hospital = Hospital.objects.create(name='测试配送站', latitude=33.07, longitude=107.03)
+        nearest, distance = routing_service.nearest_hospitals(33.07, 107.03, k=1)[0]
+        self.assertEqual(nearest['name'], '测试配送站')
+        self.assertAlmostEqual(distance, 0.0)
+
+        hospital.delete()
+        nearest, _ = routing_service.nearest_hospitals(33.07, 107.03, k=1)[0]
+        self.assertNotEqual(nearest['name'], '测试配送站')
+
+
+class DistanceCacheTests(SimpleTestCase):
+    def test_cache_hits_and_matches_math_distance(self):
+        """
+        缓存的距离与 math 版 Haversine 逐位一致, 重复位置命中缓存, 超出容量时淘汰最久未用的位置
+        """
+        from .rl_components.hospital_arrays import HospitalArrays
+        from .rl_components.states import state_space
+
+        with open(DATA_DIR / 'hospitals.json', 'r', encoding='utf-8') as f:
+            hospitals = json.load(f)
+        arrays = HospitalArrays(hospitals, distance_cache_size=2)
+        cache = arrays.distance_cache
+        orders = load_orders(limit=3)
+        for order in orders:
+            distances = cache.distances(order['latitude'], order['longitude'])
+            expected = [
+                state_space._calculate_distance(order['latitude'], order['longitude'], h['latitude'], h['longitude'])
+                for h in hospitals
+            ]
+            self.assertEqual(distances.tolist(), expected)
+        cache.distances(orders[-1]['latitude'], orders[-1]['longitude'])
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(len(cache), 2)
+
+        uncached = HospitalArrays(hospitals, distance_cache_size=0)
+        self.assertIsNone(uncached.distance_cache)
+        for order in load_orders(limit=200):
+            self.assertEqual(
+                state_space.build_state_vector(order, arrays, order['items']),
+                state_space.build_state_vector(order, uncached, order['items']),
+            )
+
+
+class StockIndexTests(SimpleTestCase):
+    def test_sufficient_rows_match_scan_and_follow_updates(self):
+        """
+        倒排索引求出的满足整单的医院与逐医院扫描一致, 增量更新与库存增量层都会反映在查询结果中
+        """
+        from .rl_components.hospital_arrays import HospitalArrays
+        from .rl_components.inventory import InventoryOverlay
+
+        with open(DATA_DIR / 'hospitals.json', 'r', encoding='utf-8') as f:
+            hospitals = json.load(f)
+        arrays = HospitalArrays(hospitals)
+
+        def scan(inventory_of, needs):
+            return [
+                row for row in range(len(hospitals))
+                if all(inventory_of(row, key) >= qty for key, qty in needs)
+            ]
+
+        for order in load_orders(limit=100):
+            needs = [(item['name'], int(item['quantity'])) for item in order['items']]
+            self.assertEqual(
+                arrays.sufficient_rows(needs).tolist(),
+                scan(lambda row, key: hospitals[row]['inventory'].get(key, 0), needs),
+            )
+
+        name = next(iter(hospitals[5]['inventory']))
+        overlay = InventoryOverlay(arrays)
+        holders = arrays.rows_with_at_least(name, 1).tolist()
+        holder = holders[0]
+        missing = next(row for row in range(len(hospitals)) if row not in holders)
+        overlay.set(holder, name, 0)
+        overlay.set(missing, name, 1000)
+        rows = overlay.rows_with_at_least(name, 1).tolist()
+        self.assertNotIn(holder, rows)
+        self.assertIn(missing, rows)
+
+        index = arrays.stock_index
+        index.set_quantity(holder, name, 0)
+        self.assertNotIn(holder, index.rows_with_at_least(name, 1).tolist())
+        index.set_quantity(holder, name, 7)
+        self.assertEqual(index.rows_with_at_least(name, 7).tolist().count(holder), 1)
+        self.assertNotIn(holder, index.rows_with_at_least(name, 8).tolist())
+
+
+class LiveInventoryTests(TestCase):
+    def test_service_uses_database_stock_and_follows_changes(self):
+        """
+        决策服务从 HospitalInventory 加载库存, 之后库存的增删改通过 signals 增量同步
+        """
+        from shop_app.models import Medicine
+        from .models import Hospital, HospitalInventory
+        from .routing_service import routing_service
+
+        self.addCleanup(restore_routing_snapshot)
+
+        with open(DATA_DIR / 'hospitals.json', 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+        first = snapshot[0]
+        hospital = Hospital.objects.create(
+            name=first['name'], latitude=first['latitude'], longitude=first['longitude']
+        )
+        medicine = Medicine.objects.create(kind='测试', name='测试药品', image='', introduction='', price=1.0)
+        HospitalInventory.objects.create(hospital=hospital, medicine=medicine, quantity=3)
+
+        self.assertTrue(routing_service.reload_inventory())
+        items = [{'name': '测试药品', 'quantity': 2}]
+        found, _ = routing_service.nearest_sufficient_hospital(first['latitude'], first['longitude'], items)
+        self.assertEqual(found['name'], first['name'])
+        # 数据库中只有这一条库存记录, 快照中的库存不再生效
+        snapshot_item = [{'name': next(iter(first['inventory'])), 'quantity': 1}]
+        self.assertEqual(
+            routing_service.nearest_sufficient_hospital(first['latitude'], first['longitude'], snapshot_item),
+            (None, None),
+        )
+
+        version = routing_service.inventory_version
+        stock = HospitalInventory.objects.get(hospital=hospital, medicine=medicine)
+        # 库存在事务提交后才同步到服务
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.quantity = 1
+            stock.save()
+        self.assertGreater(routing_service.inventory_version, version)
+        self.assertEqual(
+            routing_service.nearest_sufficient_hospital(first['latitude'], first['longitude'], items),
+            (None, None),
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.quantity = 5
+            stock.save()
+        found, _ = routing_service.nearest_sufficient_hospital(first['latitude'], first['longitude'], items)
+        self.assertEqual(found['name'], first['name'])
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.delete()
+        self.assertEqual(
+            routing_service.nearest_sufficient_hospital(first['latitude'], first['longitude'], items),
+            (None, None),
+        )
+
+
+    @override_settings(ROUTE_MODEL_WATCH_INTERVAL=0)
+    def test_other_service_instance_sees_committed_changes(self):
+        """
+        另一个进程(这里用第二个服务实例模拟)写入的库存, 在下一次决策前通过共享的库存水位号同步过来
+        """
+        from django.core.cache import cache
+        from shop_app.models import Medicine
+        from . import inventory_sync
+        from .models import Hospital, HospitalInventory
+        from .reservations import release_reservations, reserve_stock
+        from .routing_service import RoutingService, routing_service
+
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.addCleanup(restore_routing_snapshot)
+        with open(DATA_DIR / 'hospitals.json', 'r', encoding='utf-8') as f:
+            first = json.load(f)[0]
+        hospital = Hospital.objects.create(
+            name=first['name'], latitude=first['latitude'], longitude=first['longitude']
+        )
+        medicine = Medicine.objects.create(kind='测试', name='测试药品', image='', introduction='', price=1.0)
+        stock = HospitalInventory.objects.create(hospital=hospital, medicine=medicine, quantity=3)
+
+        # reader 代表另一个 web 进程: signals 和库存预留只会更新本进程的 routing_service
+        reader = RoutingService()
+        self.addCleanup(reader.stop_shadow)
+        order = {'latitude': first['latitude'], 'longitude': first['longitude'],
+                 'items': [{'name': '测试药品', 'quantity': 2}]}
+
+        def reader_finds():
+            reader.decide(order)
+            found, _ = reader.nearest_sufficient_hospital(order['latitude'], order['longitude'], order['items'])
+            return found is not None and found['name'] == first['name']
+
+        self.assertTrue(reader_finds())
+        routing_service.reload_inventory()
+        # 后台编辑
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.quantity = 1
+            stock.save()
+        self.assertFalse(reader_finds())
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.quantity = 4
+            stock.save()
+        self.assertTrue(reader_finds())
+        # 库存预留和释放用批量 UPDATE, 不经过 signals
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(reserve_stock('SYNC-1', first['name'], order['items']))
+            self.assertTrue(reserve_stock('SYNC-2', first['name'], order['items']))
+        self.assertFalse(reader_finds())
+        with self.captureOnCommitCallbacks(execute=True):
+            release_reservations(['SYNC-1'])
+        self.assertTrue(reader_finds())
+
+        # 变化记录被缓存淘汰时整体重新加载
+        with self.captureOnCommitCallbacks(execute=True):
+            stock.quantity = 0
+            stock.save()
+        cache.delete(inventory_sync.CHANGE_KEY.format(inventory_sync.current_watermark()))
+        self.assertFalse(reader_finds())
+        self.assertEqual(reader.stats()['inventory_watermark'], inventory_sync.current_watermark())
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        from shop_app.models import Medicine
+        from .models import Hospital, HospitalInventory
+
+        self.addCleanup(restore_routing_snapshot)
+        self.hospital = Hospital.objects.create(name='预留测试站', latitude=34.3, longitude=108.9)
+        self.medicines = [
+            Medicine.objects.create(kind='测试', name=name, image='', introduction='', price=1.0)
+            for name in ('预留药品A', '预留药品B')
+        ]
+        for medicine in self.medicines:
+            HospitalInventory.objects.create(hospital=self.hospital, medicine=medicine, quantity=5)
+
+    def stock(self):
+        from .models import HospitalInventory
+        return list(
+            HospitalInventory.objects.filter(hospital=self.hospital).order_by('medicine_id').values_list('quantity', flat=True)
+        )
+
+    def test_reserve_is_all_or_nothing_and_idempotent(self):
+        from .reservations import reserve_stock
+
+        items = [{'name': '预留药品A', 'quantity': 2}, {'name': '预留药品B', 'quantity': 3}]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(reserve_stock('order-1', '预留测试站', items))
+        self.assertEqual(self.stock(), [3, 2])
+        # 同一订单重复请求不会重复扣减
+        self.assertTrue(reserve_stock('order-1', '预留测试站', items))
+        self.assertEqual(self.stock(), [3, 2])
+        # 任一药品不足时整单不扣减
+        short = [{'name': '预留药品A', 'quantity': 1}, {'name': '预留药品B', 'quantity': 3}]
+        self.assertFalse(reserve_stock('order-2', '预留测试站', short))
+        self.assertEqual(self.stock(), [3, 2])
+
+    def test_release_on_delete_and_expiry(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import StockReservation
+        from .reservations import (
+            consume_reservations, release_expired_reservations, release_reservations, reserve_stock,
+        )
+
+        reserve_stock('order-1', '预留测试站', [{'name': '预留药品A', 'quantity': 2}])
+        reserve_stock('order-2', '预留测试站', [{'name': '预留药品A', 'quantity': 1}])
+        reserve_stock('order-3', '预留测试站', [{'name': '预留药品B', 'quantity': 4}])
+        self.assertEqual(self.stock(), [2, 1])
+
+        self.assertEqual(release_reservations('order-1'), 1)
+        self.assertEqual(self.stock(), [4, 1])
+        # 已出库的预留不会超时释放
+        consume_reservations('order-3')
+        later = timezone.now() + timedelta(days=1)
+        self.assertEqual(release_expired_reservations(now=later), 1)
+        self.assertEqual(self.stock(), [5, 1])
+        self.assertEqual(list(StockReservation.objects.values_list('order_id', flat=True)), ['order-3'])
+
+    def test_expiry_sends_order_back_to_dispatch(self):
+        """
+        预留超时释放后订单的配送路径一并删除, 订单回到派单队列, 之后重新预留才能出库
+        """
+        from datetime import timedelta
+        from django.utils import timezone
+        from pay_app.models import Order
+        from .dispatcher import pending_orders
+        from .models import RouteAssignment, StockReservation
+        from .reservations import consume_reservations, release_expired_reservations, reserve_stock
+
+        items = [{'name': '预留药品A', 'quantity': 2}]
+        order = Order.objects.create(
+            order_id='order-ttl', name='测试', phone='1', address='', province='', city='', district='',
+            paymentMethod='', latitude=34.31, longitude=108.91, items=items, order_time=timezone.now(),
+        )
+        RouteAssignment.objects.create(order=order, action_index=0, action='select_hospital', hospital_name='预留测试站')
+        self.assertTrue(reserve_stock('order-ttl', '预留测试站', items))
+        self.assertFalse(pending_orders().exists())
+
+        self.assertEqual(release_expired_reservations(now=timezone.now() + timedelta(days=1)), 1)
+        self.assertEqual(self.stock(), [5, 5])
+        self.assertFalse(RouteAssignment.objects.filter(order=order).exists())
+        self.assertEqual(list(pending_orders()), [order])
+        self.assertEqual(consume_reservations('order-ttl'), 0)
+
+        self.assertTrue(reserve_stock('order-ttl', '预留测试站', items))
+        self.assertEqual(consume_reservations('order-ttl'), 1)
+        self.assertEqual(StockReservation.objects.get(order_id='order-ttl').status, StockReservation.STATUS_CONSUMED)
+
+    def test_bulk_reserve_is_all_or_nothing_per_order(self):
+        from .reservations import reserve_stock_bulk
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reserved = reserve_stock_bulk([
+                ('order-1', '预留测试站', [{'name': '预留药品A', 'quantity': 3}]),
+                # 药品 A 只剩 2, 整单跳过, 药品 B 不扣减
+                ('order-2', '预留测试站', [{'name': '预留药品A', 'quantity': 3}, {'name': '预留药品B', 'quantity': 1}]),
+                ('order-3', '预留测试站', [{'name': '预留药品A', 'quantity': 2}, {'name': '预留药品B', 'quantity': 5}]),
+                ('order-4', '不存在的站点', [{'name': '预留药品A', 'quantity': 1}]),
+            ])
+        self.assertEqual(reserved, {'order-1', 'order-3'})
+        self.assertEqual(self.stock(), [0, 0])
+        # 已预留的订单再次提交仍算成功且不重复扣减
+        self.assertEqual(reserve_stock_bulk([('order-1', '预留测试站', [{'name': '预留药品A', 'quantity': 3}])]), {'order-1'})
+        self.assertEqual(self.stock(), [0, 0])
+
+
+@override_settings(ROUTE_LIVE_INVENTORY=False)
+class DecisionCacheTests(SimpleTestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_cached_decision_invalidated_by_stock_change(self):
+        """
+        同一位置同一购物篮的第二次决策命中缓存(只有一次 get_many);
+        只有购物篮中药品的库存、或前 5 家医院的库存总量变化后才重新计算
+        """
+        import warnings
+        from unittest import mock
+        from django.core.cache import cache
+        from . import decision_cache
+        from .routing_service import build_user_request, routing_service
+
+        order = load_orders(limit=1)[0]
+        # 购物篮顺序不同也是同一个缓存键
+        reordered = dict(order, items=list(reversed(order['items'])))
+        user_request = build_user_request(order)
+        self.assertEqual(
+            decision_cache.decision_key(user_request),
+            decision_cache.decision_key(build_user_request(reordered)),
+        )
+        routing_service.warm_up()
+        top_totals = {}
+        routing_service._decide(user_request, top_totals)
+        basket = {item['name'] for item in order['items']}
+        hospitals = routing_service._catalog[0]
+        unrelated = next(h for h in hospitals if h['name'] not in top_totals and set(h['inventory']) - basket)
+        related = next(h for h in hospitals if h['name'] in top_totals and set(h['inventory']) - basket)
+
+        def restock(hospital, in_basket, delta=0):
+            name = next(m for m in hospital['inventory'] if (m in basket) == in_basket)
+            quantity = hospital['inventory'][name]
+            routing_service.set_stock(hospital['name'], name, quantity + delta)
+            if delta:
+                self.addCleanup(routing_service.set_stock, hospital['name'], name, quantity)
+
+        with warnings.catch_warnings(record=True) as caught, \
+                mock.patch.object(routing_service, '_decide', wraps=routing_service._decide) as decide:
+            warnings.simplefilter('always')
+            first = routing_service.decide(order)
+            with mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many, \
+                    mock.patch.object(cache, 'get', wraps=cache.get) as get:
+                second = routing_service.decide(reordered)
+            self.assertEqual(decide.call_count, 1)
+            self.assertEqual(first, second)
+            self.assertEqual(get_many.call_count, 1)
+            # 本地内存缓存的 get_many 逐个调用 get, 除此之外没有单独的读取
+            self.assertEqual(get.call_count, len(get_many.call_args[0][0]))
+            # 缓存中只有动作和医院名称, 不保存医院的库存
+            cached = cache.get(decision_cache.decision_key(user_request))['decision']
+            self.assertEqual(set(cached), {'action_index', 'action', 'hospital'})
+            self.assertNotIsInstance(cached['hospital'], dict)
+
+            # 状态向量之外的医院的其他药品
+            restock(unrelated, in_basket=False, delta=1)
+            self.assertEqual(routing_service.decide(order), first)
+            self.assertEqual(decide.call_count, 1)
+            # 前 5 家医院的其他药品, 数量不变时库存总量不变
+            restock(related, in_basket=False)
+            self.assertEqual(routing_service.decide(order), first)
+            self.assertEqual(decide.call_count, 1)
+            # 前 5 家医院的库存总量
+            restock(related, in_basket=False, delta=1)
+            routing_service.decide(order)
+            self.assertEqual(decide.call_count, 2)
+            # 购物篮中的药品在任意医院的库存
+            restock(next(h for h in hospitals if set(h['inventory']) & basket), in_basket=True)
+            routing_service.decide(order)
+            self.assertEqual(decide.call_count, 3)
+            routing_service.decide(order)
+            self.assertEqual(decide.call_count, 3)
+        # 医院和药品名称(含空格和中文)经过哈希, 不产生 CacheKeyWarning
+        from django.core.cache.backends.base import CacheKeyWarning
+
+        self.assertFalse([w for w in caught if issubclass(w.category, CacheKeyWarning)])
+
+    def test_decision_computed_from_stale_stock_not_cached(self):
+        """
+        计算期间有库存变化发布(本进程的库存可能落后), 算出的决策不写入缓存
+        """
+        from unittest import mock
+        from .routing_service import routing_service
+
+        order = load_orders(limit=1)[0]
+        routing_service.warm_up()
+        hospital = routing_service._catalog[0][0]
+        medicine, quantity = next(iter(hospital['inventory'].items()))
+        decide_once = routing_service._decide
+
+        def decide_while_stock_changes(*args, **kwargs):
+            decision = decide_once(*args, **kwargs)
+            routing_service.set_stock(hospital['name'], medicine, quantity)
+            return decision
+
+        with mock.patch.object(routing_service, '_decide', side_effect=decide_while_stock_changes) as decide:
+            routing_service.decide(order)
+            routing_service.decide(order)
+            self.assertEqual(decide.call_count, 2)
+
+
+@override_settings(ROUTE_LIVE_INVENTORY=False, ROUTE_RESERVATIONS_ENABLED=False)
+class RouteAssignmentTests(TestCase):
+    def test_assignment_saved_once_and_replanned_on_request(self):
+        """
+        配送路径只决策一次, 之后一次查询只读返回; 重新规划覆盖原记录
+        """
+        from unittest import mock
+        from django.utils import timezone
+        from pay_app.models import Order
+        from .assignments import assign_route, decision_from_assignment, replan_route
+        from .routing_service import routing_service
+
+        data = load_orders(limit=1)[0]
+        Order.objects.create(
+            order_id='route-1', name='测试', phone='1', address='', province='', city='', district='',
+            paymentMethod='', latitude=data['latitude'], longitude=data['longitude'], items=data['items'],
+            order_time=timezone.now(),
+        )
+        with mock.patch.object(routing_service, 'decide', wraps=routing_service.decide) as decide:
+            assignment = assign_route(Order.objects.get(order_id='route-1'))
+            expected = routing_service.decide(data)
+            self.assertEqual(decision_from_assignment(assignment).action_index, expected.action_index)
+
+            with self.assertNumQueries(1):
+                order = Order.objects.select_related('route_assignment').get(order_id='route-1')
+                self.assertEqual(assign_route(order).pk, assignment.pk)
+            self.assertEqual(decide.call_count, 2)
+
+            replanned = replan_route(order)
+            self.assertEqual(decide.call_count, 3)
+        self.assertEqual(replanned.pk, assignment.pk)
+        self.assertEqual(replanned.replans, 1)
+        self.assertEqual(replanned.action_index, expected.action_index)
+
+
+    def test_route_pages_only_read_saved_assignment(self):
+        """
+        跟踪页面没有已保存的路径时显示正在规划, 不做决策也不写入路径
+        """
+        from unittest import mock
+        from django.contrib.auth import get_user_model
+        from django.utils import timezone
+        from pay_app.models import Order
+        from .assignments import assign_route
+        from .models import RouteAssignment
+        from .routing_service import routing_service
+
+        data = load_orders(limit=1)[0]
+        order = Order.objects.create(
+            order_id='route-view', name='测试', phone='1', address='', province='', city='', district='',
+            paymentMethod='', latitude=data['latitude'], longitude=data['longitude'], items=data['items'],
+            order_time=timezone.now(),
+        )
+        self.client.force_login(get_user_model().objects.create_user(username='route', password='pw'))
+        with mock.patch.object(routing_service, 'decide', wraps=routing_service.decide) as decide:
+            for url in ('/route/', '/check_order/'):
+                response = self.client.get(url, {'order_id': 'route-view'})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.context['message'], '配送路径正在规划, 请稍后刷新')
+            self.assertEqual(decide.call_count, 0)
+        self.assertFalse(RouteAssignment.objects.filter(order=order).exists())
+
+        assign_route(order)
+        with mock.patch.object(routing_service, 'decide') as decide:
+            response = self.client.get('/route/', {'order_id': 'route-view'})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response.context.get('message'), '配送路径正在规划, 请稍后刷新')
+            decide.assert_not_called()
+
+    @override_settings(ROUTE_RESERVATIONS_ENABLED=True)
+    def test_failed_reservation_redecides_instead_of_saving(self):
+        """
+        选中的医院最后的库存被其他订单先预留: 不保存指向它的路径, 按更新后的库存重新决策;
+        重试用完仍然失败时不保存路径, 订单留在派单队列中
+        """
+        from unittest import mock
+        from django.utils import timezone
+        from pay_app.models import Order
+        from shop_app.models import Medicine
+        from .assignments import assign_route
+        from .dispatcher import pending_orders
+        from .models import Hospital, HospitalInventory, RouteAssignment, StockReservation
+        from .reservations import reserve_stock
+        from .routing_service import Decision, routing_service
+
+        self.addCleanup(restore_routing_snapshot)
+        station = Hospital.objects.create(name='争抢测试站', latitude=34.3, longitude=108.9)
+        medicine = Medicine.objects.create(kind='测试', name='争抢药品', image='', introduction='', price=1.0)
+        HospitalInventory.objects.create(hospital=station, medicine=medicine, quantity=2)
+        items = [{'name': '争抢药品', 'quantity': 2}]
+        order = Order.objects.create(
+            order_id='route-last', name='测试', phone='1', address='', province='', city='', district='',
+            paymentMethod='', latitude=34.31, longitude=108.91, items=items, order_time=timezone.now(),
+        )
+        # 另一个订单先取走了最后的库存
+        self.assertTrue(reserve_stock('route-other', '争抢测试站', items))
+
+        select = Decision(action_index=0, action='select_hospital',
+                          hospital={'name': '争抢测试站', 'latitude': 34.3, 'longitude': 108.9})
+        wait = Decision(action_index=70, action='wait_for_restock')
+        with mock.patch.object(routing_service, 'decide', side_effect=[select, wait]) as decide:
+            assignment = assign_route(order)
+        self.assertEqual(decide.call_count, 2)
+        self.assertEqual((assignment.action, assignment.hospital_name), ('wait_for_restock', ''))
+        self.assertFalse(StockReservation.objects.filter(order_id='route-last').exists())
+
+        RouteAssignment.objects.all().delete()
+        order = Order.objects.get(order_id='route-last')
+        with override_settings(ROUTE_RESERVATION_RETRIES=1), \
+                mock.patch.object(routing_service, 'decide', return_value=select) as decide:
+            self.assertIsNone(assign_route(order))
+        self.assertEqual(decide.call_count, 2)
+        self.assertFalse(RouteAssignment.objects.filter(order=order).exists())
+        self.assertIn(order, pending_orders())
+
+@override_settings(ROUTE_LIVE_INVENTORY=False, ROUTE_RESERVATIONS_ENABLED=False)
+class DispatcherTests(TestCase):
+    def test_dispatch_batches_match_single_decisions(self):
+        """
+        后台派单按批保存路径, 与逐单决策的结果一致, 并发布队列深度
+        """
+        from io import StringIO
+        from django.core.management import call_command
+        from django.utils import timezone
+        from pay_app.models import Order
+        from .dispatcher import OrderDispatcher, dispatch_stats
+        from .models import RouteAssignment
+        from .routing_service import routing_service
+
+        orders = load_orders(limit=5)
+        for i, data in enumerate(orders):
+            Order.objects.create(
+                order_id=f'dispatch-{i}', name='测试', phone='1', address='', province='', city='', district='',
+                paymentMethod='', latitude=data['latitude'], longitude=data['longitude'], items=data['items'],
+                order_time=timezone.now(),
+            )
+        stats = OrderDispatcher(batch_size=3).dispatch_batch()
+        self.assertEqual((stats['batch_size'], stats['queue_depth']), (3, 2))
+        self.assertEqual(dispatch_stats()['queue_depth'], 2)
+
+        call_command('dispatch_orders', '--once', '--batch-size=3', stdout=StringIO())
+        saved = dict(RouteAssignment.objects.values_list('order__order_id', 'action_index'))
+        self.assertEqual(saved, {
+            f'dispatch-{i}': routing_service.decide(data).action_index for i, data in enumerate(orders)
+        })
+
+    @override_settings(ROUTE_RESERVATIONS_ENABLED=True, ROUTE_RESERVATION_RETRIES=1)
+    def test_orders_competing_for_last_units_are_requeued(self):
+        """
+        同一批的两个订单选中同一家医院的最后几件库存: 先到的预留成功, 另一单重新决策,
+        仍然预留失败时删除它的路径放回队列, 不计入已派单
+        """
+        from unittest import mock
+        from django.utils import timezone
+        from pay_app.models import Order
+        from shop_app.models import Medicine
+        from .dispatcher import OrderDispatcher, pending_orders
+        from .models import Hospital, HospitalInventory, RouteAssignment, StockReservation
+        from .routing_service import Decision, routing_service
+
+        self.addCleanup(restore_routing_snapshot)
+        station = Hospital.objects.create(name='派单争抢站', latitude=34.3, longitude=108.9)
+        medicine = Medicine.objects.create(kind='测试', name='派单争抢药品', image='', introduction='', price=1.0)
+        HospitalInventory.objects.create(hospital=station, medicine=medicine, quantity=2)
+        items = [{'name': '派单争抢药品', 'quantity': 2}]
+        for order_id in ('compete-1', 'compete-2'):
+            Order.objects.create(
+                order_id=order_id, name='测试', phone='1', address='', province='', city='', district='',
+                paymentMethod='', latitude=34.31, longitude=108.91, items=items, order_time=timezone.now(),
+            )
+        select = Decision(action_index=0, action='select_hospital',
+                          hospital={'name': '派单争抢站', 'latitude': 34.3, 'longitude': 108.9})
+        wait = Decision(action_index=70, action='wait_for_restock')
+
+        dispatcher = OrderDispatcher(batch_size=2)
+        # 两单都选中派单争抢站, 重新决策时第二单仍然选它
+        with mock.patch.object(routing_service, 'decide_many', side_effect=[[select, select], [select]]):
+            stats = dispatcher.dispatch_batch()
+        self.assertEqual((stats['reserved'], stats['redecided'], stats['requeued']), (1, 1, 1))
+        self.assertEqual(dispatcher.totals['orders'], 1)
+        self.assertEqual(list(StockReservation.objects.values_list('order_id', flat=True)), ['compete-1'])
+        self.assertEqual(list(RouteAssignment.objects.values_list('order__order_id', flat=True)), ['compete-1'])
+        self.assertEqual([order.order_id for order in pending_orders()], ['compete-2'])
+
+        # 下一批按更新后的库存决策为等待补货
+        with mock.patch.object(routing_service, 'decide_many', return_value=[wait]):
+            stats = dispatcher.dispatch_batch()
+        self.assertEqual((stats['batch_size'], stats['requeued']), (1, 0))
+        self.assertEqual(RouteAssignment.objects.get(order__order_id='compete-2').action, 'wait_for_restock')
+        self.assertFalse(pending_orders().exists())
@@ -1,8 +1,11 @@
-from .views import get_route,check_order
+from .views import get_route,check_order,replan_route,reload_route_model,route_stats
 from django.urls import path
 
 urlpatterns = [
     
     path('route/', get_route,name='route'),
     path('check_order/', check_order,name='check_order'),
-]
\ No newline at end of file
+    path('replan_route/', replan_route,name='replan_route'),
+    path('reload_route_model/', reload_route_model,name='reload_route_model'),
+    path('route_stats/', route_stats,name='route_stats'),
+]
@@ -1,18 +1,48 @@
 import requests
 import json
+import threading
 from typing import Tuple, Optional
 import math
+from requests.adapters import HTTPAdapter
+
+# 进程内共享的 HTTP 会话: 复用到百度地图 API 的连接, 不再每次请求重新建立连接
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_shared_session(pool_size: int = 16) -> requests.Session:
+    """
+    返回进程内共享的连接池会话(线程安全的懒加载)
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
 class XiAnGeocoder:
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, base_url: str = None,
+                 session: requests.Session = None, timeout: float = 5):
         """
         初始化西安地理编码器
         
         Args:
             api_key: 百度地图API密钥，如果未提供则使用默认密钥
+            base_url: 地理编码接口地址，如果未提供则使用默认地址（测试时可指向本地桩服务）
+            session: HTTP 会话，如果未提供则使用进程内共享的连接池会话
+            timeout: 请求超时时间（秒）
         """
         # 默认使用的百度地图API密钥
-        self.api_key = "api_key"
-        self.base_url = "路径"
+        self.api_key = api_key or "api_key"
+        self.base_url = base_url or "路径"
+        self.session = session or get_shared_session()
+        self.timeout = timeout
         
     def get_coordinates(self, address: str) -> Optional[Tuple[float, float]]:
         """
@@ -36,7 +66,7 @@ class XiAnGeocoder:
         
         try:
             # 发送请求到百度地图API
-            response = requests.get(self.base_url, params=params, timeout=5)
+            response = self.session.get(self.base_url, params=params, timeout=self.timeout)
             response.raise_for_status()
             
             # 解析响应